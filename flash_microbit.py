@@ -6,11 +6,13 @@ This script automates the process of:
 1. Setting up a Python virtual environment
 2. Installing required dependencies
 3. Minifying Python code
-5. Flashing main.py to a connected micro:bit
-6. Copying Python files to the micro:bit file system    
+4. Optionally cross-compiling modules to .mpy bytecode (--mpy)
+5. Building the pose pack (poses.pk) from Parameters and checking its round trip
+6. Flashing main.py to a connected micro:bit
+7. Copying Python files and the pose pack to the micro:bit file system over one raw REPL session
 
 Usage:
-    python flash_microbit.py [--port PORT] [--list] [--no-flash]
+    python flash_microbit.py [--port PORT] [--list] [--mpy] [--hex] [--gamepad]
 """
 
 import os
@@ -20,6 +22,8 @@ import shutil
 import argparse
 import time
 
+from utils import bundler
+
 # Configuration
 VENV_DIR = ".venv"
 REQUIREMENTS = "requirements.txt"
@@ -27,6 +31,9 @@ SOURCE_DIR = "src"
 BUILD_DIR = "build"
 OUTPUT_HEX = "output"
 MICROBIT_VOLUME = "/Volumes/MICROBIT"  # Default for macOS, adjust for other OS
+BOOT_MODULE = "PuBot"  # Module imported by main.py, probed for boot time and heap
+GAMEPAD_ENTRY = "gamepad_main"  # Entry of the controller firmware, bundled with --gamepad
+GAMEPAD_FILES = ("Gamepad.py", GAMEPAD_ENTRY + ".py")  # Not copied to the robot
 
 def run_command(cmd, check=True):
     """Run a shell command and return its output."""
@@ -110,60 +117,113 @@ def minify_code(python_exec):
     return BUILD_DIR
 
 
-def merge_python_files(work_dir, src_dir):
-    """Merge all Python files from src directory into a single file."""
+def build_pack():
+    """Compile the pose tables of Parameters into BUILD_DIR/poses.pk, checking the round trip.
+
+    Returns:
+        str: Path of the pack
+
+    Raises:
+        SystemExit: If the tables do not survive the round trip
+    """
+    from utils import posepack  # installs the micro:bit stand-in the robot's reader runs on
+
+    fn = os.path.join(BUILD_DIR, posepack.PK_FILE)
+    try:
+        n = posepack.build(fn)
+    except posepack.PackError as e:
+        print(f"Pose pack check failed: {e}")
+        sys.exit(1)
+    print(f"Pose pack: {n} bytes, round trip matches")
+    return fn
+
+
+def compile_mpy(python_exec):
+    """Cross-compile minified modules in the build directory to .mpy bytecode.
+
+    Uses the mpy-cross version pinned in requirements.txt, which must match
+    the .mpy format of the micro:bit firmware. main.py is always flashed as
+    source. Modules that fail to compile keep their .py file.
+
+    Returns:
+        list[str]: Names of the modules compiled to .mpy
+    """
+    print("Compiling .mpy bytecode...")
+    compiled = []
+    total_py = total_mpy = 0
+    for file in sorted(os.listdir(BUILD_DIR)):
+        if not file.endswith('.py') or file == 'main.py':
+            continue
+        py_path = os.path.join(BUILD_DIR, file)
+        mpy_path = py_path[:-3] + '.mpy'
+        result = run_command(f"{python_exec} -m mpy_cross {py_path} -o {mpy_path}", check=False)
+        py_size = os.path.getsize(py_path)
+        if result and result.returncode == 0 and os.path.exists(mpy_path):
+            mpy_size = os.path.getsize(mpy_path)
+            compiled.append(file[:-3])
+            print(f"  - {file}: {py_size} -> {mpy_size} bytes ({mpy_size * 100 // max(1, py_size)}%)")
+        else:
+            mpy_size = py_size
+            print(f"  - {file}: compile failed, keeping source ({py_size} bytes)")
+        total_py += py_size
+        total_mpy += mpy_size
+    print(f"  - Total: {total_py} -> {total_mpy} bytes")
+    return compiled
+
+
+def merge_python_files(work_dir, src_dir, entry='main'):
+    """Bundle the Python files from src directory into a single file.
+
+    Modules are ordered by their imports with the entry module (main.py)
+    last; imports of the inlined modules, duplicate imports and unused
+    definitions are removed.
+    """
     print("Merging Python files...")
-    
+
     # Create build directory if it doesn't exist
     os.makedirs(work_dir, exist_ok=True)
-    
+
     # Path to the merged output file
     merged_file = os.path.join(work_dir, 'merged_main.py')
-    
-    # Get all Python files from src directory
-    src_files = [os.path.join(src_dir, f) for f in os.listdir(src_dir) 
-                if f.endswith('.py') and os.path.isfile(os.path.join(src_dir, f))]
-    
-    if not src_files:
-        print(f"Error: No Python files found in {src_dir}")
+
+    try:
+        code, order, dropped = bundler.bundle(src_dir, entry)
+    except (bundler.BundleError, OSError) as e:
+        print(f"Error: {e}")
         sys.exit(1)
-    
-    # Sort files to ensure consistent ordering (main.py first if it exists)
-    src_files.sort(key=lambda x: x.endswith('main.py'))
-    
-    # Merge all Python files
+    print(f"  - Order: {', '.join(order)}")
+    print(f"  - Dropped unused: {', '.join(dropped) or 'none'}")
+
     with open(merged_file, 'w') as outfile:
-        for fname in src_files:
-            with open(fname) as infile:
-                # Skip shebang lines and encoding declarations
-                content = infile.read()
-                lines = content.splitlines(True)
-                
-                # Skip shebang and encoding lines
-                for line in lines:
-                    if line.startswith('#!') or ('coding=' in line and 'python' in line.lower()):
-                        continue
-                    outfile.write(line)
-                
-                # Add newline between files for better readability
-                outfile.write('\n')
-    
+        outfile.write(code)
+
     return merged_file
 
-def generate_hex(python_exec):
+def generate_hex(python_exec, entry='main', name='micropython'):
     """Generate a hex file from the main Python file using a specific MicroPython runtime.
     
     Uses the 0257_nrf52820_microbit_if_crc_c782a5ba90_gcc.hex firmware from the hex folder.
+    With entry=GAMEPAD_ENTRY the controller firmware is built instead of the robot's.
+    Exits with an error if the bundle is over the script limit (see utils.bundler),
+    as the robot's is; only the controller firmware fits.
     """
     print("Generating hex file...")
 
     # Merge all Python files into one
-    main_py = merge_python_files("temp", BUILD_DIR)
+    main_py = merge_python_files("temp", BUILD_DIR, entry)
     
     if not os.path.exists(main_py):
         print(f"Error: {main_py} not found")
         sys.exit(1)
 
+    # Bundling re-expands the minified code, so minify the result again
+    run_command(f"{python_exec} -m python_minifier {main_py} -o {main_py} --remove-literal-statements ")
+    if not bundler.report(os.path.getsize(main_py)):
+        # uflash would embed a truncated script that cannot run
+        print(f"Error: the {entry} bundle does not fit in a hex file; flash the robot without --hex, "
+              "which copies the modules to the micro:bit file system")
+        sys.exit(1)
+
     # Path to the custom runtime firmware
     runtime_hex = os.path.join("hex", "0257_nrf52820_microbit_if_crc_c782a5ba90_gcc.hex")
     
@@ -172,7 +232,7 @@ def generate_hex(python_exec):
         sys.exit(1)
 
     os.makedirs(OUTPUT_HEX, exist_ok=True)
-    output_hex = os.path.join(OUTPUT_HEX, "micropython.hex")
+    output_hex = os.path.join(OUTPUT_HEX, name + ".hex")
 
     # Use uflash with the specified runtime
     cmd = f"{python_exec} -m uflash --runtime {runtime_hex} {main_py} -o {output_hex}"
@@ -187,98 +247,39 @@ def generate_hex(python_exec):
         print("Error generating hex file")
         sys.exit(1)
 
-def copy_to_microbit(src_path, dest_name, max_retries=3):
-    import microfs  # For micro:bit file system operations
-    """Helper function to copy a file to micro:bit with retry logic."""
-    for attempt in range(max_retries):
-        try:
-            print(f"  - Attempt {attempt + 1}/{max_retries} for {os.path.basename(src_path)}...")
-            microfs.put(src_path, dest_name)
-            print(f"  - Successfully copied to {dest_name}")
-            
-            # Verify the file was copied
-            time.sleep(2)  # Give micro:bit a moment to update its filesystem
-            file_list = microfs.ls()
-            if dest_name in file_list:
-                print(f"  - Verified {dest_name} on micro:bit")
-                return True
-            else:
-                print(f"  - Warning: {dest_name} not found on micro:bit")
-                
-        except Exception as e:
-            print(f"  - Error (attempt {attempt + 1}): {str(e)}")
-            if attempt < max_retries - 1:  # Don't sleep on the last attempt
-                print(f"  - Retrying in 10 seconds...")
-                time.sleep(10)
-    
-    print(f"  - Failed to copy {dest_name} after {max_retries} attempts")
-    return False
+def copy_files(python_exec, files, port=None, max_retries=3, remove=(), probe=None):
+    """Copy files to the micro:bit over a single raw REPL session.
 
+    Runs utils.raw_repl in the virtual environment, which enters the raw REPL
+    once, streams every file, verifies each by size and checksum on the
+    device and retries only the files that failed.
 
-def copy_to_microbit2(python_exec, src_path, dest_name=None, max_retries=3):
-    """Copy file to micro:bit using 'python -m microfs put' command.
-    
     Args:
-        src_path (str): Path to the source file to copy
-        dest_name (str, optional): Destination filename on the micro:bit. 
-                                 If None, uses the source filename.
-        max_retries (int): Maximum number of retry attempts
-        
+        files (list[str]): Paths of the files to copy
+        port (str, optional): Serial port of the micro:bit
+        max_retries (int): Maximum attempts per file
+        remove (list[str]): Files to delete from the board before copying
+        probe (str, optional): Module to import afterwards to measure boot time and heap
+
     Returns:
-        bool: True if copy was successful, False otherwise
+        bool: True if every file was copied and verified
     """
-    if dest_name is None:
-        dest_name = os.path.basename(src_path)
-
-    for attempt in range(max_retries):
-        try:
-            print(f"  - Attempt {attempt + 1}/{max_retries} for {os.path.basename(src_path)}...")
-            
-            # Run the microfs put command
-            result = subprocess.run(
-                [python_exec, '-m', 'microfs', 'put', src_path],
-                capture_output=True,
-                text=True
-            )
-            
-            if result.returncode == 0:
-                print(f"  - Successfully copied to {dest_name}")
-                time.sleep(1)  # Brief pause for filesystem
-                
-                # Verify file exists
-                ls_result = subprocess.run(
-                    [python_exec, '-m', 'microfs', 'ls'],
-                    capture_output=True,
-                    text=True
-                )
-                
-                if dest_name in ls_result.stdout:
-                    print(f"  - Verified {dest_name} on micro:bit")
-                    return True
-                print(f"  - Warning: {dest_name} not found on micro:bit")
-            else:
-                error_msg = result.stderr.strip()
-                if not error_msg and result.stdout:
-                    error_msg = result.stdout.strip()
-                print(f"  - Error: {error_msg or 'Unknown error'}")
-                
-            if attempt < max_retries - 1:
-                print("  - Retrying in 5 seconds...")
-                time.sleep(5)
-                
-        except Exception as e:
-            print(f"  - Error: {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(5)
-    
-    print(f"  - Failed to copy {dest_name} after {max_retries} attempts")
-    return False
+    cmd = [python_exec, "-m", "utils.raw_repl", "--retries", str(max_retries)]
+    if port:
+        cmd.extend(["--port", port])
+    for name in remove:
+        cmd.extend(["--rm", name])
+    if probe:
+        cmd.extend(["--probe", probe])
+    result = subprocess.run(cmd + files, text=True)
+    return result.returncode == 0
 
 
-def flash_microbit(python_exec,port=None):
+def flash_microbit(python_exec, port=None, mpy=()):
     """Flash the hex file to a connected micro:bit and copy Python files to the file system.
     Args:
         port: Serial port of the micro:bit (e.g., '/dev/tty.usbmodem...' on macOS/Linux, 'COM3' on Windows)
+        mpy: Modules compiled to .mpy; these are copied instead of their .py source
     """
         
     print(f"Looking for micro:bit on port: {port or 'auto'}")
@@ -301,42 +302,37 @@ def flash_microbit(python_exec,port=None):
         print(f"Flashing {main_py_path} to micro:bit...")
         result = subprocess.run(cmd, capture_output=True, text=True)
         
-        print("Waiting for micro:bit to initialize...")
-        time.sleep(6)  # Wait for micro:bit to initialize
-        
-        # 2. Get list of files to copy
+        if result.returncode != 0:
+            print(f"Error flashing: {result.stderr.strip()}")
+
+        # Get list of files to copy
         files_to_copy = []
         if os.path.exists(BUILD_DIR):
             # Get all Python files except main.py
-            files_to_copy = [f for f in os.listdir(BUILD_DIR) 
-                           if f.endswith('.py') and f != 'main.py' 
-                           and os.path.isfile(os.path.join(BUILD_DIR, f))]
-        
-        # Add pu.txt to the list
-        pu_txt_src = os.path.abspath(os.path.join(SOURCE_DIR, 'pu.txt'))
+            files_to_copy = [os.path.join(BUILD_DIR, f[:-3] + '.mpy' if f[:-3] in mpy else f)
+                             for f in sorted(os.listdir(BUILD_DIR))
+                             if f.endswith('.py') and f != 'main.py' and f not in GAMEPAD_FILES
+                             and os.path.isfile(os.path.join(BUILD_DIR, f))]
+
+        # Add the pose pack and pu.txt to the list
+        pk = os.path.join(BUILD_DIR, 'poses.pk')
+        if os.path.exists(pk):
+            files_to_copy.append(pk)
+        pu_txt_src = os.path.join(SOURCE_DIR, 'pu.txt')
         if os.path.exists(pu_txt_src):
-            files_to_copy.append(('pu.txt', pu_txt_src))
-        
+            files_to_copy.append(pu_txt_src)
+
         if not files_to_copy:
             print("No additional files found to copy")
             return True
-            
-        # 3. Copy files one by one with microfs
+
+        # Copy all files over one serial session; waits for the board to reboot
         print(f"Copying {len(files_to_copy)} files to micro:bit file system...")
-        for file_info in files_to_copy:
-            if isinstance(file_info, tuple):
-                dest_name, src_path = file_info
-            else:
-                src_path = os.path.abspath(os.path.join(BUILD_DIR, file_info))
-                dest_name = os.path.basename(file_info)
-                
-            print(f"\n--- Copying {os.path.basename(src_path)} ---")
-            success = copy_to_microbit2(python_exec, src_path)
-            if not success:
-                print(f"  - Warning: Failed to copy {os.path.basename(src_path)}")
-            
-            time.sleep(2)  # Small delay between files
-        
+        # The board imports X.py before X.mpy, so stale sources must go
+        stale = [m + '.py' for m in mpy]
+        if not copy_files(python_exec, files_to_copy, port, remove=stale, probe=BOOT_MODULE):
+            print("  - Warning: Some files could not be copied")
+
         print("\nFile copy process completed")
         return True
         
@@ -367,6 +363,9 @@ def main():
     parser.add_argument('--port', help='Serial port for micro:bit (e.g., /dev/tty.usbmodem... or COM3)')
     parser.add_argument('--list', action='store_true', help='List connected micro:bits and exit')
     parser.add_argument('--prepare', action='store_true', help='Create virtual environment and install dependencies')
+    parser.add_argument('--hex', action='store_true', help='Bundle all modules into a single hex file instead of flashing (fails if over the script limit)')
+    parser.add_argument('--mpy', action='store_true', help='Copy modules as precompiled .mpy bytecode (falls back to .py)')
+    parser.add_argument('--gamepad', action='store_true', help='Build the Python controller firmware into output/gamepad.hex')
     args = parser.parse_args()
     
     print("=== Micro:bit Flasher ===")
@@ -382,8 +381,17 @@ def main():
         # Minify code
         build_dir = minify_code(python_exec)
 
-        # Flash to micro:bit if requested
-        flash_microbit(python_exec, args.port)
+        if args.gamepad:
+            generate_hex(python_exec, GAMEPAD_ENTRY, 'gamepad')
+        elif args.hex:
+            generate_hex(python_exec)
+        else:
+            # Precompile modules so the board skips on-device compilation
+            mpy = compile_mpy(python_exec) if args.mpy else []
+            build_pack()
+
+            # Flash to micro:bit if requested
+            flash_microbit(python_exec, args.port, mpy)
     
     print("=== Done ===")
 
@@ -0,0 +1,110 @@
+from microbit import *
+import time
+
+
+class Anim(object):
+    """
+    Keyframed, time-based LED effects for the eyes and the NeoPixels.
+
+    Effects and setters only change targets. update() writes a target to
+    the hardware only when it differs from what was last written, at most
+    max_hz times per second, and counts the hardware writes per second.
+
+    Keyframes are flat tuples looped over the time of the last keyframe:
+    (t, left, right, ...) for the eyes and (t, r, g, b, ...) for the pixels,
+    with t in ms and values interpolated linearly between keyframes.
+    """
+    def __init__(self, max_hz=30):
+        self.max_hz = max_hz        # refresh rate limit (Hz)
+        self.np = None              # NeoPixel strip, attached by the robot
+        self.eye = [1023, 1023]     # left and right eye brightness targets (0-1023)
+        self.eye_o = [-1, -1]       # brightness last written to each eye (-1 = unknown)
+        self.px = bytearray(0)      # pixel RGB targets
+        self.px_o = bytearray(0)    # pixel RGB last shown
+        self.e_fx = None            # eye keyframes
+        self.p_fx = None            # pixel keyframes, applied to all pixels
+        self.e_t0 = self.p_t0 = 0   # effect start times (ms)
+        self.last_ms = 0            # time of the last refresh (ms)
+        self.wr = 0                 # hardware writes in the current second
+        self.wps = 0                # hardware writes in the last full second
+        self.w_ts = 0               # start of the current second (ms)
+
+    # attach the NeoPixel strip
+    def attach(self, np):
+        self.np = np
+        self.px = bytearray(3 * len(np))
+        self.px_o = bytearray(b'\xff' * len(self.px))  # force the first show
+
+    # set the target color of a pixel
+    def px_set(self, i, r, g, b):
+        self.p_fx = None
+        o = 3 * i
+        self.px[o], self.px[o + 1], self.px[o + 2] = r, g, b
+
+    # set the target color of all pixels
+    def px_fill(self, r, g, b):
+        for i in range(len(self.px) // 3):
+            self.px_set(i, r, g, b)
+
+    # set the target brightness of the eyes
+    def eye_set(self, l, r):
+        self.e_fx = None
+        self.eye[0], self.eye[1] = l, r
+
+    # start a looped eye effect
+    def play_eyes(self, fx):
+        self.e_fx, self.e_t0 = fx, time.ticks_ms()
+
+    # start a looped pixel effect
+    def play_px(self, fx):
+        self.p_fx, self.p_t0 = fx, time.ticks_ms()
+
+    # evaluate keyframes at time t into out[0:n]
+    def kf(self, fx, w, t, out, n):
+        t %= fx[-w]
+        i = 0
+        while fx[i + w] < t:
+            i += w
+        a, d = t - fx[i], max(1, fx[i + w] - fx[i])
+        for j in range(1, n + 1):
+            out[j - 1] = fx[i + j] + (fx[i + w + j] - fx[i + j]) * a // d
+
+    # write changed outputs to the hardware
+    def update(self):
+        """
+        Advance the effects and write changed outputs, rate limited to max_hz.
+
+        Returns:
+            int: Number of hardware writes made
+        """
+        t = time.ticks_ms()
+        if time.ticks_diff(t, self.w_ts) >= 1000:
+            self.wps, self.wr, self.w_ts = self.wr, 0, t
+        if time.ticks_diff(t, self.last_ms) < 1000 // self.max_hz:
+            return 0
+        self.last_ms = t
+        if self.e_fx:
+            self.kf(self.e_fx, 3, time.ticks_diff(t, self.e_t0), self.eye, 2)
+        if self.p_fx:
+            self.kf(self.p_fx, 4, time.ticks_diff(t, self.p_t0), self.px, 3)
+            for i in range(3, len(self.px)):
+                self.px[i] = self.px[i - 3]
+        n = 0
+        e, o = self.eye, self.eye_o
+        if e[0] != o[0]:
+            pin12.write_analog(e[0])
+            o[0] = e[0]
+            n += 1
+        if e[1] != o[1]:
+            pin13.write_analog(e[1])
+            o[1] = e[1]
+            n += 1
+        if self.np and self.px != self.px_o:
+            p = self.px
+            for i in range(len(p) // 3):
+                self.np[i] = (p[3 * i], p[3 * i + 1], p[3 * i + 2])
+            self.np.show()
+            self.px_o[:] = p
+            n += 1
+        self.wr += n
+        return n
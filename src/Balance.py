@@ -0,0 +1,52 @@
+class LowPass(object):
+    """
+    First-order low-pass filter with an explicit time step.
+
+    The old fixed filter (x + 9 * prev) * 0.1 equals tau = 0.18 s at 50 Hz.
+    """
+    def __init__(self, tau=0.18):
+        self.tau = tau  # time constant (s)
+        self.y = 0.0    # filtered value
+
+    def update(self, x, dt):
+        self.y += (x - self.y) * dt / (self.tau + dt)
+        return self.y
+
+
+class Balance(object):
+    """
+    PID-style balance controller with explicit dt, output limits and deadband.
+
+    The last error and correction are kept in `e` and `u` for telemetry.
+    """
+    def __init__(self, kp, ki=0.0, kd=0.0, lo=-15.0, hi=15.0, db=0.0):
+        self.kp, self.ki, self.kd = kp, ki, kd  # gains
+        self.lo, self.hi = lo, hi  # output limits
+        self.db = db    # deadband: smaller corrections are zeroed
+        self.i = 0.0    # integral of the error
+        self.e = 0.0    # last error
+        self.u = 0.0    # last correction output
+
+    def update(self, e, dt, bias=0.0, lo=None, hi=None):
+        """
+        Compute the correction for error e.
+
+        Args:
+            e (float): Error (degrees)
+            dt (float): Time since the last update (s)
+            bias (float): Feed-forward term added before limiting
+            lo (float, optional): Lower output limit, overrides self.lo
+            hi (float, optional): Upper output limit, overrides self.hi
+
+        Returns:
+            float: Limited correction
+        """
+        lo = self.lo if lo is None else lo
+        hi = self.hi if hi is None else hi
+        d = (e - self.e) / dt if dt > 0 else 0.0
+        if self.ki:
+            # clamp the integral to the output range to avoid wind-up
+            self.i = max(lo, min(hi, self.i + self.ki * e * dt))
+        u = max(lo, min(hi, self.kp * e + self.i + self.kd * d + bias))
+        self.e, self.u = e, 0.0 if abs(u) < self.db else u
+        return self.u
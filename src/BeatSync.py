@@ -0,0 +1,121 @@
+import time
+
+
+class BeatSync(object):
+    """
+    Shared beat grid for robots dancing to the same music.
+
+    Each robot measures its own grid with MusicLib and broadcasts it about
+    once per second as a "#pubt" value packet: the period, the time since
+    the last beat when sent and a confidence (0-100) that grows with every
+    beat landing on the predicted grid. The packet header carries the
+    sender's running_time() and serial number. A robot follows the most
+    confident sender it hears, with ties going to the higher serial so
+    that all robots pick the same one, unless its own grid ranks higher.
+    The leader changes only for a clearly more confident robot, so a
+    missed beat does not make the swarm switch back and forth.
+
+    The clock offset to the leader is the smallest (receive time - send
+    time) seen, which drops the delay of packets waiting in the radio
+    queue, and relaxes by 1 ms per packet to follow clock drift. The grid
+    in use is exposed as p_ms, beat_ts, strength and next_beat() like
+    MusicLib, so Choreo schedules on either.
+    """
+    def __init__(self, m, sn, tx_ms=1000, to_ms=3000):
+        self.m = m              # local beat tracker (MusicLib)
+        self.sn = sn            # own radio serial number
+        self.tx_ms = tx_ms      # broadcast period (ms)
+        self.to_ms = to_ms      # leader lost after this long without a packet (ms)
+        self.en = True          # follow other robots
+        self.conf = 0           # confidence in the own grid (0-100)
+        self.b_ts = 0           # own last beat (ms)
+        self.tx_ts = 0          # time of the last broadcast (ms)
+        self.l_sn = 0           # leader serial number (0 = none)
+        self.l_conf = 0         # leader confidence
+        self.l_ts = 0           # time of the leader's last packet (ms)
+        self.l_p = 500          # leader period (ms)
+        self.l_beat = 0         # a leader beat, in local time (ms)
+        self.off = 0            # leader clock offset, local - leader (ms)
+        self.n_sw = 0           # leader changes
+        self.p_ms = m.p_ms      # period of the grid in use (ms)
+        self.beat_ts = 0        # a beat of the grid in use (ms)
+        self.strength = 0       # loudness of the last local beat (%)
+
+    # whether the grid in use is the leader's
+    def follow(self, ts):
+        return (self.en and self.l_sn and time.ticks_diff(ts, self.l_ts) <= self.to_ms and
+                (self.l_conf, self.l_sn) > (self.conf, self.sn))
+
+    # update the own confidence and select the grid in use
+    def update(self, ts, beat):
+        """
+        Score a local beat against the local grid and pick the grid to dance on.
+
+        Args:
+            ts (int): Current time (ms)
+            beat (bool): Whether MusicLib just detected a beat
+        """
+        m = self.m
+        p = max(1, m.p_ms)
+        if beat:
+            d = time.ticks_diff(m.beat_ts, self.b_ts)
+            e = abs(d - (d + (p >> 1)) // p * p)
+            self.conf = min(100, self.conf + 10) if d > 0 and e <= p >> 3 else max(0, self.conf - 20)
+            self.b_ts = m.beat_ts
+        elif self.conf and time.ticks_diff(ts, self.b_ts) > 4 * p:
+            self.conf -= 1  # the music stopped or is lost in noise
+        if self.follow(ts):
+            self.p_ms, self.beat_ts = self.l_p, self.l_beat
+        else:
+            self.p_ms, self.beat_ts = m.p_ms, m.beat_ts
+        self.strength = m.strength
+
+    # predict the next beat, or the next 1/div subdivision of a beat, after ts
+    def next_beat(self, ts, div=1):
+        st = max(1, self.p_ms // div)
+        n = time.ticks_diff(ts, self.beat_ts) // st + 1
+        return time.ticks_add(self.beat_ts, n * st)
+
+    # value of the next broadcast, if one is due
+    def tx(self, ts):
+        """
+        Pack the local grid for broadcast, at most once per tx_ms.
+
+        Bits 19-30 hold the period, bits 7-18 the time since the last beat
+        and bits 0-6 the confidence, so the value fits a positive int32.
+
+        Returns:
+            int: Packed grid, or None if no broadcast is due
+        """
+        if not self.conf or time.ticks_diff(ts, self.tx_ts) < self.tx_ms:
+            return None
+        self.tx_ts = ts
+        p = min(4095, max(1, self.m.p_ms))
+        return p << 19 | time.ticks_diff(ts, self.m.beat_ts) % p << 7 | self.conf
+
+    # handle a grid broadcast by another robot
+    def rx(self, v, ts, sn, now):
+        """
+        Track the most confident robot and its clock offset.
+
+        Args:
+            v (int): Packed grid (see tx)
+            ts (int): Sender's running_time() when sent (ms)
+            sn (int): Sender's serial number
+            now (int): Local time of reception (ms)
+        """
+        if not sn or sn == self.sn:
+            return
+        c, o = v & 0x7f, time.ticks_diff(now, ts)
+        if sn != self.l_sn:
+            # a live leader is replaced by a clearly more confident robot, or
+            # on a tie by the higher serial number
+            if (self.l_sn and time.ticks_diff(now, self.l_ts) <= self.to_ms and
+                    c <= self.l_conf + 25 and (c < self.l_conf or sn < self.l_sn)):
+                return
+            self.l_sn, self.off = sn, o
+            self.n_sw += 1
+        else:
+            self.off = min(o, self.off + 1)
+        self.l_conf, self.l_p, self.l_ts = c, max(1, v >> 19), now
+        self.l_beat = time.ticks_add(ts, self.off - (v >> 7 & 0xfff))
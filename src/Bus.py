@@ -0,0 +1,112 @@
+from microbit import *
+import time
+
+
+class Bus(object):
+    """
+    I2C writes with bounded retries and bus health accounting.
+
+    A write that fails (OSError, e.g. a NACK on loose wiring) is tried again
+    up to tries times in all, and each failed attempt is counted against its
+    address. After fail writes in a row have failed, the bus is marked
+    degraded: writes are skipped for a backoff delay that doubles on each
+    further failed write, up to max_bo ms, so the loop keeps running instead
+    of stalling on the bus. The first write after the delay is tried once;
+    a success clears the degraded state and the backoff.
+
+    The last write skipped or given up for each register (address and first
+    byte) is kept and replayed by flush, on the next successful write or
+    from the loop, so a value written once, such as a motor stop, still
+    reaches the board after the bus recovers. A newer write to the register
+    replaces it.
+
+    Time spent in writes is summed, so util() gives the share of time the
+    loop spends on the bus.
+    """
+    def __init__(self, tries=3, fail=3, bo_ms=50, max_bo=2000):
+        self.tries = tries          # attempts per write
+        self.fail = fail            # failed writes in a row that mark the bus degraded
+        self.bo_ms = bo_ms          # first backoff delay (ms)
+        self.max_bo = max_bo        # longest backoff delay (ms)
+        self.ae = {}                # address -> failed attempts
+        self.n_wr = 0               # writes done
+        self.n_err = 0              # failed attempts
+        self.n_fail = 0             # writes given up after every attempt failed
+        self.n_skip = 0             # writes skipped while degraded
+        self.n_deg = 0              # times the bus was marked degraded
+        self.n_rpl = 0              # pending writes replayed
+        self.pend = {}              # (address, register) -> last write skipped or given up
+        self.run = 0                # failed writes in a row
+        self.deg = False            # bus degraded
+        self.bo = 0                 # current backoff delay (ms)
+        self.deg_ts = 0             # end of the current backoff (ms)
+        self.busy_us = 0            # time in writes since the last util() (us)
+        self.t0 = time.ticks_us()   # time of the last util() (us)
+
+    # write buf to the device at addr
+    def write(self, addr, buf):
+        """
+        Args:
+            addr (int): 7-bit I2C address
+            buf (bytearray): Bytes to write
+
+        Returns:
+            bool: True if written, False if every attempt failed or the
+            write was skipped while the bus is degraded
+        """
+        k = (addr, buf[0])
+        if self.deg and time.ticks_diff(self.deg_ts, time.ticks_ms()) > 0:
+            self.n_skip += 1
+            self.pend[k] = buf
+            return False
+        self.pend.pop(k, None)
+        if not self.put(addr, buf):
+            self.pend[k] = buf
+            return False
+        if self.pend:
+            self.flush()
+        return True
+
+    # replay the pending writes, once the backoff is over
+    def flush(self):
+        if self.deg and time.ticks_diff(self.deg_ts, time.ticks_ms()) > 0:
+            return
+        for k in list(self.pend):
+            if not self.put(k[0], self.pend[k]):
+                return
+            del self.pend[k]
+            self.n_rpl += 1
+
+    # try one write, counting failures and marking the bus degraded
+    def put(self, addr, buf):
+        t = time.ticks_us()
+        ok = False
+        for _ in range(1 if self.deg else self.tries):
+            try:
+                i2c.write(addr, buf)
+                ok = True
+                break
+            except OSError:
+                self.n_err += 1
+                self.ae[addr] = self.ae.get(addr, 0) + 1
+        self.busy_us += time.ticks_diff(time.ticks_us(), t)
+        if ok:
+            self.n_wr += 1
+            self.run, self.deg, self.bo = 0, False, 0
+            return True
+        self.n_fail += 1
+        self.run += 1
+        if self.run >= self.fail:
+            if not self.deg:
+                self.n_deg += 1
+                self.deg = True
+            self.bo = min(self.max_bo, max(self.bo_ms, self.bo * 2))
+            self.deg_ts = time.ticks_add(time.ticks_ms(), self.bo)
+        return False
+
+    # share of time spent in writes since the last call (0-1)
+    def util(self):
+        t = time.ticks_us()
+        u = self.busy_us / max(1, time.ticks_diff(t, self.t0))
+        self.busy_us, self.t0 = 0, t
+        return u
@@ -0,0 +1,112 @@
+import time
+
+# candidate channels, 10 MHz apart across the 2.4 GHz band (7 is the default)
+SCAN_CHANS = (7, 17, 27, 37, 47, 57, 67, 77)
+# groups sampled on each side of the robot's own; classroom robots are set to
+# neighbouring groups with buttons A and B
+SCAN_SPAN = 6
+
+
+class ChanScan(object):
+    """
+    Congestion scan of radio channels and groups.
+
+    The radio only hears packets of the group it is tuned to, so the scan
+    listens to each (channel, group) slot in turn for at least dw_ms and
+    counts the packets heard: the robot's own group and the span groups on
+    either side of it. The own group comes first on every channel; on the
+    channel in use it is not counted, as that traffic is the robot's own
+    controller and moves with it. A channel's rate is the sum of the rates
+    of its groups, a lower bound of its real traffic.
+
+    The scan is stepped from the control loop, one slot check per tick, so
+    the robot keeps balancing and detecting falls while it listens. After a
+    move the old setting is kept in back until the controller is heard on
+    the new one, so the robot can return if the announcement was missed.
+    """
+    def __init__(self, chans=SCAN_CHANS, span=SCAN_SPAN, dw_ms=30, to_ms=3000):
+        self.chans = chans          # channels scanned
+        self.span = span            # groups sampled on each side of the own group
+        self.dw_ms = dw_ms          # listening time per slot (ms)
+        self.gs = ()                # groups of the running scan, own group first
+        self.ch0 = 7                # channel in use when the scan started
+        self.i = -1                 # slot being sampled (channel * groups + group), -1 = idle
+        self.ts = 0                 # start of the slot (ms)
+        self.n = 0                  # packets heard in the slot
+        self.r = []                 # packet rate of each slot of the last scan (packets/s)
+        self.rate = [0] * len(chans)  # packet rate of each channel in the last scan (packets/s)
+        self.n_scan = 0             # scans completed
+        self.to_ms = to_ms          # wait for the controller on a new setting (ms)
+        self.mv = None              # (channel, group) picked by the last scan
+        self.ann = 0                # announcements of mv left before moving
+        self.back = None            # (channel, group) to return to, None once confirmed
+        self.mv_ts = 0              # time of the last move (ms)
+
+    # whether a scan is running
+    def busy(self):
+        return self.i >= 0
+
+    # tune the radio to slot i
+    def tune(self, ro, ts):
+        ng = len(self.gs)
+        ro.tune(self.gs[self.i % ng], self.chans[self.i // ng])
+        ro.drain()
+        self.ts, self.n = ts, 0
+
+    # start a scan
+    def start(self, ro, g, chan, ts):
+        """
+        Args:
+            ro (MakeRadio): Radio to scan with
+            g (int): Group in use
+            chan (int): Channel in use
+            ts (int): Current time (ms)
+        """
+        self.gs = (g,) + tuple((g + d) % 256 for d in range(-self.span, self.span + 1) if d)
+        self.ch0 = chan
+        self.r = []
+        self.i = 0
+        self.tune(ro, ts)
+
+    # count the packets of the current slot, moving on after dw_ms
+    def step(self, ro, ts):
+        """
+        Returns:
+            bool: True when the last slot has been sampled
+        """
+        k = ro.drain()
+        if self.i % len(self.gs) or self.chans[self.i // len(self.gs)] != self.ch0:
+            self.n += k
+        el = time.ticks_diff(ts, self.ts)
+        if el < self.dw_ms:
+            return False
+        self.r.append(self.n * 1000 // el)
+        self.i += 1
+        if self.i < len(self.chans) * len(self.gs):
+            self.tune(ro, ts)
+            return False
+        self.i = -1
+        ng = len(self.gs)
+        for c in range(len(self.chans)):
+            self.rate[c] = sum(self.r[c * ng:(c + 1) * ng])
+        self.n_scan += 1
+        return True
+
+    # whether the controller missed the move and the old setting should be restored
+    def lost(self, ts):
+        return self.back is not None and time.ticks_diff(ts, self.mv_ts) > self.to_ms
+
+    # least congested channel and a quiet group on it
+    def pick(self):
+        """
+        Choose the channel with the lowest rate, the one in use on a tie. The
+        own group is kept unless it was heard busy on that channel, in which
+        case the quietest sampled group is taken.
+
+        Returns:
+            tuple: (channel, group)
+        """
+        ng = len(self.gs)
+        b = min(range(len(self.chans)), key=lambda c: (self.rate[c], self.chans[c] != self.ch0))
+        s = self.r[b * ng:(b + 1) * ng]
+        return self.chans[b], self.gs[s.index(min(s)) if s[0] else 0]
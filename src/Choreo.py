@@ -0,0 +1,96 @@
+import time
+import random
+
+
+class Choreo(object):
+    """
+    Table-driven dance choreography.
+
+    A move is a pose sequence: a predefined routine or a single safe pose.
+    The next move is drawn from a Markov chain over the last pose of the
+    current move. For each pose, the next-move lists for weak and strong
+    beats are built once as byte tables. Each move index is repeated by its
+    weight, so drawing a move is one random index.
+
+    Moves change on a predicted beat and the wiggle flips on half beats. All
+    timestamps are integer milliseconds, and update() allocates nothing.
+    """
+    def __init__(self, p, routines, st_thr=150):
+        self.st_thr = st_thr      # beat strength (% of average loudness) counted as strong
+        self.moves = [tuple(r) for r in routines.values()] + [(s,) for s in p.dance_ok]
+        self.nx = {}              # pose -> (weak, strong) next-move tables
+        tg = p.st_tg if type(p.st_tg) is list else p.st_tg.all()  # pose pack rows in one read
+        for r in self.moves:
+            if r[-1] not in self.nx:
+                self.nx[r[-1]] = self.build(tg, r[-1], routines.get(r[-1]))
+        self.cur = self.moves[-len(p.dance_ok)]  # current move, starting with the first safe pose
+        self.nxt = -1             # move picked on a beat, started on the next beat (-1 = none)
+        self.sw_ts = 0            # time to start the picked move (ms)
+        self.move_ts = 0          # earliest time to pick another move (ms)
+        self.flip_ts = 0          # time of the next half-beat flip (ms)
+
+    # build the weighted next-move tables of a pose
+    def build(self, tg, f, rt):
+        """
+        Build the weak-beat and strong-beat next-move tables of pose f.
+
+        Moves starting near pose f are favored for smooth transitions, the
+        routine defined for f is favored most, and strong beats favor routines
+        and wide poses.
+
+        Args:
+            tg (list[list]): Pose targets (st_tg)
+            f (int): Pose the current move ends with
+            rt (list[int]): Routine defined for pose f, if any
+
+        Returns:
+            tuple: (weak, strong) byte tables of move indices
+        """
+        we, st = [], []
+        for m in range(len(self.moves)):
+            r = self.moves[m]
+            d = sum(abs(a - b) for a, b in zip(tg[f], tg[r[0]]))
+            w = max(0, 4 - d // 50) + (6 if rt is not None and r == tuple(rt) else 0)
+            a = sum(abs(tg[s][i] - 90) for s in r for i in range(4)) // len(r)
+            we += [m] * (w + (0 if len(r) > 1 else 1))
+            st += [m] * (w + (2 if len(r) > 1 else a // 60))
+        return bytes(we), bytes(st or we)
+
+    # draw the next move after pose f
+    def pick(self, f, strong):
+        t = self.nx[f][1 if strong else 0]
+        return t[random.randint(0, len(t) - 1)]
+
+    # advance the choreography by one tick
+    def update(self, ts, m, beat):
+        """
+        Schedule moves and wiggle flips on the beat phase.
+
+        Args:
+            ts (int): Current time (ms)
+            m (MusicLib): Beat tracker
+            beat (bool): Whether a beat was just detected
+
+        Returns:
+            int: Bit 0 set on a half-beat flip, bit 1 set when a new move starts
+        """
+        ev = 0
+        if beat:
+            # re-align the half-beat grid to the detected beat
+            self.flip_ts = m.next_beat(ts, 2)
+            if self.nxt < 0 and time.ticks_diff(ts, self.move_ts) >= 0:
+                self.nxt = self.pick(self.cur[-1], m.strength >= self.st_thr)
+                self.sw_ts = m.next_beat(ts)
+        if self.nxt >= 0 and time.ticks_diff(ts, self.sw_ts) >= 0:
+            self.cur = self.moves[self.nxt]
+            self.nxt = -1
+            self.move_ts = time.ticks_add(ts, m.p_ms * random.randint(8, 16))
+            ev |= 2
+        if time.ticks_diff(ts, self.flip_ts) >= 0:
+            h = m.p_ms >> 1
+            self.flip_ts = time.ticks_add(self.flip_ts, h)
+            if time.ticks_diff(ts, self.flip_ts) >= 0:
+                # fell behind (e.g. after speech), restart the grid from now
+                self.flip_ts = time.ticks_add(ts, h)
+            ev |= 1
+        return ev
@@ -0,0 +1,112 @@
+import time
+
+B36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+class Chunks(object):
+    """
+    Reassembly of long radio payloads sent as chunks.
+
+    A chunk is a string packet "#puk" + kind + id + index + total + data,
+    where kind is 's' (song) or 't' (speech text), and id, index and total
+    are single base-36 digits, so a message has at most 35 chunks. Every
+    chunk but the last carries exactly `size` characters. Chunks may arrive
+    in any order. Each message being assembled uses one of a few fixed
+    buffers, and a message that receives no chunk for to_ms is dropped. The keys of the last few completed
+    messages are kept, and their chunks dropped, until to_ms passes without
+    one, so a message sent more than once is played once.
+    """
+    def __init__(self, slots=2, size=11, max_n=35, to_ms=3000, done=4):
+        self.size = size            # data characters per chunk
+        self.max_n = max_n          # most chunks in a message
+        self.to_ms = to_ms          # reassembly timeout (ms)
+        self.buf = [bytearray(size * max_n) for _ in range(slots)]  # message data
+        self.got = [bytearray(max_n) for _ in range(slots)]  # received flags per chunk
+        self.key = [None] * slots   # kind and id of the message in each slot
+        self.tot = [0] * slots      # chunks in the message
+        self.cnt = [0] * slots      # chunks received
+        self.ln = [0] * slots       # message length (known once the last chunk arrived)
+        self.ts = [0] * slots       # time of the last chunk (ms)
+        self.done = [None] * done   # kind and id of recently completed messages
+        self.d_ts = [0] * done      # time of the last chunk of each (ms)
+        self.d_i = 0                # next entry of done to reuse
+        self.n_ok = 0               # messages completed
+        self.n_to = 0               # messages dropped on timeout or eviction
+        self.n_bad = 0              # malformed chunks
+        self.n_dup = 0              # chunks of completed messages dropped
+
+    # free a slot
+    def clear(self, i):
+        self.key[i] = None
+        self.cnt[i] = 0
+        g = self.got[i]
+        for j in range(self.tot[i]):
+            g[j] = 0
+
+    # find the slot of message k, taking a free or the oldest slot for a new one
+    def slot(self, k, ts):
+        o = 0
+        for i in range(len(self.key)):
+            if self.key[i] is not None and time.ticks_diff(ts, self.ts[i]) > self.to_ms:
+                self.n_to += 1
+                self.clear(i)
+            if self.key[i] == k:
+                return i
+            if self.key[i] is None or (self.key[o] is not None and
+                                       time.ticks_diff(self.ts[i], self.ts[o]) < 0):
+                o = i
+        if self.key[o] is not None:
+            self.n_to += 1
+            self.clear(o)
+        return o
+
+    # add a chunk
+    def add(self, d):
+        """
+        Add a chunk and return the message it completes.
+
+        Args:
+            d (str): Chunk without the "#puk" prefix
+
+        Returns:
+            tuple: (kind, text) when the message is complete, otherwise None
+        """
+        if len(d) < 4 or d[2] not in B36 or d[3] not in B36:
+            self.n_bad += 1
+            return None
+        n, t = B36.index(d[2]), B36.index(d[3])
+        dl = len(d) - 4
+        if not n < t <= self.max_n or dl > self.size or (n < t - 1 and dl != self.size):
+            self.n_bad += 1
+            return None
+        ts = time.ticks_ms()
+        for j in range(len(self.done)):
+            if self.done[j] == d[:2] and time.ticks_diff(ts, self.d_ts[j]) <= self.to_ms:
+                self.d_ts[j] = ts
+                self.n_dup += 1
+                return None  # another copy of a message already played
+        i = self.slot(d[:2], ts)
+        if self.key[i] is None:
+            self.key[i], self.tot[i] = d[:2], t
+        elif self.tot[i] != t:
+            self.n_bad += 1
+            return None
+        self.ts[i] = ts
+        if self.got[i][n]:
+            return None  # duplicate
+        self.got[i][n] = 1
+        self.cnt[i] += 1
+        o = n * self.size
+        b = self.buf[i]
+        for j in range(dl):
+            b[o + j] = ord(d[4 + j])
+        if n == t - 1:
+            self.ln[i] = o + dl
+        if self.cnt[i] < t:
+            return None
+        m = (d[0], str(b[:self.ln[i]], 'utf8'))
+        self.n_ok += 1
+        self.clear(i)
+        self.done[self.d_i], self.d_ts[self.d_i] = d[:2], ts
+        self.d_i = (self.d_i + 1) % len(self.done)
+        return m
@@ -0,0 +1,100 @@
+import ustruct
+
+CFG_VER = 2
+# version, generation, checksum, serial number, group ID, 6 trims, fw_sp, bw_sp, max_rl_ctl, g_thr
+CFG_FMT = "<BBH8sB6f4f"
+# version 2: then the number of tuned parameters and an (ID, value) pair for each
+CFG_PFMT = "<Hf"
+CFG_SLOTS = ("pu0.cfg", "pu1.cfg")
+
+
+# checksum of a record, over everything but the checksum field itself
+def cfg_ck(b):
+    return sum(b) & 0xFFFF
+
+
+class Config(object):
+    """
+    Binary, versioned robot configuration stored in two alternating slots.
+
+    The micro:bit file system has no rename, so a write goes to the slot not
+    holding the newest record and carries a higher generation number. A write
+    interrupted by power loss leaves a record with a bad checksum, and the
+    previous record in the other slot is still used. Version 1 records,
+    without tuned parameters, are still read.
+    """
+    def __init__(self):
+        self.gen = 0    # generation of the newest valid record
+        self.slot = 1   # slot holding the newest valid record
+
+    def _read(self, fn):
+        try:
+            with open(fn, 'rb') as f:
+                b = f.read()
+            n = ustruct.calcsize(CFG_FMT)
+            r = ustruct.unpack(CFG_FMT, b[:n])
+            if r[0] not in (1, CFG_VER) or r[2] != cfg_ck(b[:2] + b[4:]):
+                return None
+            ps = []
+            if r[0] > 1:
+                m = ustruct.calcsize(CFG_PFMT)
+                for k in range(ustruct.unpack_from("<H", b, n)[0]):
+                    ps.append(ustruct.unpack_from(CFG_PFMT, b, n + 2 + k * m))
+            return r + (ps,)
+        except Exception:
+            return None
+
+    def load(self):
+        """
+        Load the newest valid record.
+
+        Returns:
+            tuple: (sn, group, trims, gains, params) or None if no valid
+            record exists; params is a list of (ID, value) pairs (see Tune)
+        """
+        best = None
+        for i in range(len(CFG_SLOTS)):
+            r = self._read(CFG_SLOTS[i])
+            # generations wrap at 256, compare modulo
+            if r and (best is None or (r[1] - best[1]) & 0xFF < 128):
+                best, self.slot = r, i
+        if best is None:
+            return None
+        self.gen = best[1]
+        return str(best[3].rstrip(b'\x00'), 'utf8'), best[4], list(best[5:11]), list(best[11:15]), best[15]
+
+    def save(self, sn, g, trims, gains, params=()):
+        """
+        Write a new record to the older slot.
+
+        Args:
+            sn (str): Robot's serial number (up to 8 bytes)
+            g (int): Radio group ID
+            trims (list[float]): 6 servo trim values
+            gains (list[float]): fw_sp, bw_sp, max_rl_ctl, g_thr
+            params (list[tuple]): (ID, value) pairs of tuned parameters
+        """
+        self.gen = (self.gen + 1) & 0xFF
+        self.slot = (self.slot + 1) % len(CFG_SLOTS)
+        b = ustruct.pack(CFG_FMT, CFG_VER, self.gen, 0, bytes(sn, 'utf8')[:8], g & 0xFF,
+                         *(list(trims[:6]) + list(gains[:4])))
+        b += ustruct.pack("<H", len(params))
+        for i, v in params:
+            b += ustruct.pack(CFG_PFMT, i, v)
+        b = b[:2] + ustruct.pack("<H", cfg_ck(b[:2] + b[4:])) + b[4:]
+        with open(CFG_SLOTS[self.slot], 'wb') as f:
+            f.write(b)
+
+    def load_txt(self, fn="pu.txt"):
+        """
+        Read the legacy three-line text config.
+
+        Returns:
+            tuple: (sn, group, trims) or None if the file is missing or corrupted
+        """
+        try:
+            with open(fn, 'r') as f:
+                c = f.read().split('\n')
+            return c[0], int(c[1]), [float(i) for i in c[2].split(',')]
+        except Exception:
+            return None
@@ -0,0 +1,66 @@
+import time
+
+
+class ErrorLog(object):
+    """
+    Error accounting for the main loop.
+
+    Errors are counted per (stage, exception type) and per stage. At most
+    one error is printed per log_ms; the rest are counted as suppressed and
+    reported with the next printed line. A stage that fails trip times
+    within win_ms is reported as tripped, and the loop backs off with a
+    delay that doubles on each trip, up to max_bo ms. The delay resets once
+    a window passes without errors.
+    """
+    def __init__(self, stages, log_ms=1000, trip=10, win_ms=2000, max_bo=1000):
+        self.stages = stages          # stage names, indexed by stage number
+        self.log_ms = log_ms          # minimum time between printed errors (ms)
+        self.trip = trip              # errors within win_ms that trip a stage
+        self.win_ms = win_ms          # burst window (ms)
+        self.max_bo = max_bo          # longest backoff delay (ms)
+        self.n = {}                   # (stage, exception type) -> count
+        self.n_st = [0] * len(stages) # errors per stage
+        self.total = 0                # all errors
+        self.n_sup = 0                # errors not printed since the last printed one
+        self.log_ts = -log_ms         # time of the last printed error (ms)
+        self.burst = [0] * len(stages)  # errors per stage in the current window
+        self.win_ts = [0] * len(stages) # start of each stage's window (ms)
+        self.bo = 0                   # current backoff delay (ms)
+        self.last_ts = 0              # time of the last error (ms)
+
+    # record an error raised in stage stg
+    def add(self, stg, e):
+        """
+        Count an error, print it if the log rate allows, and check for a trip.
+
+        Args:
+            stg (int): Index of the stage that raised
+            e (Exception): The exception
+
+        Returns:
+            bool: True if the stage keeps failing and the caller should back off
+        """
+        ts = self.last_ts = time.ticks_ms()
+        k = (stg, type(e).__name__)
+        self.n[k] = self.n.get(k, 0) + 1
+        self.n_st[stg] += 1
+        self.total += 1
+        if time.ticks_diff(ts, self.log_ts) >= self.log_ms:
+            print("err", self.stages[stg], k[1], e, "+" + str(self.n_sup) if self.n_sup else "")
+            self.log_ts, self.n_sup = ts, 0
+        else:
+            self.n_sup += 1
+        if time.ticks_diff(ts, self.win_ts[stg]) > self.win_ms:
+            self.win_ts[stg], self.burst[stg] = ts, 0
+        self.burst[stg] += 1
+        if self.burst[stg] >= self.trip:
+            self.win_ts[stg], self.burst[stg] = ts, 0
+            self.bo = min(self.max_bo, max(50, self.bo * 2))
+            return True
+        return False
+
+    # backoff delay for the next loop iteration (ms)
+    def backoff(self):
+        if self.bo and time.ticks_diff(time.ticks_ms(), self.last_ts) > self.win_ms:
+            self.bo = 0
+        return self.bo
@@ -0,0 +1,138 @@
+from microbit import *
+import math
+import time
+from MakeRadio import *
+
+# joystick values in the order they are read, as the MakeCode gamepad names them
+JOY = ("#puspeed", "#puturn", "#pupitch", "#puroll")
+# change of each value that is sent: stick fraction for speed and turn, degrees of tilt
+JOY_DB = (0.05, 0.05, 3, 3)
+# button pins (pulled up, low when pressed) and the "#puB" value each sends
+BTN = ((pin8, 0), (pin13, 1), (pin14, 2), (pin15, 3), (pin16, 4))
+
+
+class Gamepad(object):
+    """
+    Controller firmware for the micro:bit gamepad, sending joystick changes only.
+
+    Reads the same inputs as the MakeCode gamepad: the stick on P1 (speed)
+    and P2 (turn), the tilt of the gamepad (pitch and roll, degrees) and the
+    buttons. The MakeCode program sends all four joystick values every loop,
+    changed or not; this one sends a value only when it moved more than its
+    deadband (JOY_DB) from the value last sent. The robot's turn, roll and
+    pitch handlers low-pass filter per packet, so a value that moved is sent
+    every loop for hold_ms, letting the filters settle. When nothing moves,
+    the value sent longest ago is re-sent every ka_ms as a keepalive, well
+    within the robot's 2 s command timeout (set_states) even with a few
+    packets lost.
+
+    A channel and group announced by the robot after a scan ("#puch") is
+    followed; buttons A and B change the group as on the MakeCode gamepad.
+    """
+    def __init__(self, g=166, chan=7, db=JOY_DB, hold_ms=300, ka_ms=500, period_ms=20):
+        self.g = g                  # radio group
+        self.chan = chan            # radio channel
+        self.db = db                # deadband of each value
+        self.hold_ms = hold_ms      # a value that moved is sent every loop for this long (ms)
+        self.ka_ms = ka_ms          # keepalive period (ms)
+        self.period_ms = period_ms  # loop period (ms)
+        self.v = [0, 0, 0, 0]       # values last read
+        self.sent = [0, 0, 0, 0]    # values last sent
+        self.s_ts = [0, 0, 0, 0]    # time each value was last sent (ms)
+        self.mv_ts = [-hold_ms] * 4  # time each value last moved past its deadband (ms)
+        self.tx_ts = 0              # time of the last packet (ms)
+        self.btn = [1] * len(BTN)   # last level of each button pin
+        self.logo = False           # logo touched in the last loop
+        self.n_tx = 0               # joystick packets sent
+        self.n_ka = 0               # of which keepalives
+        for p, _ in BTN:
+            p.set_pull(p.PULL_UP)
+        self.ro = MakeRadio(g, chan=chan)
+        display.show(g - 160)
+
+    # read the stick and the tilt
+    def read(self):
+        """
+        Fill self.v with speed and turn (-1 to 1, forward and right positive,
+        as the MakeCode gamepad computes them) and pitch and roll (degrees,
+        as MakeCode's input.rotation).
+        """
+        self.v[0] = (512 - pin1.read_analog()) / 512
+        self.v[1] = (512 - pin2.read_analog()) / 512
+        x, y, z = accelerometer.get_values()
+        r = math.atan2(x, -z)
+        self.v[2] = round(math.degrees(math.atan2(y, x * math.sin(r) - z * math.cos(r))))
+        self.v[3] = round(math.degrees(r))
+
+    # send the joystick values that changed, or a keepalive
+    def send(self, ts):
+        """
+        Args:
+            ts (int): Current time (ms)
+        """
+        k = 0
+        for i in range(len(JOY)):
+            if abs(self.v[i] - self.sent[i]) > self.db[i]:
+                self.mv_ts[i] = ts
+            if time.ticks_diff(ts, self.mv_ts[i]) < self.hold_ms:
+                self.tx(i, ts)
+                k += 1
+        if not k and time.ticks_diff(ts, self.tx_ts) >= self.ka_ms:
+            i = 0
+            for j in range(1, len(JOY)):
+                if time.ticks_diff(self.s_ts[i], self.s_ts[j]) > 0:
+                    i = j
+            self.tx(i, ts)
+            self.n_ka += 1
+
+    def tx(self, i, ts):
+        self.ro.send_value(JOY[i], self.v[i])
+        self.sent[i], self.s_ts[i], self.tx_ts = self.v[i], ts, ts
+        self.n_tx += 1
+
+    # buttons, logo and group changes
+    def buttons(self):
+        for i in range(len(BTN)):
+            p, v = BTN[i]
+            b = p.read_digital()
+            if b and not self.btn[i]:
+                self.ro.send_value("#puB", v)  # on release, as MakeCode's onPulsed
+            self.btn[i] = b
+        t = pin_logo.is_touched()
+        if t and not self.logo:
+            self.ro.send_value("#pulogo", 1)
+        self.logo = t
+        if button_a.was_pressed():
+            self.set_group(self.chan, (self.g + 1) % 256)
+        if button_b.was_pressed():
+            self.set_group(self.chan, (self.g - 1) % 256)
+
+    def set_group(self, chan, g):
+        self.chan, self.g = chan, g
+        self.ro.tune(g, chan)
+        display.show(g - 160)
+
+    # follow the robot to the channel and group it announces
+    def receive(self):
+        for i in range(self.ro.q):
+            d = self.ro.receive_packet()
+            if d is None:
+                return
+            if isinstance(d, tuple) and d[0] == "#puch":
+                self.set_group(d[1] >> 8, d[1] & 0xff)
+
+    # one loop iteration
+    def step(self):
+        ts = time.ticks_ms()
+        self.read()
+        self.send(ts)
+        self.buttons()
+        self.receive()
+
+    def run(self):
+        while True:
+            t = time.ticks_ms()
+            self.step()
+            w = self.period_ms - time.ticks_diff(time.ticks_ms(), t)
+            if w > 0:
+                sleep(w)
@@ -0,0 +1,110 @@
+import time
+
+
+class Latency(object):
+    """
+    Command latency histograms, from radio to servo.
+
+    Stages of a motion command, timed on the robot:
+    - q: wait in the radio queue, estimated as (read time - sender's
+      running_time() stamp) minus the clock offset between the two boards.
+      Every wait is at least 0, so the offset is at most the smallest such
+      difference; a command read after a poll that found the queue empty
+      (see empty) arrived after that poll, so the offset is at least
+      (poll time - stamp). The largest lower bound is used when below the
+      upper one. The upper bound alone absorbs a queue that never drains,
+      as in idle and sleep when commands come faster than they are read
+    - d: radio read to handler dispatch
+    - w: dispatch to the first servo I2C write after it
+    - e: radio read to that servo write
+    Bucket k counts latencies of 2**(k-1) to 2**k ms (bucket 0: under 1 ms),
+    the last bucket everything longer. One command is timed at a time; a
+    command followed by no servo write within to_ms counts in n_miss.
+    """
+    STG = "qdwe"
+
+    def __init__(self, nb=9, to_ms=1000):
+        self.nb = nb                # buckets per histogram
+        self.h = [[0] * nb for _ in range(4)]  # histogram of each stage
+        self.to_us = to_ms * 1000   # longest dispatch to write time counted (us)
+        self.rx_us = 0              # read time of the last command (us)
+        self.c_rx = 0               # read time of the command being timed (us)
+        self.d_us = 0               # its dispatch time (us)
+        self.pend = False           # a timed command waits for a servo write
+        self.off = None             # clock offset estimate (read ms - sender ms - wait)
+        self.up = None              # smallest (read ms - sender ms) seen
+        self.lo = None              # largest (empty poll ms - sender ms) seen
+        self.e_ms = None            # time of the last poll that found the queue empty (ms)
+        self.o_sn = -1              # sender the offset belongs to
+        self.n_rx = 0               # commands read
+        self.n_miss = 0             # timed commands without a servo write in time
+
+    # count a latency in stage s
+    def add(self, s, us):
+        ms, k = us // 1000, 0
+        while ms and k < self.nb - 1:
+            ms >>= 1
+            k += 1
+        self.h[s][k] += 1
+
+    # a command was read from the radio
+    def rx(self, ts, sn):
+        """
+        Args:
+            ts (int): Sender's running_time() when sent (ms)
+            sn (int): Sender's serial number
+        """
+        self.rx_us = time.ticks_us()
+        o = time.ticks_diff(time.ticks_ms(), ts)
+        if sn != self.o_sn or self.up is None:
+            self.up, self.lo, self.o_sn = o, None, sn
+        self.n_rx += 1
+        if self.n_rx & 63 == 0:
+            # follow clock drift between the two boards
+            self.up += 1
+            if self.lo is not None:
+                self.lo -= 1
+        self.up = min(self.up, o)
+        if self.e_ms is not None:
+            l = time.ticks_diff(self.e_ms, ts)
+            self.lo = l if self.lo is None else max(self.lo, l)
+        self.off = self.lo if self.lo is not None and self.lo < self.up else self.up
+        self.add(0, (o - self.off) * 1000)
+
+    # a radio poll found the queue empty
+    def empty(self):
+        self.e_ms = time.ticks_ms()
+
+    # the handler of the last command read is called
+    def dispatch(self, timed):
+        t = time.ticks_us()
+        self.add(1, time.ticks_diff(t, self.rx_us))
+        if timed and not self.pend:
+            self.pend, self.c_rx, self.d_us = True, self.rx_us, t
+
+    # a servo was written while a command was timed
+    def wr(self):
+        t = time.ticks_us()
+        self.pend = False
+        w = time.ticks_diff(t, self.d_us)
+        if w > self.to_us:
+            self.n_miss += 1
+            return
+        self.add(2, w)
+        self.add(3, time.ticks_diff(t, self.c_rx))
+
+    # upper bound (ms) of the bucket holding percentile q of stage s
+    def pct(self, s, q):
+        h, c = self.h[s], 0
+        n = sum(h)
+        for k in range(self.nb):
+            c += h[k]
+            if c and c * 100 >= n * q:
+                return 1 << k
+        return 0
+
+    def clear(self):
+        for h in self.h:
+            for k in range(self.nb):
+                h[k] = 0
+        self.n_miss = 0
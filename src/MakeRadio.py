@@ -4,18 +4,34 @@ import radio
 
 
 class MakeRadio:
-    def __init__(self, g, power=6, queue=3, chan=7):
+    def __init__(self, g, power=6, queue=3, chan=7, sn=0):
         radio.config(
             group=g, data_rate=radio.RATE_1MBIT, channel=chan, power=power, queue=queue
         )
         radio.on()
         self.dal_header = b"\x01" + g.to_bytes(1, "little") + b"\x01"
+        self.q = queue  # receive queue length
+        self.sn = sn.to_bytes(4, "little")  # serial number sent in the header
+        self.r_ts = 0  # sender's running_time() of the last received packet
+        self.r_sn = 0  # sender's serial number of the last received packet
+        self.r_emp = False  # the last receive found the queue empty
         radio.off()
         radio.on()
 
+    def tune(self, g, chan):
+        radio.config(group=g, channel=chan)
+        self.dal_header = b"\x01" + g.to_bytes(1, "little") + b"\x01"
+
+    def drain(self):
+        # read and discard the queued packets, returning how many there were
+        for n in range(self.q + 1):
+            if radio.receive_bytes() is None:
+                return n
+        return self.q + 1
+
     def send_str(self, s):
         ts = running_time().to_bytes(4, "little")
-        sn = int(0).to_bytes(4, "little")
+        sn = self.sn
         nb = bytes(s, "utf8")
         nl = len(nb).to_bytes(1, "little")
         r_b = self.dal_header + int(2).to_bytes(1, "little") + ts + sn + nl + nb
@@ -25,9 +41,9 @@ class MakeRadio:
         if len(name) > 8:
             name = name[:8]
         ts = running_time().to_bytes(4, "little")
-        sn = int(0).to_bytes(4, "little")
+        sn = self.sn
         if  isinstance(value, int) and -2147483648 <= value <= 2147483647:
-            n = int(value).to_bytes(4, "little")
+            n = ustruct.pack("<i", value)  # signed, as parsed
             packet_type = int(1).to_bytes(1, "little")
         else:
             n = ustruct.pack("<d", value)
@@ -40,6 +56,7 @@ class MakeRadio:
 
     def receive_packet(self):
         d = radio.receive_bytes()
+        self.r_emp = d is None
         return self._parse_packet(d)
 
     def _parse_packet(self, d):
@@ -47,6 +64,8 @@ class MakeRadio:
             return None
         if d[:3] != self.dal_header:
             pass
+        self.r_ts = int.from_bytes(d[4:8], "little")
+        self.r_sn = int.from_bytes(d[8:12], "little")
         p_t = int.from_bytes(d[3:4], "little")
         if p_t == 5:  # value with float
             float_ = ustruct.unpack("<d", d[12:20])[0]
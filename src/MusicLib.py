@@ -1,3 +1,5 @@
+import time
+
 def ring_buffer_idx(m, icr, size):
     return (m + icr) % size
 
@@ -10,6 +12,9 @@ class MusicLib(object):
         self.last_idx = 0
         self.period = 500 # period of music beats, 500ms is the most possible period
         self.hits = 0 # number of measurements of current data collection bucket
+        self.p_ms = 500 # period in integer ms, for scheduling
+        self.beat_ts = 0 # estimated time of the last detected beat (ms)
+        self.strength = 0 # loudness of the last beat in % of the average loudness
 
     # check if it is a beat, compute music period, and update the loudness threshold
     def is_a_beat(self, timestamp, loudness, snr: float, sample_ms=125):
@@ -43,6 +48,9 @@ class MusicLib(object):
                         # new beat detected as the nearest full bucket
                         self.loud_thr = self.buf[c_idx] * 0.9
                         is_a_beat = True
+                        # the beat was at the middle of bucket c_idx, two buckets ago
+                        self.beat_ts = (timestamp // sample_ms - 2) * sample_ms + sample_ms // 2
+                        self.strength = int(self.buf[c_idx] * 100 / avg_loudness)
                 c_idx = nl # move to previous bucket
             if c > 0:
                 #self.period = (self.period * 9 + sample_ms * length / c) * 0.1
@@ -52,5 +60,12 @@ class MusicLib(object):
                 smooth_factor = 0.1 if 0.8 < period_ratio < 1.2 else 0.05
                 self.period = (self.period * (1.0 - smooth_factor) + 
                               new_period * smooth_factor)
+                self.p_ms = int(self.period)
                 #print("Music period: ", self.period, is_a_beat, c, sample_ms, avg_loudness, self.loud_thr, self.loud)
         return is_a_beat
+
+    # predict the next beat, or the next 1/div subdivision of a beat, after ts
+    def next_beat(self, ts, div=1):
+        st = max(1, self.p_ms // div)
+        n = time.ticks_diff(ts, self.beat_ts) // st + 1
+        return time.ticks_add(self.beat_ts, n * st)
@@ -1,7 +1,8 @@
 
 class Parameters(object):
-    def __init__(self):
-        self.w_t, self.j_t, self.l_s = 16, 27, 45
+    def __init__(self, w_t=16, j_t=27, l_s=45, pk=None):
+        # pose shape: walking tilt, jumping tilt and leg swing angles (degrees)
+        self.w_t, self.j_t, self.l_s = w_t, j_t, l_s
         # degrees of freedom    
         self.dof = 6
         # servo error 
@@ -18,12 +19,23 @@ class Parameters(object):
         self.ep_dis = [500.0] * self.ep_size
         self.ep_mid2 = int(self.ep_size * 0.5)
         self.ep_mid1 = max(0, self.ep_mid2 - 1)
+        # pose tables and sequences from a pose pack (PosePack) instead of those below
+        if pk is not None:
+            self.load_pack(pk)
+            return
         # the list of poses for forward and backward walking
         self.walk_fw_sts, self.walk_bw_sts = [2, 3, 4, 5], [6, 5, 7, 3]
         # the list of poses for forward and backward skating
         self.skate_fw_sts, self.skate_bw_sts = [8, 9, 10, 11], [12, 1, 13, 9]
         # the list of safe poses for dancing
         self.dance_ok = [0, 2, 3, 4, 5, 8, 9, 10, 11, 12, 13, 14, 16, 17]
+        # dance routines, each preferred after the pose it is keyed by
+        self.dance_rt = {
+            14: [0, 15, 15, 15, 15, 0, 0, 0, 3, 5, 3],  # ballet
+            0: [0, 19, 0, 18, 0, 3],      # side-to-side movement
+            5: [3, 5, 2, 5, 3],           # quick steps
+            16: [17, 16, 17, 16, 17]      # rocking motion
+        }
         w_t, l_s, j_t = self.w_t, self.l_s, self.j_t
         # servo targets for each pose
         self.st_tg = [
@@ -118,4 +130,29 @@ class Parameters(object):
             [5, 1, 5, 1, 1, 2], # 8
             [1, 1, 2, 1, 1, 1], # 9
             [6, 2, 6, 2, 1, 1] # 10
-        ]
\ No newline at end of file
+        ]
+
+    # take pose tables and named sequences from a pose pack
+    def load_pack(self, pk):
+        """
+        Use the poses, speed vectors, dict_sp and sequences of a pose pack.
+        Pose and speed rows are read from the pack file when used; a pack
+        may add poses, sequences and dance routines ("dance_rt.<pose>").
+
+        Args:
+            pk (PosePack): Pose pack
+        """
+        self.st_tg = pk.poses()
+        self.st_spu = pk.speeds()
+        self.dict_sp = pk.sp_map()
+        self.dance_rt = {}
+        for n in pk.seqs:
+            if n[:9] == "dance_rt.":
+                self.dance_rt[int(n[9:])] = pk.seqs[n]
+            else:
+                setattr(self, n, pk.seqs[n])
+
+    # keep pose i resident when poses come from a pack, as it is changed at run time
+    def pin(self, i):
+        if type(self.st_tg) is not list:
+            self.st_tg.keep.add(i)
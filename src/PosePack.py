@@ -0,0 +1,154 @@
+import ustruct
+
+PK_FILE = "poses.pk"
+PK_MAGIC = b"PUPK"
+PK_VER = 1
+# magic, version, degrees of freedom, poses, speed vectors, sequences, checksum of the rest
+PK_HDR = "<4sBBBBBH"
+PK_HSZ = 11
+PK_SPU = 20       # speed vector units per 1.0 (0.05 resolution)
+PK_NONE = 255     # dict_sp entry of a pose without a speed vector
+# named sequences of Parameters; dance routines are stored as "dance_rt.<pose>"
+PK_SEQS = ("walk_fw_sts", "walk_bw_sts", "skate_fw_sts", "skate_bw_sts", "dance_ok")
+
+
+class PosePack(object):
+    """
+    Pose pack: pose targets, speed vectors, the pose to speed vector map
+    (dict_sp) and named pose sequences in one binary file, built on the
+    host (utils.posepack) from Parameters.
+
+    Layout after the header: poses (one byte per servo angle), speed
+    vectors (one byte per servo, in 1/PK_SPU), dict_sp (one byte per pose,
+    PK_NONE if the pose has none), then each sequence as a name length,
+    name, length and pose indices. The header, map and sequences are read
+    when the pack is opened; pose and speed rows are read from the file when
+    first used (see PackRows), or a whole table at once for what is built
+    from it at boot (see PackRows.all).
+
+    Args:
+        fn (str): Pack file
+
+    Raises:
+        ValueError: If the file is not a valid pack
+    """
+    def __init__(self, fn=PK_FILE):
+        with open(fn, 'rb') as f:
+            b = f.read()
+        m, v, self.dof, self.n_pose, self.n_spu, n_seq, ck = ustruct.unpack_from(PK_HDR, b)
+        if m != PK_MAGIC or v != PK_VER or ck != sum(b[PK_HSZ:]) & 0xFFFF:
+            raise ValueError("bad pose pack")
+        self.fn = fn
+        self.o_spu = PK_HSZ + self.n_pose * self.dof  # offset of the speed vectors
+        o = self.o_spu + self.n_spu * self.dof
+        self.sp_of = b[o:o + self.n_pose]  # speed vector of each pose
+        o += self.n_pose
+        self.seqs = {}              # name -> pose indices
+        for _ in range(n_seq):
+            n = b[o]
+            name = str(b[o + 1:o + 1 + n], 'ascii')
+            o += 1 + n
+            self.seqs[name] = list(b[o + 1:o + 1 + b[o]])
+            o += 1 + b[o]
+        self.buf = bytearray(16)    # scratch buffer for skipping through the file
+        self.n_op = 0               # times the file was opened for rows
+
+    # read n rows from row i of the table at offset off, scaled down by sc
+    def rows(self, off, i, n, sc):
+        self.n_op += 1
+        with open(self.fn, 'rb') as f:
+            k = off + i * self.dof
+            while k > 0:
+                m = f.readinto(memoryview(self.buf)[:min(k, len(self.buf))])
+                if not m:
+                    break
+                k -= m
+            d = f.read(n * self.dof)
+        w = self.dof
+        return [[x / sc for x in d[k:k + w]] if sc > 1 else list(d[k:k + w]) for k in range(0, len(d), w)]
+
+    # read row i of the table at offset off, scaled down by sc
+    def row(self, off, i, sc):
+        return self.rows(off, i, 1, sc)[0]
+
+    # pose targets (st_tg), read lazily
+    def poses(self, cap=8):
+        return PackRows(self, PK_HSZ, self.n_pose, 1, cap)
+
+    # speed vectors (st_spu), read lazily
+    def speeds(self, cap=4):
+        return PackRows(self, self.o_spu, self.n_spu, PK_SPU, cap)
+
+    # speed vector of each pose (dict_sp)
+    def sp_map(self):
+        return PackMap(self.sp_of)
+
+
+class PackRows(object):
+    """
+    Table of a pose pack, indexed like the list of rows it replaces.
+
+    Rows are read from the file when first used. At most cap rows are kept;
+    the least recently used row that is not pinned (keep) makes room, so
+    what stays resident is the sequence being moved through. Rows changed at
+    run time are pinned so the change is not lost.
+    """
+    def __init__(self, pk, off, n, sc, cap):
+        self.pk = pk
+        self.off = off              # file offset of row 0
+        self.n = n                  # rows
+        self.sc = sc                # stored units per 1.0
+        self.cap = cap              # rows kept resident
+        self.rows = {}              # index -> resident row
+        self.t = {}                 # index -> access count at its last use
+        self.k = 0                  # accesses
+        self.keep = set()           # pinned rows
+        self.n_rd = 0               # rows read from the file
+
+    def __len__(self):
+        return self.n
+
+    # every row, read in one pass and not kept resident (for tables built at boot)
+    def all(self):
+        r = self.pk.rows(self.off, 0, self.n, self.sc)
+        self.n_rd += self.n
+        for i in self.keep:
+            if i in self.rows:
+                r[i] = self.rows[i]  # changed at run time
+        return r
+
+    def __getitem__(self, i):
+        self.k += 1
+        r = self.rows.get(i)
+        if r is None:
+            if not 0 <= i < self.n:
+                raise IndexError(i)
+            if len(self.rows) >= self.cap:
+                o = -1
+                for j in self.rows:
+                    if j not in self.keep and (o < 0 or self.t[j] < self.t[o]):
+                        o = j
+                if o >= 0:
+                    del self.rows[o], self.t[o]
+            r = self.rows[i] = self.pk.row(self.off, i, self.sc)
+            self.n_rd += 1
+        self.t[i] = self.k
+        return r
+
+
+class PackMap(object):
+    """dict_sp of a pose pack: the speed vector of each pose, one byte per pose."""
+    def __init__(self, b):
+        self.b = b
+
+    def get(self, i, d=None):
+        v = self.b[i] if 0 <= i < len(self.b) else PK_NONE
+        return d if v == PK_NONE else v
+
+
+# the pose pack in fn, or None if there is none or it is invalid
+def load_pack(fn=PK_FILE):
+    try:
+        return PosePack(fn)
+    except Exception:
+        return None
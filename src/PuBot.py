@@ -1,5 +1,4 @@
 from microbit import *
-import speech
 import math
 import random
 import time
@@ -9,13 +8,40 @@ from MakeRadio import *
 from MusicLib import *
 from HCSR04 import *
 from Parameters import *
-from Content import *
+from Config import *
+from Balance import *
+from Choreo import *
+from StateMachine import *
+from ErrorLog import *
+from Chunks import *
+from BeatSync import *
+from ChanScan import *
+from Tune import *
+from PosePack import *
+import machine
 import os
 import gc
 
-pr = Parameters()
+pr = Parameters(pk=load_pack())  # pose tables from poses.pk if present
 wk = WK()
 
+# robot states
+ST_FALL = -3      # fallen over, waiting to be stood up
+ST_FETAL = -2     # free fall, curled up
+ST_SLEEP = -1     # asleep after a long idle time
+ST_IDLE = 0
+ST_EXPLORE = 1
+ST_JUMP = 2
+ST_DANCE = 3
+ST_KICK = 4
+ST_JOY = 5        # driven by the joystick
+
+# main loop stages, for error accounting
+STAGES = ("tick", "radio", "sense", "state", "led", "tlm", "boot")
+
+# commands whose latency to the next servo write is timed
+MOVE_CMDS = ("#puspeed", "#puturn", "#puroll", "#pupitch", "#puB", "#purs")
+
 class RobotPu(object):
     """
     Main class representing the RobotPu robot.
@@ -41,9 +67,6 @@ class RobotPu(object):
         self.name = name          # User-assigned robot name
         self.sn = sn              # Unique serial number for the robot
         
-        # State machine control
-        self.gst = 0              # Current state machine state index
-        
         # Motion control parameters
         self.last_cmd_ts = 0      # Timestamp of last received command (ms)
         self.fw_sp = 4         # Forward speed multiplier
@@ -59,6 +82,8 @@ class RobotPu(object):
         self.alt_l = 10           # Alert level (sensitivity to environment)
         self.alt_sc = 0.9         # Alert decay rate (0-1)
         self.r_st = 26            # Index of rest state in state machine
+        self.id_ts = time.ticks_ms()  # Time of the last idle update (ms)
+        pr.pin(self.r_st)         # The rest pose is changed at run time
         
         # IMU and balance control
         self.bd_pth = 0.0         # Current body pitch (degrees)
@@ -71,6 +96,17 @@ class RobotPu(object):
         self.g_thr = 2000         # Acceleration threshold for fall detection
         self.max_pth_ctl = 15.0   # Maximum allowed pitch control output
         self.max_rl_ctl = 15.0    # Maximum allowed roll control output
+        self.dt = 0.02            # Time since the last balance update (s)
+        self.bp_us = time.ticks_us()  # Timestamp of the last balance update (us)
+        self.f_rl = LowPass(0.18)     # Body roll filter (bd_rl2)
+        self.f_pth = LowPass(0.18)    # Body pitch filter (bd_pth2)
+        self.b_wr = Balance(0.8)      # Walk roll: tilt offsets of the standing leg
+        self.b_hd = Balance(2.0, lo=-180.0, hi=25.0)           # Walk head pitch compensation
+        self.b_rr = Balance(1.0, lo=-35.0, hi=35.0, db=5.0)    # Rest roll
+        self.b_rp = Balance(1.0, lo=-180.0, hi=180.0, db=12.0) # Rest head pitch
+        self.b_dr = Balance(0.8, lo=-12.0, hi=12.0, db=8.0)    # Dance roll
+        self.bc_r = self.b_wr     # Roll controller active this tick (telemetry)
+        self.bc_p = self.b_hd     # Pitch controller active this tick (telemetry)
         
         # Exploration behavior parameters
         self.ep_sp = 0.0          # Exploration speed
@@ -82,7 +118,6 @@ class RobotPu(object):
         
         # Fall recovery tracking
         self.fell_count = 0       # Number of falls detected
-        self.last_state = 0       # State before falling
         
         # Timing and synchronization
         self.t_c = 0              # Last command timestamp
@@ -90,31 +125,53 @@ class RobotPu(object):
         self.r_o_t = 0            # Right tilt offset
         
         # Dance behavior configuration
-        self.d_st = [0]           # Current dance state
-        self.d_dict = {           # Predefined dance routines
-            14: [0, 15, 15, 15, 15, 0, 0, 0, 3, 5, 3],  # ballet
-            0: [0, 19, 0, 18, 0, 3],      # Side-to-side movement
-            5: [3, 5, 2, 5, 3],           # Quick steps
-            16: [17, 16, 17, 16, 17]      # Rocking motion
-        }
+        self.chor = Choreo(pr, pr.dance_rt)  # Beat-scheduled dance moves
         self.d_sp = 1.5           # Dance speed multiplier
-        self.last_low_b = 0       # Timestamp of last low beat
-        self.last_high_b = 0      # Timestamp of last high beat
+        self.d_sp0 = 1.5          # Dance speed multiplier when a dance starts
         self.dance_l_itv = 12     # Left/right wiggle angle (degrees)
         self.dance_u_itv = 15     # Up/down wiggle angle (degrees)
+        self.d_ix = [0, 1, 2, 3, 4, 5]  # Servos driven by the dance balance
+        self.d_ct = [0.0] * 6     # Their control offsets, reused every tick
         
         # Audio and speech
-        self.s_list = []          # Phoneme list for speech synthesis
+        self.s_list = []          # Phoneme list for speech synthesis (legacy #pus segments)
+        self.chk = Chunks()       # Reassembly of chunked songs and speech (#puk)
+        self._c = None            # Speech content manager, loaded on first use
+        
+        # Boot
+        self.cfg_ok = False       # Whether a valid config (trims) was loaded
+        self.intro_p = False      # Intro deferred until the control loop is up
+        self.boot_ms = 0          # Time from power-on to the first control tick (ms)
         
         # Radio communication
         self.groupID = 166        # Default radio group ID
+        self.chan = 7             # Radio channel
+        self.cs = ChanScan()      # Congestion scan of channels and groups
+        self.st_ts = 0            # Time of the last state update (ms)
+        self.uid = int.from_bytes(machine.unique_id()[-4:], "little") & 0x7fffffff or 1  # Radio serial number
+        
+        # Power
+        self.duty = 1.0           # Fraction of loop time spent busy (moving average)
+        self.busy_ms = 0          # Busy time of the last loop iteration (ms)
+        self.sl_a = (0, 0, -1024) # Gravity vector when falling asleep
+        
+        # Errors
+        self.stg = 0              # Main loop stage being run (index into STAGES)
+        self.err = ErrorLog(STAGES)  # Error counts, rate-limited logging and backoff
+        
+        # Telemetry
+        self.tk = 0               # Control tick counter
+        self.tl = 0               # Telemetry report period in ticks (0 = off)
         
         # Initialize hardware components
-        self.read_config()        # Load configuration from file
-        self.c = Content()        # Speech content manager
+        self.cfg = Config()       # Binary config store
+        self.tn = Tune(self, pr)  # Parameters tuned over the radio
+        self.cfg_ok = self.read_config()  # Load configuration from file
         self.music = MusicLib()   # Music and sound effects
+        self.bs = BeatSync(self.music, self.uid)  # Beat grid shared with other robots
         self.sonar = HCSR04()     # Ultrasonic distance sensor
         self.np = neopixel.NeoPixel(pin16, 4)  # LED control
+        wk.an.attach(self.np)     # NeoPixels are written by the animation engine
         
         # Initialize communication
         self.set_group(self.groupID)
@@ -125,17 +182,18 @@ class RobotPu(object):
         microphone.set_threshold(SoundEvent.LOUD, self.sound_threshold)
         speaker.on()              # Enable speaker
         
-        # State index to function mapping
-        self.st_dict = {
-            -3: self.fall,
-            -2: self.fetal,
-            0: self.idle,
-            1: self.explore,
-            2: self.jump,
-            3: self.dance,
-            4: self.kick,
-            5: self.joystick
-        }
+        # State table: update function, entry hook, exit hook, update period (ms)
+        self.sm = StateMachine({
+            ST_FALL: (self.fall, None, None, 0),
+            ST_FETAL: (self.fetal, None, None, 0),
+            ST_SLEEP: (self.sleep, self.sleep_in, self.sleep_out, 500),
+            ST_IDLE: (self.idle, None, None, 100),
+            ST_EXPLORE: (self.explore, self.explore_in, None, 0),
+            ST_JUMP: (self.jump, None, None, 0),
+            ST_DANCE: (self.dance, self.dance_in, None, 0),
+            ST_KICK: (self.kick, None, None, 0),
+            ST_JOY: (self.joystick, None, None, 0)
+        }, ST_IDLE, ST_SLEEP)
         
         # Radio command to function mapping
         self.cmd_dict = {
@@ -145,53 +203,88 @@ class RobotPu(object):
             "#pupitch" : self.pitch,
             "#puB" : self.button,
             "#pulogo" : self.logo,
-            "#purs" : self.pose
+            "#purs" : self.pose,
+            "#putl" : self.set_tl,
+            "#puerr" : self.report_err,
+            "#pulat" : self.report_lat,
+            "#pubus" : self.report_bus,
+            "#puscan" : self.scan
         }
 
-    # read config from the pu.txt file
+    # read config from the binary config store, migrating pu.txt if needed
     def read_config(self):
         """
-        Load robot configuration from 'pu.txt' file.
+        Load robot configuration from the binary config store.
         
-        The configuration file should contain three lines:
+        The record holds the serial number, group ID, servo trims and the
+        gait gains fw_sp, bw_sp, max_rl_ctl and g_thr. A legacy three-line
+        'pu.txt' (as copied by flash_microbit.py) overrides the stored serial
+        number, group ID and trims, is converted into the store and removed:
         1. Serial number (string)
         2. Group ID (integer)
         3. Comma-separated list of servo trim values (floats)
         
-        If the file is missing or corrupted, default values will be used.
+        If neither is valid, default values will be used.
+        
+        Returns:
+            bool: True if the configuration was read successfully
+        """
+        d = self.cfg.load()
+        if d is not None:
+            self.sn, self.groupID, t, g, ps = d
+            self.fw_sp, self.bw_sp, self.max_rl_ctl, self.g_thr = g
+            self.set_trims(t)
+            self.tn.load(ps)
+        o = self.cfg.load_txt()
+        if o is not None:
+            self.sn, self.groupID, t = o
+            self.set_trims(t)
+            if self.write_config():
+                os.remove("pu.txt")
+        # Continue with default values if config can't be read
+        return d is not None or o is not None
+
+    # copy trim values, preserving extra items in the trim vector
+    def set_trims(self, t):
+        for i in range(min(len(pr.s_tr), len(t))):
+            pr.s_tr[i] = t[i]
+
+    # save config to the binary config store
+    def write_config(self):
+        """
+        Save current configuration to the binary config store.
+        
+        The configuration includes:
+        - Robot serial number
+        - Current group ID
+        - Servo trim values
+        - Gait gains (fw_sp, bw_sp, max_rl_ctl, g_thr)
+        - Parameters tuned over the radio (see param)
+        
+        Returns:
+            bool: True if the record was written
         """
         try:
-            with open("pu.txt", 'r') as f:
-                c = f.read().split('\n')
-                self.sn = c[0]
-                self.groupID = int(c[1])
-                t = [float(i) for i in c[2].split(',')]
-                # Copy elements from a into b, preserving extra items in b
-                for i in range(min(len(pr.s_tr), len(t))):
-                    pr.s_tr[i] = t[i]
-        except Exception:
-            # Silently continue with default values if config can't be read
-            pass
-
-    #
-    # def write_config (self):
-    #     """
-    #     Save current configuration to 'pu.txt' file.
-    #     
-    #     The configuration includes:
-    #     - Robot serial number
-    #     - Current group ID
-    #     - Servo trim values
-    #     """
-    #     try:
-    #         microfs.rm('pu.txt')
-    #         #os.remove('pu.txt')
-    #     except:
-    #         print("pu.txt not found")
-    #     with open("pu.txt", 'w') as f:
-    #         f.write(self.sn + "\n")
-    #         f.write(str(self.groupID) + "\n")
-    #         # f.write(','.join([str(i) for i in self.p.s_tr]))
+            self.cfg.save(self.sn, self.groupID, pr.s_tr,
+                          [self.fw_sp, self.bw_sp, self.max_rl_ctl, self.g_thr],
+                          sorted(self.tn.ch.items()))
+            return True
+        except OSError as e:
+            print(e)
+            return False
+
+    # current state, changed only through self.sm.go
+    @property
+    def gst(self):
+        return self.sm.st
+
+    # speech content, loaded on first use to keep boot fast
+    @property
+    def c(self):
+        if self._c is None:
+            from Content import Content
+            self._c = Content()
+        return self._c
 
     # set radio channel
     def set_group(self, g):
@@ -203,7 +296,7 @@ class RobotPu(object):
         """
         self.groupID = g
         self.show_channel()
-        self.ro = MakeRadio(self.groupID)
+        self.ro = MakeRadio(self.groupID, chan=self.chan, sn=self.uid)
 
     # show radio channel on the microbit display
     def show_channel(self):
@@ -248,7 +341,7 @@ class RobotPu(object):
         self.talk("My name is " + self.sn + " " + self.name)
 
     # calibrate the robot
-    def calibrate(self):
+    def calibrate(self, fast=False):
         """
         Run the robot's calibration routine.
         
@@ -257,11 +350,20 @@ class RobotPu(object):
         2. Makes the robot introduce itself
         3. Flashes the eyes three times for visual feedback
         4. Returns to a neutral standing position
+        
+        Args:
+            fast (bool): If a valid trim was loaded, go straight to the neutral
+                position and defer the intro until the control loop is running
         """
+        if fast and self.cfg_ok:
+            wk.servo_move(0, pr)
+            self.intro_p = True
+            return
         wk.servo_move(25, pr)  # Move to calibration position
         self.intro()
         for i in range(3):
-            wk.flash(1020)  # Bright flash
+            wk.an.eye_set(1023 * (1 - i % 2), 1023 * (i % 2))  # Alternate the eyes
+            wk.an.update()
             sleep(500)      # Half second delay between flashes
         wk.eyes_ctl(1)      # Turn eyes on
         wk.servo_move(0, pr)  # Return to neutral position
@@ -337,10 +439,10 @@ class RobotPu(object):
         self.balance_param()
         
         if wk.pos < 2 or wk.pos == 6:  # left side
-            self.l_o_t = min(self.max_rl_ctl, max(0.0, self.bd_rl*0.8 - pr.w_t))
+            self.l_o_t = self.b_wr.update(self.bd_rl, self.dt, -pr.w_t, 0.0, self.max_rl_ctl)
             lf = -12 * di
         else:  # right side
-            self.r_o_t = max(-self.max_rl_ctl, min(0.0, self.bd_rl*0.8 + pr.w_t))
+            self.r_o_t = self.b_wr.update(self.bd_rl, self.dt, pr.w_t, -self.max_rl_ctl, 0.0)
             lf = 12 * di
             
         # Calculate overall tilt compensation
@@ -350,8 +452,11 @@ class RobotPu(object):
         sp /= 1.0 + 0.01 * (abs(self.bd_rl) + abs(self.bd_pth))+ math.sqrt(math.fabs(o_t * 0.5))
         
         # Apply control to servos
+        self.bc_r, self.bc_p = self.b_wr, self.b_hd
         self.set_ct([0, 1, 2, 3, 4, 5],
-                   [o_t, lf - o_t, o_t, -lf - o_t, -40 * di - o_t, min(25.0, -2.0 * self.bd_pth2)])
+                   [o_t, lf - o_t, o_t, -lf - o_t, -40 * di - o_t, self.b_hd.update(-self.bd_pth2, self.dt)])
+        if wk.spl:
+            return wk.move_spline(pr, sts, [0, 1, 2, 3], sp, [4, 5], sp)
         return self.move(sts, [0, 1, 2, 3], sp, [4, 5], sp)
 
     # calculate balance parameters from IMU data
@@ -363,8 +468,12 @@ class RobotPu(object):
         1. Gets current accelerometer readings
         2. Calculates pitch and roll angles
         3. Updates body orientation
-        4. Applies low-pass filtering to smooth readings
+        4. Applies low-pass filtering to smooth readings, using the time
+           since the previous update so filtering does not depend on loop rate
         """
+        t = time.ticks_us()
+        self.dt = min(0.1, time.ticks_diff(t, self.bp_us) * 1e-6)
+        self.bp_us = t
         a = accelerometer.get_values()
         self.pth = math.degrees(math.atan2(a[1], -a[2]))
         self.max_g = math.sqrt(sum(x * x for x in a))
@@ -376,20 +485,22 @@ class RobotPu(object):
         
         # Update filtered body orientation with low-pass filter
         self.bd_rl = bd_p * math.sin(servo_lft) + self.rl * math.cos(servo_lft)
-        self.bd_rl2 = (self.bd_rl + 9 * self.bd_rl2) * 0.1  # Low-pass filter
+        self.bd_rl2 = self.f_rl.update(self.bd_rl, self.dt)  # Low-pass filter
         
         self.bd_pth = bd_p * math.cos(servo_lft) - self.rl * math.sin(servo_lft)
-        self.bd_pth2 = (self.bd_pth + 9 * self.bd_pth2) * 0.1  # Low-pass filter
+        self.bd_pth2 = self.f_pth.update(self.bd_pth, self.dt)  # Low-pass filter
 
     # make the robot rest
     def rest(self):
         self.balance_param()
-        rl = min(35.0, max(-35.0, self.bd_rl2))
-        if abs(rl)> 5:
+        self.bc_r, self.bc_p = self.b_rr, self.b_rp
+        rl = self.b_rr.update(self.bd_rl2, self.dt)
+        if rl:
             self.set_ct([0, 1, 2, 3, 4],
                        [rl, rl * -1.0, rl, rl * -1.0, rl * -0.5])
-        if math.fabs(self.bd_pth2) > 12:
-            self.set_ct([5], [-self.bd_pth2])
+        pt = self.b_rp.update(-self.bd_pth2, self.dt)
+        if pt:
+            self.set_ct([5], [pt])
         sl = microphone.sound_level()
         pr.st_tg[self.r_st][5]=90-sl*0.3
         return self.move([self.r_st], [0, 1, 2, 3, 4, 5],
@@ -460,6 +571,11 @@ class RobotPu(object):
         # apply low-pass filter to speed
         self.ep_sp = (self.ep_sp+min(self.fw_sp, (dis + 5) * 0.8) if dis >= 0 else max(self.bw_sp, (dis - 5) * 0.6))*0.5
 
+    # entering explore: start walking straight ahead
+    def explore_in(self):
+        self.ep_sp = 4.0
+        self.ep_di = 0.0
+
     # make the robot explore with self-balance
     def explore(self):
         # get current point cloud index
@@ -473,37 +589,43 @@ class RobotPu(object):
     # make the robot do random LED light show
     def random_light(self):
         for p in range(0, 4):
-            self.np[p] = (random.randint(0, 128), random.randint(0, 128), random.randint(0, 128))
-        self.np.show()
+            wk.an.px_set(p, random.randint(0, 128), random.randint(0, 128), random.randint(0, 128))
+    # entering dance: start at a moderate speed
+    def dance_in(self):
+        self.d_sp = self.d_sp0
+
     # make the robot dance with self-balance
     def dance(self):
         ts = time.ticks_ms()
         ms = microphone.sound_level()
-        il = self.music.is_a_beat(ts, ms, 1.1)
-        if ts - self.last_high_b > self.music.period * 0.5:
+        beat = self.music.is_a_beat(ts, ms, 1.1)
+        self.bs.update(ts, beat)
+        ev = self.chor.update(ts, self.bs, beat)
+        v = self.bs.tx(ts)
+        if v is not None:
+            self.ro.send_value("#pubt", v)  # share the beat grid with other robots
+        if ev & 1:
+            # wiggle on every half beat
             self.dance_l_itv *= -1
             self.dance_u_itv *= -1
             self.random_light()
-            self.last_high_b = ts
-        if il and ts - self.last_low_b > self.music.period * random.randint(8, 16):
-            self.d_st = self.d_dict.get(self.d_st[-1], [random.choice(pr.dance_ok)])
-            self.last_low_b = ts
         self.balance_param()
-        ft = min(12.0, max(-12.0, self.rl * 0.8 + self.dance_l_itv * 0.2))
-        if math.fabs(ft)<8:
-            ft =0
+        self.bc_r = self.b_dr
+        ft = self.b_dr.update(self.rl, self.dt, self.dance_l_itv * 0.2)
         lt = ft + self.dance_l_itv
-        self.set_ct([0, 1, 2, 3, 4, 5], [ft, lt, ft, lt, self.rl, self.dance_u_itv-ms*0.001])
+        c = self.d_ct
+        c[0], c[1], c[2], c[3], c[4], c[5] = ft, lt, ft, lt, self.rl, self.dance_u_itv - ms * 0.001
+        self.set_ct(self.d_ix, c)
         self.d_sp = min(2.5, self.d_sp * 1.015)
         if self.max_g > 1800:
             self.d_sp *= 0.9
-        return self.move(self.d_st, [0, 1, 2, 3], self.d_sp, [4, 5], self.d_sp)
+        return self.move(self.chor.cur, [0, 1, 2, 3], self.d_sp, [4, 5], self.d_sp)
 
     # make the robot jump
     def jump(self):
         md = self.move([24, 14, 0, 0], [0, 1, 2, 3], 3, [4, 5], 2)
         if md == 0 and wk.pos == 3:
-            self.gst = 5
+            self.sm.go(ST_JOY)
             wk.servo(6, 0)
         else:
             wk.servo(6, 100)
@@ -512,29 +634,35 @@ class RobotPu(object):
     def kick(self):
         md = self.move(pr.walk_fw_sts, [0, 1, 2, 3], 3, [4, 5], 2)
         if md == 0 and (wk.pos == 0 or wk.pos == 2):
-            self.gst = 5
+            self.sm.go(ST_JOY)
 
     # make the robot talk
     def talk(self, t):
+        import speech
         speech.say(t, speed=90, pitch=35, throat=225, mouth=225)
 
     # make the robot sing
     def sing(self, s):
+        import speech
         speech.sing(s, speed=90, pitch=35, throat=225, mouth=225)
 
     # make the robot idle
     def idle(self):
-        if random.randint(0, 100) == 0:
+        # the odds below were tuned per ref_hz tick; scale them to the time since the last update
+        t = time.ticks_ms()
+        k = min(10, max(1, time.ticks_diff(t, self.id_ts) * wk.ref_hz // 1000))
+        self.id_ts = t
+        if random.randint(0, 100) < k:
             # decrease alert level to sleep
             self.alt_l *= self.alt_sc
         self.check_wakeup()
         if self.rest() == 0:
             sl = microphone.sound_level()
             self.sound_threshold = (self.sound_threshold * 24 + sl) * 0.04
-            if random.randint(0, 1000) == 0:
+            if random.randint(0, 1000) < k:
                 self.alt_l -= 2
                 self.ro.send_str("#puhi, " + self.sn + " " + self.name)
-            if random.randint(0, 280- sl)== 0 or sl> self.sound_threshold*3:
+            if random.randint(0, 280- sl) < k or sl> self.sound_threshold*3:
                 pr.st_tg[26][4] = random.randint(30, 160) #min(160, max(20, self.p.st_tg[26][4]+random.randint(-10, 10)))
                 pr.st_tg[26][5] = random.randint(40, 105) #min(115, max(30, self.p.st_tg[26][5]+random.randint(-10, 10)))
             #if sl> self.sound_threshold*8:
@@ -542,12 +670,31 @@ class RobotPu(object):
 
     # make the robot sleep
     def sleep(self):
-        self.balance_param()
-        self.stand()
+        """
+        Wait for a wake event with the servos relaxed and the lights off.
+        
+        Runs at the slow sleep cadence. Loud sounds and shakes are latched by
+        the micro:bit between checks, so none are missed; a pick-up is seen
+        as a change of the gravity vector since falling asleep.
+        """
+        a = accelerometer.get_values()
+        if (microphone.was_event(SoundEvent.LOUD) or accelerometer.was_gesture("shake")
+                or abs(a[0] - self.sl_a[0]) + abs(a[1] - self.sl_a[1]) + abs(a[2] - self.sl_a[2]) > 300):
+            self.alt_l = 10
+            self.sm.go(ST_IDLE)
+
+    # entering sleep: relax the servos, lights off, clear latched wake events
+    def sleep_in(self):
         wk.eyes_ctl(0)
-        self.np.clear()
-        if self.check_wakeup() == 1:
-            self.gst = 0
+        wk.an.px_fill(0, 0, 0)
+        wk.relax(pr)
+        microphone.was_event(SoundEvent.LOUD)
+        accelerometer.was_gesture("shake")
+        self.sl_a = accelerometer.get_values()
+
+    # leaving sleep: eyes on
+    def sleep_out(self):
+        wk.eyes_ctl(1)
 
     # make the robot deal with fall
     def fall(self):
@@ -574,7 +721,7 @@ class RobotPu(object):
             self.alt_l = 10
             return 1
         if self.alt_l < 1:
-            self.gst = -1
+            self.sm.go(ST_SLEEP)
         return 0
 
     # make the robot talk automatically
@@ -599,10 +746,10 @@ class RobotPu(object):
     def speed (self, v:float):
         if v > 0.2:
             self.sp = v * self.fw_sp
-            self.gst = 5
+            self.sm.go(ST_JOY)
         elif v < -0.2:
             self.sp = -v * self.bw_sp
-            self.gst = 5
+            self.sm.go(ST_JOY)
         else:
             self.sp = 0
 
@@ -621,25 +768,22 @@ class RobotPu(object):
     # switch robot state with buttion events
     def button(self, v:int):
         if v == 0:
-            self.gst = 0
+            self.sm.go(ST_IDLE)
             self.h_u_bias = 0
             self.h_l_bias = 0
             self.talk("Rest!")
             self.ro.send_str("#puack")
         elif v == 1:
             self.talk("Exploring")
-            self.ep_sp = 4.0
-            self.ep_di = 0.0
-            self.gst = 1
+            self.sm.go(ST_EXPLORE, True)  # pressed again: restart at the initial speed
         elif v == 2:
-            self.gst = 2
+            self.sm.go(ST_JUMP)
         elif v == 3:
             self.talk("Dance!")
-            self.d_sp = 1.5
-            self.gst = 3
+            self.sm.go(ST_DANCE, True)
         elif v == 4:
             # self.talk("Kick!")
-            self.gst = 4
+            self.sm.go(ST_KICK)
 
     # robot actions when the logo button is pressed
     def logo (self, v):
@@ -648,7 +792,8 @@ class RobotPu(object):
     # control the pose of the robot during rest
     def pose (self, v:int):
         self.r_st = v
-        self.gst = 0
+        pr.pin(v)
+        self.sm.go(ST_IDLE)
         self.rest()
 
     # publish robot status code via radio
@@ -662,26 +807,74 @@ class RobotPu(object):
         
         Handles various command formats:
         - "#put[text]": Make the robot speak the given text
+        - "#puk[chunk]": Chunk of a long song ('s') or speech text ('t'); the
+          robot sings or speaks once all chunks of the message have arrived
         - "#pus[song]": Add to song buffer and play when complete (6 segments)
         - "#puhi[name]": Greet another robot by name when in idle state
         - "#pun[name]": Update robot's name and introduce itself
+        - ("#pubt", grid): Beat grid of another dancing robot (see BeatSync);
+          not a command, so it does not count as controller activity
+        - ("#pp" + operation + ID, value): Live parameter tuning (see param)
+        
+        While a channel scan runs (see scan), packets are only counted.
+        ("#puch", channel << 8 | group) is sent, not handled (see announce).
+        Up to a radio queue's worth of packets, and one more that arrived
+        meanwhile, is handled per loop iteration; a read that finds the queue
+        empty calibrates the queue wait (see Latency).
         
         Note:
-            Song data is buffered in self.s_list and played when 6 segments are received
-            to handle transmission of longer musical sequences.
+            Chunked messages are reassembled in self.chk (see Chunks), in any
+            order and with a timeout. "#pus" segments from older controllers
+            are buffered in self.s_list and played when 6 segments are received.
         """
-        d = self.ro.receive_packet()
-        if d is None:
+        if self.cs.busy():
+            if self.cs.step(self.ro, time.ticks_ms()):
+                self.scan_done()
             return
+        if self.cs.ann:
+            self.announce()
+        elif self.cs.lost(time.ticks_ms()):
+            self.chan, g = self.cs.back
+            self.cs.back = None
+            self.set_group(g)
+        if self.tn.nx >= 0:
+            self.tn.step(self.ro, time.ticks_ms())
+        # read what has queued up since the last iteration, so the slow idle
+        # and sleep periods do not drop packets on the short radio queue
+        for _ in range(self.ro.q + 1):
+            d = self.ro.receive_packet()
+            if d is None:
+                if self.ro.r_emp:
+                    wk.lt.empty()  # later commands arrived after now (queue wait calibration)
+                return
+            self.handle(d)
+
+    # handle one radio packet
+    def handle(self, d):
         if isinstance(d, tuple):
+            la, v = d
+            if la == "#pubt":
+                self.bs.rx(v, self.ro.r_ts, self.ro.r_sn, time.ticks_ms())
+                return
             # Handle command tuples (from cmd_dict)
+            wk.lt.rx(self.ro.r_ts, self.ro.r_sn)
+            self.cs.back = None  # the controller is on this channel
             self.last_cmd_ts = time.ticks_ms()
-            la, v = d
-            self.cmd_dict.get(la, self.noop)(v)
+            wk.lt.dispatch(la in MOVE_CMDS)
+            if la[:3] == "#pp":
+                self.param(la[3:], v)
+            else:
+                self.cmd_dict.get(la, self.noop)(v)
         elif type(d) is str:
             # Handle string-based commands
             if d.startswith("#put"):
                 self.talk(d[4:])
+            elif d.startswith("#puk"):
+                m = self.chk.add(d[4:])
+                if m and m[0] == 's':
+                    self.sing(m[1])
+                elif m:
+                    self.talk(m[1])
             elif d.startswith("#pus"):
                 self.s_list.append(d[4:])
                 if len(self.s_list) >= 6:
@@ -715,7 +908,7 @@ class RobotPu(object):
         """
         # Check for free-fall condition
         if accelerometer.was_gesture("freefall"):
-            self.gst = -2  # Enter fall state
+            self.sm.go(ST_FETAL)  # Curl up while falling
             
         # Handle button presses for group ID changes
         if button_a.was_pressed():
@@ -727,20 +920,20 @@ class RobotPu(object):
         if self.gst > 0:  # If in any active state
             self.alt_l = 10  # Reset alert level
             if time.ticks_ms() - self.last_cmd_ts > 2000:  # 2s timeout
-                self.gst = 0  # Return to idle
+                self.sm.go(ST_IDLE)  # Return to idle
                 
         # Check balance and adjust if needed
-        if self.gst != -2:  # If not in fall state
+        if self.gst != ST_FETAL:  # If not in free fall
             if abs(self.bd_rl2) > 75 or abs(self.bd_pth2) > 75:  # Check tilt thresholds
                 self.balance_param()  # Recalculate balance parameters
                 self.fell_count += 1
                 wk.num_steps = 0
                 if self.fell_count > 16:  # If fallen too many times
-                    self.gst = -3  # Enter recovery state
+                    self.sm.go(ST_FALL)  # Enter recovery state
             else:
                 self.fell_count = 0
-                if self.gst == -3:  # If recovering
-                    self.gst = self.last_state  # Return to previous state
+                if self.gst == ST_FALL:  # If recovering
+                    self.sm.go(self.sm.last)  # Return to previous state
                     self.talk("Thanks")  # Acknowledge recovery
                     #self.show_channel()  # Update display
 
@@ -749,30 +942,262 @@ class RobotPu(object):
         """
         Main state machine for robot behavior control.
         
-        This method processes the current state (gst) and executes the corresponding
-        behavior. The state machine handles the following states:
+        This method runs the update function of the current state (gst) from
+        the state table in self.sm. The state machine handles the following states:
         
         States:
-            0 (Idle/Standby): No active movement, responds to stimuli
-            1 (Walking): Moving forward/backward with balance control
-            2 (Dancing): Executing dance routines
-            3 (Fallen): Handling fall recovery
-            4 (Manual Control): Responding to joystick input
-            5 (Sleep): Low-power mode with minimal activity
+            ST_FALL (-3): Fallen over, asking to be stood up
+            ST_FETAL (-2): Curled up after free fall
+            ST_SLEEP (-1): Lights off, waiting for noise or movement (2 Hz)
+            ST_IDLE (0): No active movement, responds to stimuli (10 Hz)
+            ST_EXPLORE (1): Walking with sonar obstacle avoidance
+            ST_JUMP (2), ST_KICK (4): One-shot moves, then joystick control
+            ST_DANCE (3): Executing dance routines on the beat
+            ST_JOY (5): Responding to joystick input
             
-        State Transitions:
-        - Idle -> Walking: When movement commands are received
-        - Any -> Fallen: When IMU detects a fall
-        - Fallen -> Previous: After successful recovery
-        - Any -> Sleep: After inactivity or low battery
+        State Transitions (all through self.sm.go, which runs the hooks):
+        - Idle -> Active: When button or movement commands are received
+        - Active -> Idle: After 2 seconds without commands
+        - Any -> Fetal: When the IMU detects free fall
+        - Any -> Fall -> Previous: After repeated tilt, then recovery
+        - Idle -> Sleep -> Idle: After inactivity, until noise or movement
         """
         # Execute the current state's behavior
-        self.st_dict.get(self.gst, self.sleep)()
+        self.sm.update()
         
-        # Handle blinking and state tracking
+        # Handle blinking
         if self.gst >= 0:  # If in a normal state
             wk.blink(self.alt_l)  # Update eye blink animation
-            self.last_state = self.gst  # Remember last normal state
+
+    # set the telemetry report period
+    def set_tl(self, v:int):
+        self.tl = max(0, int(v))
+
+    # publish telemetry values via radio
+    def report(self):
+        """
+        Publish telemetry as radio name/value packets.
+        
+        - rl_e, rl_u: Error and correction of the active roll controller
+        - pt_e, pt_u: Error and correction of the active pitch controller
+        - led_wps: LED hardware writes in the last second
+        - st, st_tr: Current state and number of state transitions
+        - duty: Estimated CPU duty cycle (%)
+        - wake_ms: Worst-case time to react to a wake event or command (ms)
+        - err, e_<stage>: Error count in total and of each stage that failed
+        - ck_ok, ck_to, ck_bad: Chunked messages completed, timed out and malformed chunks
+        - bt_conf, bt_fol, bt_sw: Beat grid confidence, whether another robot's
+          grid is followed, and number of leader changes
+        - lat_p50, lat_p95, lat_miss: Radio read to servo write latency of motion
+          commands (upper bound of the histogram bucket, ms) and commands
+          followed by no servo write; "#pulat" sends the full histograms
+        - tn_set, tn_err: Parameters set and refused over the radio
+        - i2c_ut, i2c_err, i2c_fail, i2c_deg: Share of time in I2C writes since
+          the last report (%), failed attempts, writes given up and whether the
+          bus is degraded (see Bus); "#pubus" sends the per-address counts
+        """
+        self.ro.send_value("rl_e", self.bc_r.e)
+        self.ro.send_value("rl_u", self.bc_r.u)
+        self.ro.send_value("pt_e", self.bc_p.e)
+        self.ro.send_value("pt_u", self.bc_p.u)
+        self.ro.send_value("led_wps", wk.an.wps)
+        self.ro.send_value("st", self.gst)
+        self.ro.send_value("st_tr", self.sm.n_tr)
+        self.ro.send_value("duty", int(self.duty * 100))
+        self.ro.send_value("wake_ms", max(self.sm.period(), self.busy_ms) + self.busy_ms)
+        self.ro.send_value("err", self.err.total)
+        for i in range(len(STAGES)):
+            if self.err.n_st[i]:
+                self.ro.send_value("e_" + STAGES[i], self.err.n_st[i])
+        self.ro.send_value("ck_ok", self.chk.n_ok)
+        self.ro.send_value("ck_to", self.chk.n_to)
+        self.ro.send_value("ck_bad", self.chk.n_bad)
+        self.ro.send_value("bt_conf", self.bs.conf)
+        self.ro.send_value("bt_fol", 1 if self.bs.follow(time.ticks_ms()) else 0)
+        self.ro.send_value("bt_sw", self.bs.n_sw)
+        self.ro.send_value("lat_p50", wk.lt.pct(3, 50))
+        self.ro.send_value("lat_p95", wk.lt.pct(3, 95))
+        self.ro.send_value("lat_miss", wk.lt.n_miss)
+        self.ro.send_value("tn_set", self.tn.n_set)
+        self.ro.send_value("tn_err", self.tn.n_err)
+        self.ro.send_value("i2c_ut", int(wk.bus.util() * 100))
+        self.ro.send_value("i2c_err", wk.bus.n_err)
+        self.ro.send_value("i2c_fail", wk.bus.n_fail)
+        self.ro.send_value("i2c_deg", 1 if wk.bus.deg else 0)
+
+    # publish the error count of each stage and exception type
+    def report_err(self, v):
+        """
+        Publish one value packet per (stage, exception type) that failed.
+        
+        The name is the first 3 letters of the stage and the first 5 of the
+        exception type, e.g. "staOSErr" for OSError in the behavior stage.
+        """
+        for k in self.err.n:
+            self.ro.send_value(STAGES[k[0]][:3] + k[1][:5], self.err.n[k])
+
+    # publish the command latency histograms
+    def report_lat(self, v):
+        """
+        Publish one value packet per non-empty latency bucket (see Latency).
+        
+        The name is "l", the stage letter and the bucket, e.g. "le5" for
+        16-32 ms from radio read to servo write. A value of 1 clears the
+        histograms after sending.
+        """
+        lt = wk.lt
+        for s in range(4):
+            for k in range(lt.nb):
+                if lt.h[s][k]:
+                    self.ro.send_value("l" + lt.STG[s] + str(k), lt.h[s][k])
+        if v == 1:
+            lt.clear()
+
+    # publish the I2C bus failure statistics
+    def report_bus(self, v):
+        """
+        Publish the I2C bus counters (see Bus): writes done ("i2c_wr"), writes
+        skipped while degraded ("i2c_skip"), times degraded ("i2c_ndeg"),
+        pending writes replayed ("i2c_rpl") and one "ia<address>" packet per
+        address with failed attempts.
+        """
+        b = wk.bus
+        self.ro.send_value("i2c_wr", b.n_wr)
+        self.ro.send_value("i2c_skip", b.n_skip)
+        self.ro.send_value("i2c_ndeg", b.n_deg)
+        self.ro.send_value("i2c_rpl", b.n_rpl)
+        for a in b.ae:
+            self.ro.send_value("ia" + str(a), b.ae[a])
+
+    # start a congestion scan of radio channels and groups
+    def scan(self, v):
+        """
+        Scan channels and groups for traffic (see ChanScan) and move to the
+        least congested one. The robot idles and hears no commands for the
+        scan, about 3 s; the loop runs at full rate meanwhile, with the idle
+        behavior still updated at its own period.
+        """
+        self.sm.go(ST_IDLE)
+        self.cs.start(self.ro, self.groupID, self.chan, time.ticks_ms())
+
+    # report the scan and pick the channel and group to move to
+    def scan_done(self):
+        """
+        Publish the packet rate of each channel as "sc<channel>" (packets/s)
+        on the old setting and start announcing the new one (see announce).
+        """
+        self.cs.mv, self.cs.ann = self.cs.pick(), 3
+        self.ro.tune(self.groupID, self.chan)
+        for i in range(len(self.cs.chans)):
+            self.ro.send_value("sc" + str(self.cs.chans[i]), self.cs.rate[i])
+
+    # announce the setting picked by a scan, moving there after the last announcement
+    def announce(self):
+        """
+        Send ("#puch", channel << 8 | group) on the old setting, once per
+        tick so a collision on the busy channel does not take all of them,
+        so the paired controller can follow, then retune. If no command
+        arrives on the new setting within cs.to_ms, the robot returns to
+        the old one.
+        """
+        c, g = self.cs.mv
+        self.ro.send_value("#puch", c << 8 | g)
+        self.cs.ann -= 1
+        if self.cs.ann or (c, g) == (self.chan, self.groupID):
+            return
+        self.cs.back, self.cs.mv_ts = (self.chan, self.groupID), time.ticks_ms()
+        self.chan = c
+        self.set_group(g)
+        self.ro.drain()  # only commands on the new setting confirm the move
+
+    # live parameter tuning over the radio
+    def param(self, c, v):
+        """
+        Handle a "#pp" command; the rest of the name is an operation and a
+        parameter ID (see Tune for the IDs, types and ranges):
+        - "s<id>": Set the parameter to v; replies ("p<id>", value) or
+          ("pe<id>", error code)
+        - "g<id>": Reply ("p<id>", value)
+        - "g": Send every parameter, one per tn.gap_ms, then ("pn", count)
+        - "w": Save the tuned parameters to the config store; replies
+          ("pw", 1) or ("pw", 0) if the write failed
+        
+        Args:
+            c (str): Name after "#pp"
+            v (int or float): Value
+        """
+        op, i = c[:1], int(c[1:]) if c[1:].isdigit() else -1
+        if op == "s" and i >= 0:
+            e = self.tn.set(i, v)
+            if e:
+                self.ro.send_value("pe" + str(i), e)
+                return
+            if i >= TUNE_TABS[0][2]:
+                wk.tj.cache.clear()  # gait splines are rebuilt from the changed tables
+            self.tn.send(self.ro, i)
+        elif op == "g" and i >= 0:
+            self.tn.send(self.ro, i)
+        elif c == "g":
+            self.tn.all(time.ticks_ms())
+        elif c == "w":
+            self.ro.send_value("pw", 1 if self.write_config() else 0)
+
+    # one iteration of the control loop
+    def tick(self):
+        """
+        Run one control tick: radio commands, state updates and the current behavior.
+        """
+        # Advance the motion clock so servo speeds follow elapsed time
+        self.stg = 0
+        wk.tick()
+        
+        # Process any incoming radio commands
+        self.stg = 1
+        self.process_radio_cmd()
+        
+        # Update robot states based on current conditions
+        self.stg = 2
+        self.set_states()
+        
+        # Execute the current state's behavior, at its own period during a
+        # channel scan, when the loop runs faster for the radio
+        self.stg = 3
+        if not self.cs.busy() or time.ticks_diff(time.ticks_ms(), self.st_ts) >= self.sm.period():
+            self.st_ts = time.ticks_ms()
+            self.state_machine()
+        
+        # Write changed eye and NeoPixel outputs
+        self.stg = 4
+        wk.an.update()
+        
+        self.tk += 1
+        if self.tl and self.tk % self.tl == 0:
+            self.stg = 5
+            self.report()
+
+    # report boot time and run the deferred intro after the first control tick
+    def boot_done(self):
+        self.boot_ms = time.ticks_ms()
+        self.s_code("B" + str(self.boot_ms))
+        if self.intro_p:
+            self.intro_p = False
+            self.intro()
+
+    # recover from a stage that keeps failing
+    def on_trip(self, stg):
+        """
+        Move to a safe state when a loop stage keeps failing.
+        
+        A failing behavior or sensing stage drops the active behavior for
+        idle, and a failing idle goes to sleep, which does the least I/O.
+        The loop also backs off (see ErrorLog) whatever the stage.
+        """
+        try:
+            self.s_code("E3" + STAGES[stg])
+            if stg == 2 or stg == 3:
+                self.sm.go(ST_SLEEP if self.gst == ST_IDLE else ST_IDLE)
+        except Exception as e:
+            self.err.add(stg, e)
 
     # main event loop
     def run(self):
@@ -785,32 +1210,44 @@ class RobotPu(object):
         3. Executing the current state's behavior
         4. Handling errors gracefully
         
-        The loop runs as fast as possible, with timing controlled by:
+        The loop runs as fast as possible in active states and at the state's
+        update period (10 Hz in idle, 2 Hz in sleep) otherwise, with timing
+        controlled by:
         - Hardware PWM timing for servos
         - Delays in state machine methods
         - Radio communication timing
         
         Error Handling:
         - Catches and logs exceptions to prevent crashes
-        - Performs garbage collection on error to free memory
+        - Performs garbage collection when memory runs out
         - Continues operation after errors when possible
         """
         while True:
-            try:
-                # Process any incoming radio commands
-                self.process_radio_cmd()
-                
-                # Update robot states based on current conditions
-                self.set_states()
-                
-                # Execute the current state's behavior
-                self.state_machine()
-                
-                # Optional: Uncomment for memory usage monitoring
-                if random.randint(0, 200) == 0: gc.collect()
-                # print(time.ticks_ms(), gc.mem_alloc(), gc.mem_free())
-                
-            except Exception as e:
-                # Log errors and attempt to recover
-                print(e)
-                gc.collect()  # Clean up memory on error
+            self.step()
+
+    # one guarded iteration of the main event loop
+    def step(self):
+        t = time.ticks_ms()
+        try:
+            self.tick()
+            if not self.boot_ms:
+                self.stg = 6
+                self.boot_done()
+            
+            # Optional: Uncomment for memory usage monitoring
+            if random.randint(0, 200) == 0: gc.collect()
+            # print(time.ticks_ms(), gc.mem_alloc(), gc.mem_free())
+            
+        except Exception as e:
+            # Free memory if it ran out; other errors, which may repeat every tick, skip the collection
+            if type(e) is MemoryError:
+                gc.collect()
+            # Count and log (rate-limited) the error, recover if the stage keeps failing
+            if self.err.add(self.stg, e):
+                self.on_trip(self.stg)
+        # states with a lower update rate sleep away the rest of their period
+        b = self.busy_ms = time.ticks_diff(time.ticks_ms(), t)
+        w = max(0 if self.cs.busy() else self.sm.period(), self.err.backoff()) - b
+        self.duty += (b / max(1, b + max(0, w)) - self.duty) * 0.1
+        if w > 0:
+            sleep(w)
@@ -0,0 +1,61 @@
+class StateMachine(object):
+    """
+    Table-driven state machine.
+
+    The table maps each state to (update, entry, exit, period): the update
+    function run by the control loop, optional entry and exit hooks, and
+    the update period in ms (0 = every loop). States missing from the table
+    use the entry of the default state. Every transition goes through go(),
+    which runs the hooks and counts the transition.
+    """
+    def __init__(self, table, st, default):
+        self.tb = table         # state -> (update, entry, exit, period ms)
+        self.st = st            # current state
+        self.default = default  # state whose entry is used for unknown states
+        self.last = st          # last state that is not an error state (< 0)
+        self.n_tr = 0           # number of transitions
+        self.n_in = {}          # state -> number of times entered
+
+    # table entry of a state
+    def entry(self, st):
+        e = self.tb.get(st)
+        return e if e is not None else self.tb[self.default]
+
+    # change state, running the exit and entry hooks
+    def go(self, st, re=False):
+        """
+        Transition to state st; a transition to the current state does nothing.
+
+        Args:
+            st (int): New state
+            re (bool): If already in st, run its entry hook again, e.g. to
+                restart a behavior when its button is pressed again
+
+        Returns:
+            bool: True if the state changed
+        """
+        if st == self.st:
+            f = self.entry(st)[1] if re else None
+            if f:
+                f()
+            return False
+        f = self.entry(self.st)[2]
+        if f:
+            f()
+        if self.st >= 0:
+            self.last = self.st
+        self.st = st
+        self.n_tr += 1
+        self.n_in[st] = self.n_in.get(st, 0) + 1
+        f = self.entry(st)[1]
+        if f:
+            f()
+        return True
+
+    # run the update function of the current state
+    def update(self):
+        self.entry(self.st)[0]()
+
+    # update period of the current state (ms)
+    def period(self):
+        return self.entry(self.st)[3]
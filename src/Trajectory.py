@@ -0,0 +1,68 @@
+from array import array
+
+
+class Trajectory(object):
+    """
+    Precomputed keyframe splines through cyclic pose sequences.
+
+    For each pose sequence a Catmull-Rom spline through the servo targets is
+    sampled once into a flat table, together with the duration of each
+    segment at unit speed. Speed only rescales time, so one table serves all
+    speeds of a sequence and the control loop just interpolates a lookup.
+    """
+    def __init__(self, n=8, max_cache=4):
+        self.n = n                  # samples per segment
+        self.max_cache = max_cache  # sequences kept in the cache
+        self.cache = {}             # (states, sync_list) -> (table, durations)
+
+    def build(self, p, states, sync_list, ref_hz):
+        """
+        Sample the spline of a pose sequence.
+
+        Segment s runs from pose states[s-1] to pose states[s], matching
+        WK.move which moves toward states[pos].
+
+        Args:
+            p (Parameters): Parameters object containing pose tables
+            states (list[int]): Cyclic sequence of pose indices
+            sync_list (list[int]): Servos whose speed sets the segment duration
+            ref_hz (int): Tick rate the speed vectors were tuned at
+
+        Returns:
+            tuple: (table, durations) with durations in seconds at speed 1
+        """
+        m, n, dof = len(states), self.n, p.dof
+        tb = array('f', [0.0] * (m * n * dof))
+        du = [0.0] * m
+        for s in range(m):
+            p0, p1, p2, p3 = (p.st_tg[states[(s + k) % m]] for k in (-2, -1, 0, 1))
+            sps = p.st_spu[p.dict_sp.get(states[s], 1)]
+            # duration: ticks the slowest sync servo needs at unit speed
+            du[s] = max(0.02, max(abs(p2[i] - p1[i]) / sps[i] for i in sync_list) / ref_hz)
+            for j in range(n):
+                u = j / n
+                u2, u3 = u * u, u * u * u
+                o = (s * n + j) * dof
+                for i in range(dof):
+                    tb[o + i] = 0.5 * (2 * p1[i] + (p2[i] - p0[i]) * u
+                                       + (2 * p0[i] - 5 * p1[i] + 4 * p2[i] - p3[i]) * u2
+                                       + (3 * p1[i] - p0[i] - 3 * p2[i] + p3[i]) * u3)
+        return tb, du
+
+    def get(self, p, states, sync_list, ref_hz):
+        """Return the cached (table, durations) of a sequence, building it if needed."""
+        key = (tuple(states), tuple(sync_list))
+        t = self.cache.get(key)
+        if t is None:
+            if len(self.cache) >= self.max_cache:
+                self.cache.clear()
+            t = self.cache[key] = self.build(p, states, sync_list, ref_hz)
+        return t
+
+    def value(self, tb, dof, s, ph, i):
+        """Interpolated target of servo i at phase ph (0-1) of segment s."""
+        x = ph * self.n
+        j = int(x)
+        a = (s * self.n + j) * dof + i
+        b = (a + dof) % len(tb)
+        return tb[a] + (tb[b] - tb[a]) * (x - j)
@@ -0,0 +1,180 @@
+import time
+
+# owners of tunable parameters: the robot or its Parameters object
+TN_BOT, TN_PR = 0, 1
+# scalar parameters: (name, owner, attribute, type, low, high); the ID is the index
+TUNE_VARS = (
+    ("fw_sp", TN_BOT, "fw_sp", float, 0, 10),
+    ("bw_sp", TN_BOT, "bw_sp", float, -10, 0),
+    ("ep_thr", TN_BOT, "ep_thr", float, 0, 100),
+    ("max_rl_ctl", TN_BOT, "max_rl_ctl", float, 0, 45),
+    ("d_sp", TN_BOT, "d_sp0", float, 0.1, 2.5),
+    ("g_thr", TN_BOT, "g_thr", int, 500, 8000),
+    ("max_pth_ctl", TN_BOT, "max_pth_ctl", float, 0, 45),
+    ("ep_far", TN_BOT, "ep_far", int, 0, 200),
+    ("dance_l_itv", TN_BOT, "dance_l_itv", int, 0, 45),
+    ("dance_u_itv", TN_BOT, "dance_u_itv", int, 0, 45),
+    ("alt_sc", TN_BOT, "alt_sc", float, 0, 1),
+)
+# Parameters tables: (name, attribute, first ID, type, low, high), by first ID;
+# entry k of a flat table has ID first + k, column k of row r of a table of
+# rows has ID first + r * columns + k
+TUNE_TABS = (
+    ("s_tr", "s_tr", 32, float, -30, 30),
+    ("ep_dir", "ep_dir", 48, float, -1, 1),
+    ("st_spu", "st_spu", 64, float, 0.1, 10),
+    ("st_tg", "st_tg", 256, int, 0, 180),
+)
+# IDs the config record keeps in its own fields, in record order: the servo
+# trims, then the gait gains fw_sp, bw_sp, max_rl_ctl and g_thr; they are
+# not kept as tuned pairs, which would undo later changes to those fields
+TN_CFG = (32, 33, 34, 35, 36, 37, 0, 1, 3, 5)
+# error codes, sent as ("pe<id>", code)
+TN_UNKNOWN, TN_TYPE, TN_RANGE = 1, 2, 3
+
+
+class Tune(object):
+    """
+    Parameters tuned over the radio, addressed by compact numeric IDs.
+
+    Each ID maps to a robot attribute or a Parameters table entry with a
+    type and a range (TUNE_VARS, TUNE_TABS); a value of another type or out
+    of range is refused. Values set since boot, or loaded from the config
+    store, are kept in ch so write_config can save them, except those the
+    config record holds in its own fields (TN_CFG). "Get all" sends
+    one value per gap_ms, a few per tick, so the relay (which forwards each
+    packet over a serial line) and controllers are not flooded, whatever
+    the loop period of the current state.
+
+    Args:
+        bot (RobotPu): Robot owning the scalar parameters
+        p (Parameters): Parameters object owning the tables
+        gap_ms (int): Time per value sent by a running "get all" (ms)
+        burst (int): Most values sent in one tick
+    """
+    def __init__(self, bot, p, gap_ms=10, burst=8):
+        self.o = (bot, p)
+        self.gap_ms = gap_ms
+        self.burst = burst
+        self.ts = 0                 # time the last values of a "get all" were sent (ms)
+        self.ch = {}                # ID -> value set since boot or loaded, but not in TN_CFG
+        self.nx = -1                # next ID of a running "get all", -1 = none
+        self.n_get = 0              # values sent by the running "get all"
+        self.n_set = 0              # values set
+        self.n_err = 0              # values refused
+
+    # container, key, type and range of a parameter
+    def find(self, i, w=False):
+        """
+        Args:
+            i (int): Parameter ID
+            w (bool): The parameter is about to be written; a row of a
+                pose pack table is pinned so the change is kept (see PackRows)
+
+        Returns:
+            tuple: (container, key, type, low, high), where key is an
+            attribute name or a list index, or None for an unknown ID
+        """
+        if 0 <= i < len(TUNE_VARS):
+            _, o, a, t, lo, hi = TUNE_VARS[i]
+            return self.o[o], a, t, lo, hi
+        for _, a, f, t, lo, hi in TUNE_TABS:
+            tb = getattr(self.o[TN_PR], a)
+            k = i - f
+            if k < 0:
+                return None
+            if type(tb[0]) is not list:
+                if k < len(tb):
+                    return tb, k, t, lo, hi
+            elif k < len(tb) * len(tb[0]):
+                if w and type(tb) is not list:
+                    tb.keep.add(k // len(tb[0]))
+                return tb[k // len(tb[0])], k % len(tb[0]), t, lo, hi
+        return None
+
+    # current value of a parameter, None for an unknown ID
+    def get(self, i):
+        f = self.find(i)
+        if f is None:
+            return None
+        c, k = f[0], f[1]
+        return getattr(c, k) if type(k) is str else c[k]
+
+    # set a parameter, checking its type and range
+    def set(self, i, v):
+        """
+        Args:
+            i (int): Parameter ID
+            v (int or float): New value; float parameters also take ints
+
+        Returns:
+            int: 0 if set, else TN_UNKNOWN, TN_TYPE or TN_RANGE
+        """
+        f = self.find(i, True)
+        if f is None:
+            e = TN_UNKNOWN
+        elif type(v) is not int and (f[2] is int or type(v) is not float):
+            e = TN_TYPE
+        elif not f[3] <= v <= f[4]:
+            e = TN_RANGE
+        else:
+            c, k = f[0], f[1]
+            v = f[2](v)
+            if type(k) is str:
+                setattr(c, k, v)
+            else:
+                c[k] = v
+            if i not in TN_CFG:
+                self.ch[i] = v
+            self.n_set += 1
+            return 0
+        self.n_err += 1
+        return e
+
+    # apply (ID, value) pairs from the config store, skipping stale ones and
+    # those older records saved for the record's own fields
+    def load(self, ps):
+        for i, v in ps:
+            f = self.find(i)
+            if f is not None and i not in TN_CFG:
+                self.set(i, f[2](v))
+
+    # ID after i, -1 after the last
+    def nxt(self, i):
+        i += 1
+        if i < len(TUNE_VARS):
+            return i
+        for _, a, f, _, _, _ in TUNE_TABS:
+            tb = getattr(self.o[TN_PR], a)
+            n = len(tb) * (len(tb[0]) if type(tb[0]) is list else 1)
+            if i < f:
+                i = f
+            if i < f + n:
+                return i
+        return -1
+
+    # send one parameter as ("p<id>", value)
+    def send(self, ro, i):
+        v = self.get(i)
+        if v is None:
+            ro.send_value("pe" + str(i), TN_UNKNOWN)
+        else:
+            ro.send_value("p" + str(i), v)
+
+    # start sending every parameter
+    def all(self, ts):
+        self.nx, self.n_get, self.ts = 0, 0, time.ticks_add(ts, -self.gap_ms)
+
+    # send the next values of a running "get all", then ("pn", count)
+    def step(self, ro, ts):
+        n = min(self.burst, time.ticks_diff(ts, self.ts) // self.gap_ms)
+        if n > 0:
+            self.ts = ts
+        for _ in range(n):
+            if self.nx < 0:
+                return
+            self.send(ro, self.nx)
+            self.n_get += 1
+            self.nx = self.nxt(self.nx)
+            if self.nx < 0:
+                ro.send_value("pn", self.n_get)
@@ -1,5 +1,9 @@
 from microbit import *
 from Parameters import *
+from Trajectory import *
+from Anim import *
+from Latency import *
+from Bus import *
 import math
 import time
 import random
@@ -22,13 +26,41 @@ class WK(object):
         self.last_bl_ts = 0  # Timestamp of last blink
         self.eye_on = True   # Current state of the eyes (on/off)
         self.l_e_b = self.r_e_b = 1023  # Left and right eye brightness (0-1023)
-        self.eye_icr = 1     # Eye brightness increment for animation
         self.bl_itl = 6000   # Blink interval in milliseconds
         self.pos = self.num_steps = 0  # Position and step counters for movement
         self.bl_g = 4000     # Base blink duration
         self.idle = False    # Whether servos are idle
         self.c_s = 0         # Current state index
+        self.t_mode = True   # Time-based motion: step from elapsed time, not per call
+        self.ref_hz = 50     # Tick rate the per-tick speeds were tuned at (deg/sec = sp * ref_hz)
+        self.max_dt = 100000 # Longest time step applied at once (us), e.g. after speech
+        self.last_us = time.ticks_us()  # Timestamp of last tick (us)
+        self.k = 1.0         # Step scale for the current tick
+        self.tj = Trajectory()  # Precomputed gait splines
+        self.spl = True      # Gaits follow precomputed splines instead of stopping at poses
+        self.ct = [0.0] * 6  # Control vector applied on the spline, slewed toward p.s_ct
+        self.tj_key = None   # Sequence currently followed on its spline
+        self.ph = 0.0        # Phase (0-1) within the current spline segment
+        self.an = Anim()     # Eye and NeoPixel animation, writes only changed outputs
+        self.lt = Latency()  # Radio command to servo write latency
+        self.bus = Bus()     # I2C writes with retries, backoff and failure counts
         i2c.init()           # Initialize I2C communication
+
+    # advance the motion clock, once per control loop iteration
+    def tick(self):
+        """
+        Update the step scale from the time elapsed since the last tick, and
+        replay I2C writes pending since the bus was degraded (see Bus).
+        
+        In time-based mode a servo speed sp moves sp * ref_hz degrees per
+        second whatever the loop rate; otherwise it moves sp degrees per step.
+        """
+        if self.bus.pend:
+            self.bus.flush()  # writes held back while the bus was degraded
+        t = time.ticks_us()
+        dt = min(self.max_dt, time.ticks_diff(t, self.last_us))
+        self.last_us = t
+        self.k = dt * self.ref_hz * 1e-6 if self.t_mode else 1.0
     # control DC motor, m is motor index, sp is speed
     def motor(self, m, sp):
         """
@@ -39,7 +71,7 @@ class WK(object):
             sp (int): Speed value from -100 to 100 (negative for reverse)
         """
         if -100 <= sp <= 100 and 1 <= m <= 2:
-            i2c.write(WK_ADDR, bytearray([m, 0x01, sp, 0]))
+            self.bus.write(WK_ADDR, bytearray([m, 0x01, sp, 0]))
 
     # control 8 servos that attached to the i2C expansion board
     def servo(self, sr, a):
@@ -52,7 +84,8 @@ class WK(object):
         """
         if 0 <= sr <= 7:
             a = min(180, max(0, int(a)))
-            i2c.write(WK_ADDR, bytearray([0x10 if sr == 7 else sr + 3, a, 0, 0]))
+            if self.bus.write(WK_ADDR, bytearray([0x10 if sr == 7 else sr + 3, a, 0, 0])) and self.lt.pend:
+                self.lt.wr()  # first servo write after a timed command
 
     # control the LED lights on the i2C expansion board
     def set_light(self, light):
@@ -62,7 +95,7 @@ class WK(object):
         Args:
             light (int): Light intensity or pattern value
         """
-        i2c.write(WK_ADDR, bytearray([0x12, light, 0, 0]))
+        self.bus.write(WK_ADDR, bytearray([0x12, light, 0, 0]))
         #sleep(100)
         #i2c.write(WK_ADDR, bytearray([0x11, 160, 0, 0]))
 
@@ -73,11 +106,11 @@ class WK(object):
         
         Args:
             target (float): Target angle in degrees
-            sp (float): Speed/step size for movement
+            sp (float): Speed, in degrees per tick at ref_hz
             idx (int): Index of the servo to move
             p (Parameters): Parameters object containing servo state
         """
-        sp = math.fabs(sp)
+        sp = math.fabs(sp) * self.k
         target = max(0, min(179, target))  # Clamp target to valid range
         err = p.s_err[idx] = target - p.s_tg[idx]  # Calculate error
         # Move toward target at controlled speed
@@ -97,6 +130,25 @@ class WK(object):
             self.servo(i, p.st_tg[idx][i] + p.s_tr[i])
         self.idle = True  # Mark servos as having reached target
 
+    # put the board in a low-power state before sleeping
+    def relax(self, p: Parameters):
+        """
+        Hold the neutral pose with no further I2C traffic, motors stopped and lights off.
+        
+        The WK board has no servo release command, so the servos get the
+        neutral pose once and then no writes until the robot moves again.
+        
+        Args:
+            p (Parameters): Parameters object containing servo state
+        """
+        for i in range(p.dof):
+            p.s_tg[i] = p.st_tg[0][i] + p.s_tr[i]
+            self.servo(i, p.s_tg[i])
+        self.motor(1, 0)
+        self.motor(2, 0)
+        self.set_light(0)
+        self.idle = True
+
     # check if the servo motors are idle (target angle arrived)
     def is_servo_idle(self, s_list, p: Parameters):
         """
@@ -130,6 +182,7 @@ class WK(object):
         Returns:
             int: 0 if movement to next state should begin, 1 if still moving
         """
+        self.tj_key = None  # Leaving any spline; rejoin through a pose
         if sp == 0:
             return 0
         self.pos = min(self.pos, len(states) - 1)  # Ensure position is in range
@@ -152,6 +205,60 @@ class WK(object):
             return 0  # Ready for next state
         return 1  # Still moving
 
+    # move the robot continuously along the precomputed spline of a pose sequence
+    def move_spline(self, p: Parameters, states: list[int],
+                    sync_list: list[int], sp: float,
+                    async_list: list[int], async_sp: float) -> int:
+        """
+        Move the robot through a cyclic pose sequence along its spline.
+        
+        Unlike move(), the synchronous servos do not stop at each pose: the
+        phase advances with elapsed time and speed, and servo targets are
+        looked up in the sequence's precomputed table. When the sequence
+        changes, move() is used until the next pose is reached so the robot
+        joins the spline without a jump. The control vector (balance
+        corrections) is added to the spline targets after slewing at most
+        the speed move() would step a servo by, so a sudden correction is
+        not applied in one tick.
+        
+        Args and return value are the same as move().
+        """
+        if sp == 0:
+            return 0
+        key = states
+        if self.tj_key is not key:
+            # Reach a pose of the new sequence first, then follow its spline
+            if self.move(p, states, sync_list, sp, async_list, async_sp) == 0:
+                self.tj_key, self.ph = key, 0.0
+                for i in sync_list:
+                    self.ct[i] = p.s_ct[i]  # already applied by move()
+                return 0
+            return 1
+        tb, du = self.tj.get(p, states, sync_list, self.ref_hz)
+        self.pos = min(self.pos, len(states) - 1)
+        self.c_s = states[self.pos]
+        self.ph += self.k / self.ref_hz * math.fabs(sp) / du[self.pos]
+        r = 1
+        if self.ph >= 1.0:
+            self.pos = (self.pos + 1) % len(states)  # Move to next state
+            self.c_s = states[self.pos]
+            self.num_steps += 1
+            self.ph = min(0.99, self.ph - 1.0)
+            r = 0
+        sps = p.st_spu[p.dict_sp.get(self.c_s, 1)]
+        for i in sync_list:
+            # slew the correction as servo_step would
+            m, e = math.fabs(sp * sps[i]) * self.k, p.s_ct[i] - self.ct[i]
+            self.ct[i] += e if math.fabs(e) <= m else m if e >= 0 else -m
+            t = max(0, min(179, self.tj.value(tb, p.dof, self.pos, self.ph, i) + p.s_tr[i] + self.ct[i]))
+            p.s_err[i] = t - p.s_tg[i]
+            p.s_tg[i] = t
+            self.servo(i, t)
+        targets = p.st_tg[self.c_s]
+        for i in async_list:
+            self.servo_step(targets[i] + p.s_tr[i] + p.s_ct[i], async_sp * sps[i], i, p)
+        return r
+
     # turn on or off the eye led lights
     def eyes_ctl(self, c):
         """
@@ -160,8 +267,7 @@ class WK(object):
         Args:
             c (int): 0 to turn off, 1 to turn on
         """
-        pin12.write_digital(c)  # Left eye
-        pin13.write_digital(c)  # Right eye
+        self.an.eye_set(c * 1023, c * 1023)  # Both eyes fully on or off
         self.eye_on = c
         self.last_bl_ts = time.ticks_ms()  # Update last blink timestamp
 
@@ -173,7 +279,7 @@ class WK(object):
         Args:
             b (int): Brightness value (0-1023)
         """
-        pin12.write_analog(b)
+        self.an.eye_set(b, self.an.eye[1])
         self.l_e_b = b  # Store current brightness
 
     # control the brightness of the right eye led light
@@ -184,7 +290,7 @@ class WK(object):
         Args:
             b (int): Brightness value (0-1023)
         """
-        pin13.write_analog(b)
+        self.an.eye_set(self.an.eye[0], b)
         self.r_e_b = b  # Store current brightness
 
     # blink the eye led lights
@@ -225,21 +331,11 @@ class WK(object):
         
         This creates an alternating brightness effect where one eye fades in
         while the other fades out, creating a "knight rider" style animation.
+        The effect is keyframed and keeps running until the eyes are set again.
         
         Args:
-            icr (int): Increment value for brightness change (controls speed)
-        """
-        # Update brightness with current increment
-        self.l_e_b += self.eye_icr
-        
-        # Reverse direction at brightness limits
-        if self.l_e_b >= 1023:
-            self.eye_icr = -icr  # Start decreasing brightness
-            self.l_e_b = 1023    # Clamp to maximum
-        elif self.l_e_b <= 0:
-            self.eye_icr = icr   # Start increasing brightness
-            self.l_e_b = 0       # Clamp to minimum
-            
-        # Set complementary brightness for each eye
-        self.right_eye_bright(1023 - self.l_e_b)  # Opposite of left eye
-        self.left_eye_bright(self.l_e_b)
\ No newline at end of file
+            icr (int): Brightness change per reference tick (controls speed)
+        """
+        if self.an.e_fx is None:
+            h = max(1, 1023 * 1000 // (icr * self.ref_hz))  # fade time (ms)
+            self.an.play_eyes((0, 0, 1023, h, 1023, 0, 2 * h, 0, 1023))
@@ -0,0 +1,4 @@
+from microbit import *
+from Gamepad import *
+
+Gamepad().run()
@@ -2,5 +2,5 @@ from microbit import *
 from PuBot import *
 
 r = RobotPu("Peu")
-r.calibrate()
+r.calibrate(fast=True)
 r.run()
@@ -0,0 +1 @@
+"""Host-side utilities for building, deploying and simulating Pu robots."""
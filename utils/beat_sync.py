@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Swarm Beat Sync Simulation
+
+Runs several robots dancing to the same music on the host hardware stand-in
+(utils.emu), sharing one radio medium, and measures how far their beat grids
+drift apart in phase:
+1. Every robot boots at a random time, so the robot clocks are offset, and
+   hears the music with its own amount of microphone noise
+2. The run is repeated with beat sync off (every robot on its own MusicLib
+   grid) and on (robots follow the most confident grid, see BeatSync)
+3. Every 100 ms of room time, the phase of each dancing robot's next beat is
+   compared with the music and with the other robots
+
+Usage:
+    python -m utils.beat_sync [--robots 6] [--seconds 60] [--seed 0] [--mode both|on|off]
+"""
+
+import random
+import argparse
+
+from utils import emu
+from utils.swarm import Swarm
+
+PERIOD_MS = 500      # music beat period (120 bpm)
+SAMPLE_MS = 100      # phase sampling period in room time
+ST_DANCE = 3
+
+
+class Dancer(emu.Scenario):
+    """
+    Dance scenario seen by a robot whose clock started off_ms after the room's.
+
+    Args:
+        seed (int): Seed for sensor noise
+        off_ms (int): Robot clock at room time 0 (ms)
+        noise (int): Extra microphone noise amplitude
+    """
+    def __init__(self, seed, off_ms, noise):
+        super().__init__("dance", seed)
+        self.off = off_ms
+        self.noise = noise
+
+    def accel(self, t):
+        return super().accel(t - self.off)
+
+    def sound(self, t):
+        return super().sound(t - self.off) + self.rng.randint(0, self.noise)
+
+    def loud(self, t):
+        return super().loud(t - self.off)
+
+    def sonar(self, t):
+        return super().sonar(t - self.off)
+
+    def radio(self, t):
+        return super().radio(t - self.off)
+
+
+def circ(d, p=PERIOD_MS):
+    """Wrap a phase difference into [-p/2, p/2)."""
+    return (d + p // 2) % p - p // 2
+
+
+def spread(ph, p=PERIOD_MS):
+    """Smallest arc (ms) of the beat circle holding all phases."""
+    ph = sorted(x % p for x in ph)
+    gaps = [b - a for a, b in zip(ph, ph[1:])] + [ph[0] + p - ph[-1]]
+    return p - max(gaps)
+
+
+def simulate(n, seconds, seed, sync, warmup_s=15):
+    """Run n robots for `seconds` of room time.
+
+    Returns:
+        dict: Phase spread and error statistics, leader and radio counters
+    """
+    rng = random.Random(seed)
+    sw = Swarm(emu.Medium())
+    bots = []
+    for i in range(n):
+        off = rng.randint(0, 5000)
+        b = emu.Board(Dancer(seed + i, off, rng.choice((0, 20, 60, 120))), f"bt{i}")
+        b.t_us = b.t0_us = off * 1000
+        r = emu.load_robot(b, sn=f"B{i}", seed=seed + i)
+        r.bs.en = sync
+        sw.add(b, r)
+        bots.append((b, r, off))
+    sp, err, fol = [], [], [0]
+
+    def sample(t):
+        # every robot has reached room time t; evaluate the grids there
+        if t < warmup_s * 1000:
+            return
+        ph = []
+        for b, r, off in bots:
+            if r.gst == ST_DANCE:
+                ph.append(r.bs.next_beat(t + off) - off)
+                fol[0] += 1 if r.bs.follow(t + off) else 0
+        if len(ph) > 1:
+            sp.append(spread(ph))
+        err.extend(abs(circ(x)) for x in ph)
+
+    sw.run(seconds * 1000, SAMPLE_MS, sample)
+    sp.sort()
+    return {
+        "spread": sum(sp) / max(1, len(sp)),
+        "spread95": sp[int(len(sp) * 0.95)] if sp else 0,
+        "spread_max": sp[-1] if sp else 0,
+        "err": sum(err) / max(1, len(err)),
+        "follow": fol[0] / max(1, len(err)),
+        "switches": sum(r.bs.n_sw for _, r, _ in bots),
+        "conf": [r.bs.conf for _, r, _ in bots],
+        "tx": sw.medium.n_tx,
+        "drop": sum(b.n_full for b, _, _ in bots),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure beat phase drift between robots dancing together")
+    parser.add_argument("--robots", type=int, default=6)
+    parser.add_argument("--seconds", type=int, default=60, help="Room time to simulate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=["both", "on", "off"], default="both", help="Beat sync setting")
+    args = parser.parse_args()
+
+    print(f"=== Beat sync: {args.robots} robots, {args.seconds}s at {60000 // PERIOD_MS} bpm ===")
+    print(f"{'sync':6}{'spread':>8}{'p95':>6}{'max':>6}{'|err|':>7}{'follow':>8}{'switch':>8}{'tx':>6}{'drop':>6}  conf")
+    for on in {"both": (False, True), "on": (True,), "off": (False,)}[args.mode]:
+        m = simulate(args.robots, args.seconds, args.seed, on)
+        print(f"{'on' if on else 'off':6}{m['spread']:8.0f}{m['spread95']:6}{m['spread_max']:6}{m['err']:7.0f}"
+              f"{m['follow']:8.0%}{m['switches']:8}{m['tx']:6}{m['drop']:6}  {m['conf']}")
+    print("  - spread: arc of the beat circle (ms) holding the next beat of all dancing robots")
+    print("  - |err|: mean distance (ms) of a robot's beat grid from the music's")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,553 @@
+#!/usr/bin/env python3
+"""
+Radio Bridge Service
+
+Controls many robots from a Linux host through a micro:bit connected over
+USB that acts as a radio relay:
+1. The relay program (RELAY) is started over the raw REPL. It sends the
+   packets the host writes, on the group in each packet's header, and
+   forwards every packet it hears on its listen groups, cycling through
+   them, back over the serial line
+2. The asyncio bridge queues outgoing commands, coalescing repeated values
+   of the same command to the same group, and writes them in batches under
+   a global and a per-group rate limit (a robot queues only 3 packets and
+   reads them every 100 ms when idle and every 500 ms asleep; the default
+   of 4 per second, without bursts, never puts more than 3 in a sleeping
+   robot's queue) and a window of packets the relay has not confirmed yet
+3. `#puc` status codes and telemetry values heard from the robots are kept
+   per robot and pushed to subscribed clients
+4. Clients talk JSON lines over TCP or a Unix socket:
+   {"op": "send", "groups": [166, 167], "name": "#puB", "value": 3}
+   {"op": "send", "groups": [166], "text": "#putHello"}
+   {"op": "listen", "groups": [166, 167], "dwell": 200}
+   {"op": "status"}, {"op": "stats"}, {"op": "subscribe"}
+
+--loopback N replaces the serial relay with N emulated robots on a virtual
+radio medium (utils.emu), so the bridge and its clients run without hardware.
+
+Usage:
+    python -m utils.bridge serve [--port PORT | --loopback 4] [--tcp 127.0.0.1:8765 | --unix /tmp/pu.sock]
+    python -m utils.bridge send --groups 166,167 --name "#puB" --value 3
+    python -m utils.bridge send --groups 166 --text "#putHello"
+    python -m utils.bridge listen --groups 166,167
+    python -m utils.bridge status
+    python -m utils.bridge watch
+    python -m utils.bridge selftest [--loopback 4]       # bridge and client in one process
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import OrderedDict
+
+from utils import packets
+
+GROUP0 = 166
+CHANNEL = 7
+ADDR = "127.0.0.1:8765"
+
+# Relay program run on the USB micro:bit. Lines from the host:
+# S<hex> send a packet (on the group in its header), L<g>,<g>... set the
+# listen groups, D<ms> set the listen dwell time. Lines to the host:
+# R<hex> packet received, K packet sent.
+RELAY = """from microbit import *
+import radio
+radio.config(channel={ch},queue=10,length=32,data_rate=radio.RATE_1MBIT,power=6)
+radio.on()
+L=[{g}];D={dw};i=0;t=running_time();b=b''
+radio.config(group=L[0])
+while 1:
+ n=uart.any()
+ if n:
+  b+=uart.read(n)
+  j=b.find(b'\\n')
+  while j>=0:
+   l=b[:j];b=b[j+1:];j=b.find(b'\\n');c=l[:1]
+   if c==b'S':
+    d=bytes(int(l[k:k+2],16) for k in range(1,len(l)-1,2))
+    radio.config(group=d[1]);radio.send_bytes(d);radio.config(group=L[i])
+    print('K')
+   elif c==b'L':
+    L=[int(x) for x in l[1:].split(b',')];i=0;radio.config(group=L[0])
+   elif c==b'D':
+    D=int(l[1:])
+ d=radio.receive_bytes()
+ while d:
+  print('R'+''.join('%02x'%x for x in d))
+  d=radio.receive_bytes()
+ if len(L)>1 and running_time()-t>D:
+  i=(i+1)%len(L);t=running_time();radio.config(group=L[i])
+"""
+
+
+class SerialLink(object):
+    """
+    Relay micro:bit on a serial port, running RELAY.
+
+    Args:
+        port (str): Serial port (auto-detected if None)
+        group (int): First listen group
+        dwell_ms (int): Time on each listen group
+    """
+    def __init__(self, port=None, group=GROUP0, dwell_ms=200):
+        from utils.raw_repl import RawRepl, open_serial
+        self.ser = open_serial(port)
+        self.repl = RawRepl(self.ser)
+        self.repl.enter()
+        self.ser.write(RELAY.format(ch=CHANNEL, g=group, dw=dwell_ms).encode() + b"\x04")
+        self.repl.read_until(b"OK")
+
+    async def readline(self):
+        return (await asyncio.get_running_loop().run_in_executor(None, self.ser.readline)).strip()
+
+    def write(self, b):
+        self.ser.write(b)
+
+    def close(self):
+        self.ser.write(b"\x03")
+        self.repl.exit(reset=True)
+        self.ser.close()
+
+
+class _RelayNode(object):
+    """The relay micro:bit as a node on the emulated medium."""
+    def __init__(self, link, group):
+        self.name = "relay"
+        self.link = link
+        self.radio_cfg = {"group": group, "channel": CHANNEL, "queue": 10}
+        self.radio_on = True
+        self.rx, self.air = [], []
+        self.medium = None
+        self.n_loss = self.n_coll = self.n_full = 0
+
+    def room_us(self):
+        return self.link.now_us()
+
+
+class LoopbackLink(object):
+    """
+    Stand-in for the relay: n emulated robots on groups 166 + i, run in real
+    time on a virtual radio medium, behind the same line protocol as RELAY.
+
+    Args:
+        n (int): Number of robots
+        loss (float): Random packet loss on the medium
+        dwell_ms (int): Time on each listen group
+    """
+    def __init__(self, n=4, loss=0.0, dwell_ms=200, seed=0):
+        from utils import emu
+        from utils.swarm import Swarm
+        self.sw = Swarm(emu.Medium(loss, 1.0, 0.5, True, seed))
+        self.bots = []
+        rng = random.Random(seed)
+        for i in range(n):
+            b = emu.Board(name=f"pu{i}")
+            r = emu.load_robot(b, sn=f"P{i}", seed=seed + i)
+            r.set_group(GROUP0 + i)
+            b.t0_us = b.t_us - 500000 - rng.randint(0, 1500000)  # powered on one after another
+            self.sw.add(b, r)
+            self.bots.append((b, r))
+        self.node = _RelayNode(self, GROUP0)
+        self.sw.medium.attach(self.node)
+        self.listen, self.li, self.dwell, self.l_ts = [GROUP0], 0, dwell_ms, 0
+        self.t0 = time.monotonic()
+        self.out = asyncio.Queue()
+        self.task = None
+
+    def now_us(self):
+        return int((time.monotonic() - self.t0) * 1e6)
+
+    def tune(self, g):
+        self.node.radio_cfg["group"] = g
+
+    async def run(self):
+        # step the robots up to the wall clock and forward what the relay hears
+        while True:
+            t = self.now_us()
+            self.sw.run(t // 1000)
+            self.sw.medium.poll(self.node)
+            while self.node.rx:
+                d = self.node.rx.pop(0)[0]
+                self.out.put_nowait(b"R" + d.hex().encode())
+            if len(self.listen) > 1 and t // 1000 - self.l_ts > self.dwell:
+                self.li = (self.li + 1) % len(self.listen)
+                self.l_ts = t // 1000
+                self.tune(self.listen[self.li])
+            await asyncio.sleep(0.005)
+
+    async def readline(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+        return await self.out.get()
+
+    def write(self, b):
+        for l in b.split(b"\n"):
+            c = l[:1]
+            if c == b"S":
+                d = bytes.fromhex(l[1:].decode())
+                self.tune(d[1])
+                self.sw.medium.send(self.node, d)
+                self.tune(self.listen[self.li])
+                self.out.put_nowait(b"K")
+            elif c == b"L":
+                self.listen, self.li = [int(x) for x in l[1:].split(b",")], 0
+                self.tune(self.listen[0])
+            elif c == b"D":
+                self.dwell = int(l[1:])
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
+
+
+class Bucket(object):
+    """Token bucket allowing `rate` events per second in bursts of up to `burst`."""
+    def __init__(self, rate, burst):
+        self.rate, self.burst = rate, burst
+        self.tok, self.ts = burst, time.monotonic()
+
+    def ok(self, now):
+        """Refill the bucket; True if a token is available (take it with `tok -= 1`)."""
+        self.tok = min(self.burst, self.tok + (now - self.ts) * self.rate)
+        self.ts = now
+        return self.tok >= 1
+
+
+class Bridge(object):
+    """
+    Command queue, rate limiting and status collection between API clients
+    and a relay link.
+
+    Args:
+        link: SerialLink or LoopbackLink
+        rate (float): Packets per second over the air, all groups together
+        per_group (float): Packets per second to one group, one at a time; 4
+            suits sleeping robots, moving robots (50 Hz loop) take far more
+        window (int): Packets written to the relay and not yet confirmed
+    """
+    def __init__(self, link, rate=100, per_group=4, window=4):
+        self.link = link
+        self.q = OrderedDict()    # (group, key) -> packet; values of the same command are coalesced
+        self.bucket = Bucket(rate, max(1, rate // 10))
+        self.per_group = per_group
+        self.g_bk = {}            # group -> Bucket
+        self.window = window
+        self.credit = window      # packets the relay may still take
+        self.k_ts = 0             # time of the last confirmation (s)
+        self.robots = {}          # serial -> {"group", "code", "t"} from #puc status codes
+        self.tlm = {}             # "group/sender" -> {name: value}
+        self.subs = []            # queues of subscribed clients
+        self.wake = asyncio.Event()
+        self.seq = 0
+        self.n_in = self.n_sent = self.n_merged = self.n_rx = self.n_bad = 0
+
+    # queue a packet for a group
+    def put(self, g, pkt, key=None):
+        """
+        Queue a packet; a packet with the same key for the same group that is
+        still waiting is replaced, keeping its place in the queue.
+        """
+        self.n_in += 1
+        if key is None:
+            self.seq += 1
+            key = self.seq
+        elif (g, key) in self.q:
+            self.n_merged += 1
+        self.q[(g, key)] = pkt
+        self.wake.set()
+
+    def send(self, groups, name=None, value=None, text=None):
+        for g in groups:
+            if text is not None:
+                self.put(g, packets.str_packet(text, g))
+            else:
+                self.put(g, packets.value_packet(name, value, g), name)
+        return len(groups)
+
+    def listen(self, groups, dwell=None):
+        if dwell:
+            self.link.write(b"D%d\n" % dwell)
+        self.link.write(b"L" + ",".join(str(g) for g in groups).encode() + b"\n")
+
+    async def pump(self):
+        # write queued packets in batches, within the rate limits and the window
+        while True:
+            now = time.monotonic()
+            if self.credit < self.window and now - self.k_ts > 1.0:
+                self.credit = self.window  # confirmations lost; resynchronise
+            batch = []
+            for k in list(self.q):
+                if self.credit - len(batch) <= 0:
+                    break
+                gb = self.g_bk.get(k[0])
+                if gb is None:
+                    gb = self.g_bk[k[0]] = Bucket(self.per_group, 1)
+                if not gb.ok(now):
+                    continue  # this group is busy; others may go first
+                if not self.bucket.ok(now):
+                    break
+                gb.tok -= 1
+                self.bucket.tok -= 1
+                batch.append(b"S" + self.q.pop(k).hex().encode())
+            if batch:
+                self.credit -= len(batch)
+                self.k_ts = now
+                self.n_sent += len(batch)
+                self.link.write(b"\n".join(batch) + b"\n")
+            self.wake.clear()
+            try:
+                await asyncio.wait_for(self.wake.wait(), 0.01 if self.q else 1.0)
+            except asyncio.TimeoutError:
+                pass
+
+    async def receive(self):
+        # collect confirmations, status codes and telemetry from the relay
+        while True:
+            l = await self.link.readline()
+            if l == b"K":
+                self.credit = min(self.window, self.credit + 1)
+                self.k_ts = time.monotonic()
+                self.wake.set()
+            elif l[:1] == b"R":
+                try:
+                    p = packets.parse_packet(bytes.fromhex(l[1:].decode()))
+                except ValueError:
+                    p = None
+                if p is None:
+                    self.n_bad += 1
+                    continue
+                self.n_rx += 1
+                self.heard(*p)
+
+    def heard(self, g, ts, sn, d):
+        ev = {"group": g, "from": f"{sn:08x}", "ts": ts}
+        if isinstance(d, str) and d.startswith("#puc:"):
+            _, name, code = (d.split(":", 2) + ["", ""])[:3]
+            self.robots[name] = {"group": g, "code": code, "t": round(time.time(), 3)}
+            ev.update(ev="status", sn=name, code=code)
+        elif isinstance(d, tuple):
+            self.tlm.setdefault(f"{g}/{sn:08x}", {})[d[0]] = d[1]
+            ev.update(ev="value", name=d[0], value=d[1])
+        else:
+            ev.update(ev="str", text=d)
+        for q in self.subs:
+            if q.qsize() < 1000:
+                q.put_nowait(ev)
+
+    def stats(self):
+        return {"queued": len(self.q), "in": self.n_in, "sent": self.n_sent, "merged": self.n_merged,
+                "credit": self.credit, "rx": self.n_rx, "bad": self.n_bad}
+
+    async def handle(self, reader, writer):
+        # one API client: a JSON request per line, a JSON reply per line
+        async def reply(o):
+            writer.write(json.dumps(o).encode() + b"\n")
+            await writer.drain()
+        try:
+            while True:
+                l = await reader.readline()
+                if not l:
+                    break
+                try:
+                    m = json.loads(l)
+                    op = m.get("op")
+                    groups = m.get("groups") or ([m["group"]] if "group" in m else [])
+                    if op == "send":
+                        if not groups or (m.get("text") is None and not m.get("name")):
+                            raise ValueError("send needs groups and a name/value or a text")
+                        v = m.get("value", 0)
+                        if not isinstance(v, (int, float)) or isinstance(v, bool):
+                            raise ValueError("value must be a number")
+                        await reply({"ok": True, "queued": self.send(groups, m.get("name"), v, m.get("text"))})
+                    elif op == "listen":
+                        if not groups:
+                            raise ValueError("listen needs groups")
+                        self.listen(groups, m.get("dwell"))
+                        await reply({"ok": True})
+                    elif op == "status":
+                        await reply({"ok": True, "robots": self.robots, "telemetry": self.tlm})
+                    elif op == "stats":
+                        await reply(dict(self.stats(), ok=True))
+                    elif op == "subscribe":
+                        q = asyncio.Queue()
+                        self.subs.append(q)
+                        try:
+                            await reply({"ok": True})
+                            while True:
+                                await reply(await q.get())
+                        finally:
+                            self.subs.remove(q)
+                    else:
+                        raise ValueError(f"unknown op {op!r}")
+                except (ValueError, KeyError, TypeError) as e:
+                    await reply({"ok": False, "error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass  # client gone or bridge shutting down
+        finally:
+            writer.close()
+
+
+async def open_api(addr):
+    """Open a client connection to a bridge at host:port or a Unix socket path."""
+    if ":" in addr:
+        host, port = addr.rsplit(":", 1)
+        return await asyncio.open_connection(host, int(port))
+    return await asyncio.open_unix_connection(addr)
+
+
+async def request(addr, msg):
+    """Send one request to a bridge and return its reply."""
+    reader, writer = await open_api(addr)
+    writer.write(json.dumps(msg).encode() + b"\n")
+    await writer.drain()
+    r = json.loads(await reader.readline())
+    writer.close()
+    return r
+
+
+async def serve(link, addr, args):
+    """Run a bridge on `link` with its API on `addr` until cancelled."""
+    br = Bridge(link, args.rate, args.per_group, args.window)
+    if ":" in addr:
+        host, port = addr.rsplit(":", 1)
+        srv = await asyncio.start_server(br.handle, host, int(port))
+    else:
+        srv = await asyncio.start_unix_server(br.handle, addr)
+    tasks = [asyncio.ensure_future(br.pump()), asyncio.ensure_future(br.receive())]
+    return br, srv, tasks
+
+
+def make_link(args):
+    if args.loopback:
+        return LoopbackLink(args.loopback, args.loss, args.dwell)
+    return SerialLink(args.port, GROUP0, args.dwell)
+
+
+async def serve_forever(args):
+    link = make_link(args)
+    addr = args.unix or args.tcp
+    br, srv, tasks = await serve(link, addr, args)
+    print(f"=== Radio bridge on {addr} ({'loopback, %d robots' % args.loopback if args.loopback else 'serial relay'}) ===", flush=True)
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        srv.close()
+        link.close()
+
+
+async def selftest(args):
+    """Run a loopback bridge and drive it through its API, as a client would."""
+    n = args.loopback or 4
+    args.loopback = n
+    link = make_link(args)
+    addr = args.unix or args.tcp
+    br, srv, tasks = await serve(link, addr, args)
+    groups = [GROUP0 + i for i in range(n)]
+    print(f"=== Bridge self-test: {n} loopback robots on groups {groups[0]}-{groups[-1]} ===")
+    reader, writer = await open_api(addr)
+    writer.write(b'{"op": "subscribe"}\n')
+    await writer.drain()
+    await reader.readline()
+    ev, acks = {}, set()
+
+    async def collect(s, g=None):
+        # count pushed events for s seconds, or until group g acknowledges
+        t0 = time.monotonic()
+        while time.monotonic() - t0 < s and g not in acks:
+            try:
+                e = json.loads(await asyncio.wait_for(reader.readline(), 0.1))
+            except asyncio.TimeoutError:
+                continue
+            ev[e["ev"]] = ev.get(e["ev"], 0) + 1
+            if e.get("text") == "#puack":
+                acks.add(e["group"])
+    print("  -", await request(addr, {"op": "listen", "groups": groups, "dwell": 100}))
+    await collect(1.0)  # boot status codes
+    print("  -", await request(addr, {"op": "send", "groups": groups, "name": "#putl", "value": 5}))
+    for i in range(20):  # a burst of joystick values, mostly coalesced
+        await request(addr, {"op": "send", "groups": groups, "name": "#puturn", "value": i / 20})
+    await collect(args.seconds)
+    for g in groups:
+        # the robot acknowledges Rest with "#puack"; listen on its group only
+        # and retry, as a packet may be lost in the air
+        await request(addr, {"op": "listen", "groups": [g]})
+        for _ in range(3):
+            await request(addr, {"op": "send", "groups": [g], "name": "#puB", "value": 0})
+            await collect(0.6, g)
+            if g in acks:
+                break
+    st = await request(addr, {"op": "status"})
+    s = await request(addr, {"op": "stats"})
+    print(f"  - Events pushed: {ev}, acknowledged by groups {sorted(acks)}")
+    print(f"  - Status codes: {st['robots']}")
+    print(f"  - Telemetry from {len(st['telemetry'])} robots, e.g. "
+          f"{next(iter(st['telemetry'].values()), {})}")
+    print(f"  - Stats: {s}")
+    err = await request(addr, {"op": "send", "groups": groups, "name": "#puB", "value": "x"})
+    print(f"  - Bad request: {err}")
+    writer.close()
+    for t in tasks:
+        t.cancel()
+    srv.close()
+    link.close()
+    ok = len(st["telemetry"]) == n and len(acks) == n and not err["ok"]
+    print("Self-test", "passed" if ok else "FAILED")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bridge between API clients and robots over a relay micro:bit")
+    parser.add_argument("cmd", choices=["serve", "send", "listen", "status", "stats", "watch", "selftest"])
+    parser.add_argument("--tcp", default=ADDR, help="API address host:port")
+    parser.add_argument("--unix", help="API Unix socket path (instead of TCP)")
+    parser.add_argument("--port", help="Serial port of the relay micro:bit (auto-detected if omitted)")
+    parser.add_argument("--loopback", type=int, default=0, help="Emulate N robots instead of a relay")
+    parser.add_argument("--loss", type=float, default=0.0, help="Packet loss of the loopback medium")
+    parser.add_argument("--rate", type=int, default=100, help="Packets per second, all groups")
+    parser.add_argument("--per-group", type=float, default=4,
+                        help="Packets per second to one group (raise for robots driven while moving)")
+    parser.add_argument("--window", type=int, default=4, help="Unconfirmed packets in flight to the relay")
+    parser.add_argument("--dwell", type=int, default=200, help="Time on each listen group (ms)")
+    parser.add_argument("--groups", default=str(GROUP0), help="Comma-separated groups, e.g. 166,167")
+    parser.add_argument("--name", help="Value name to send, e.g. #puB")
+    parser.add_argument("--value", type=float, help="Value to send (integers are sent as int)")
+    parser.add_argument("--text", help="String to send instead of a value, e.g. #putHello")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Self-test listen time")
+    args = parser.parse_args()
+    addr = args.unix or args.tcp
+    groups = [int(g) for g in args.groups.split(",")]
+
+    if args.cmd == "serve":
+        try:
+            asyncio.run(serve_forever(args))
+        except KeyboardInterrupt:
+            pass
+    elif args.cmd == "selftest":
+        sys.exit(0 if asyncio.run(selftest(args)) else 1)
+    elif args.cmd == "watch":
+        async def watch():
+            reader, writer = await open_api(addr)
+            writer.write(b'{"op": "subscribe"}\n')
+            while True:
+                l = await reader.readline()
+                if not l:
+                    break
+                print(l.decode().strip())
+        try:
+            asyncio.run(watch())
+        except KeyboardInterrupt:
+            pass
+    else:
+        m = {"op": args.cmd, "groups": groups}
+        if args.cmd == "send":
+            v = args.value
+            m.update(text=args.text) if args.text else m.update(
+                name=args.name, value=int(v) if v is not None and v == int(v) else v)
+        print(json.dumps(asyncio.run(request(addr, m)), indent=1))
+
+
+if __name__ == "__main__":
+    main()
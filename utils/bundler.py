@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Dependency-Aware Bundler
+
+Merges the project modules into a single script for the hex file:
+1. Orders modules topologically by their imports, main.py last
+2. Removes imports of project modules that are now inlined
+3. Hoists and de-duplicates the remaining (firmware) imports
+4. Drops module-level functions, classes and constant assignments nothing uses
+5. Reports the bundle size against the micro:bit script limit
+
+Usage:
+    python -m utils.bundler [--src DIR] [--entry main] [-o OUTPUT]
+"""
+
+import os
+import ast
+import sys
+import argparse
+
+SCRIPT_LIMIT = 8188  # bytes of script uflash can embed in a hex file
+
+
+class BundleError(Exception):
+    """Raised when the modules cannot be merged into one namespace."""
+
+
+def _load(src_dir):
+    mods = {}
+    for f in sorted(os.listdir(src_dir)):
+        if f.endswith('.py'):
+            with open(os.path.join(src_dir, f)) as fh:
+                mods[f[:-3]] = ast.parse(fh.read(), f)
+    return mods
+
+
+def _deps(tree, mods):
+    # Walk the whole tree: modules may be imported lazily inside functions
+    deps = []
+    for n in ast.walk(tree):
+        if isinstance(n, ast.ImportFrom) and n.module in mods:
+            deps.append(n.module)
+        elif isinstance(n, ast.Import):
+            deps.extend(a.name for a in n.names if a.name in mods)
+    return deps
+
+
+def order_modules(mods, entry):
+    """Return the modules reachable from `entry`, dependencies first.
+
+    Raises:
+        BundleError: On a circular import
+    """
+    order, state = [], {}
+
+    def visit(m, path):
+        if state.get(m) == 2:
+            return
+        if state.get(m) == 1:
+            raise BundleError("circular import: " + " -> ".join(path + [m]))
+        state[m] = 1
+        for d in _deps(mods[m], mods):
+            visit(d, path + [m])
+        state[m] = 2
+        order.append(m)
+
+    visit(entry, [])
+    return order
+
+
+class _Inline(ast.NodeTransformer):
+    """Remove imports of inlined modules and rewrite `X.name` to `name`."""
+    def __init__(self, mods):
+        self.mods = mods
+
+    def visit_ImportFrom(self, node):
+        return ast.copy_location(ast.Pass(), node) if node.module in self.mods else node
+
+    def visit_Import(self, node):
+        node.names = [a for a in node.names if a.name not in self.mods]
+        return node if node.names else ast.copy_location(ast.Pass(), node)
+
+    def visit_Attribute(self, node):
+        self.generic_visit(node)
+        if isinstance(node.value, ast.Name) and node.value.id in self.mods:
+            return ast.copy_location(ast.Name(node.attr, node.ctx), node)
+        return node
+
+
+def _defined(n):
+    """Names bound by a module-level statement that may be dropped if unused."""
+    if isinstance(n, (ast.FunctionDef, ast.ClassDef)):
+        return [n.name]
+    if isinstance(n, (ast.Assign, ast.AnnAssign)):
+        # Only drop assignments without calls; calls may have side effects
+        if any(isinstance(c, ast.Call) for c in ast.walk(n.value)) if n.value else True:
+            return []
+        targets = n.targets if isinstance(n, ast.Assign) else [n.target]
+        if all(isinstance(t, ast.Name) for t in targets):
+            return [t.id for t in targets]
+    return []
+
+
+def _binds(n):
+    """All names bound by a module-level statement."""
+    if isinstance(n, (ast.FunctionDef, ast.ClassDef)):
+        return [n.name]
+    if isinstance(n, (ast.Assign, ast.AnnAssign)):
+        targets = n.targets if isinstance(n, ast.Assign) else [n.target]
+        return [c.id for t in targets for c in ast.walk(t) if isinstance(c, ast.Name)]
+    return []
+
+
+def _used(nodes):
+    used = set()
+    for n in nodes:
+        for c in ast.walk(n):
+            if isinstance(c, ast.Name) and not isinstance(c.ctx, ast.Store):
+                used.add(c.id)
+            elif isinstance(c, ast.Attribute):
+                used.add(c.attr)
+    return used
+
+
+def _shake(body):
+    """Drop unused definitions until nothing else can be removed."""
+    while True:
+        keep = []
+        for i, n in enumerate(body):
+            names = _defined(n)
+            # A definition only referencing itself (recursion) is still unused
+            if names and not (set(names) & _used(body[:i] + body[i + 1:])):
+                continue
+            keep.append(n)
+        if len(keep) == len(body):
+            return body
+        body = keep
+
+
+def bundle(src_dir, entry='main'):
+    """Merge the modules of `src_dir` reachable from `entry` into one script.
+
+    Returns:
+        tuple[str, list[str], list[str]]: (source, module order, dropped names)
+
+    Raises:
+        BundleError: On circular imports or conflicting top-level names
+    """
+    mods = _load(src_dir)
+    if entry not in mods:
+        raise BundleError(f"{entry}.py not found in {src_dir}")
+    order = order_modules(mods, entry)
+    imports, seen, body, owner = [], set(), [], {}
+    for m in order:
+        tree = _Inline(mods).visit(mods[m])
+        for n in tree.body:
+            if isinstance(n, ast.Pass):
+                continue
+            if isinstance(n, (ast.Import, ast.ImportFrom)):
+                key = ast.dump(n)
+                if key not in seen:
+                    seen.add(key)
+                    imports.append(n)
+                continue
+            for name in _binds(n):
+                if owner.setdefault(name, m) != m:
+                    raise BundleError(f"'{name}' is defined in both {owner[name]}.py and {m}.py")
+            body.append(n)
+    kept = _shake(body)
+    dropped = sorted({x for n in body if n not in kept for x in _defined(n)})
+    tree = ast.Module(body=imports + kept, type_ignores=[])
+    return ast.unparse(ast.fix_missing_locations(tree)) + '\n', order, dropped
+
+
+def report(size, limit=SCRIPT_LIMIT):
+    """Print the bundle size against the script limit; return True if it fits."""
+    print(f"  - Bundle size: {size} / {limit} bytes ({size * 100 // limit}%)")
+    if size > limit:
+        print(f"  - Warning: bundle exceeds the micro:bit script limit by {size - limit} bytes")
+    return size <= limit
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bundle project modules into a single micro:bit script')
+    parser.add_argument('--src', default='build', help='Directory with the (minified) modules')
+    parser.add_argument('--entry', default='main', help='Entry module, bundled last')
+    parser.add_argument('-o', '--output', default='merged_main.py', help='Output file')
+    args = parser.parse_args()
+    try:
+        code, order, dropped = bundle(args.src, args.entry)
+    except BundleError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    with open(args.output, 'w') as f:
+        f.write(code)
+    print(f"  - Order: {', '.join(order)}")
+    print(f"  - Dropped unused: {', '.join(dropped) or 'none'}")
+    report(len(code.encode('utf8')))
+
+
+if __name__ == '__main__':
+    main()
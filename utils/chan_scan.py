@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Channel Congestion Scan Simulation
+
+Runs a classroom of robot and gamepad pairs on the host hardware stand-in
+(utils.emu), crowded onto a few radio channels, plus one robot under test
+whose controller follows its channel announcements:
+1. Classroom pairs use neighbouring groups from 160 up, as set with
+   buttons A and B, and the channels given by --load, interleaved over the
+   groups as robots keep their group when moving; the robot under test
+   starts on channel 7, group 166, with its controller
+2. Command delivery to the robot under test (packets read / sent, and
+   collisions) is measured for --seconds
+3. The controller sends "#puscan"; the robot scans channels and groups
+   (see ChanScan), reports the rate of each channel ("sc<channel>") and
+   announces its new channel and group ("#puch"), which the controller
+   follows
+4. Delivery is measured again on the new channel, and the rates the robot
+   estimated are printed next to the real packet rate of each channel
+
+Usage:
+    python -m utils.chan_scan [--load 7:12,17:6,27:3,37:1] [--seconds 10] [--seed 0]
+"""
+
+import argparse
+
+from utils import emu
+from utils.latency import Pad
+from utils.swarm import Swarm
+
+GROUP = 166          # group of the robot under test
+CHAN0 = 7            # its channel before the scan
+
+
+class Follower(Pad):
+    """Gamepad that retunes to the channel and group its robot announces."""
+    def keep(self):
+        super().keep()
+        for name, v in self.got:
+            if name == "#puch":
+                self.radio_cfg["channel"], self.radio_cfg["group"] = v >> 8, v & 0xff
+
+
+def build(args):
+    """Boot the classroom and the robot under test.
+
+    Returns:
+        tuple: (Swarm, Board, RobotPu, Follower, dict of channel -> classroom pairs)
+    """
+    med = emu.Medium(0.0, 1.0, 0.5, True, args.seed)
+    sw = Swarm(med)
+    load = {int(c): int(n) for c, n in (x.split(":") for x in args.load.split(","))}
+    # robots moved to another channel keep their group, so channels interleave
+    chans = [ch for i in range(max(load.values())) for ch in sorted(load) if i < load[ch]]
+    g = 160
+    for k, ch in enumerate(chans):
+        g += 1 if g + 1 != GROUP else 2
+        b = emu.Board(name=f"pu{k}")
+        b.t_us = b.t0_us = k * 37000  # staggered power-on
+        r = emu.load_robot(b, sn=f"C{k}", seed=args.seed + k)
+        r.chan = ch
+        r.set_group(g)
+        pad = Pad(g, 100, args.seed + k)
+        pad.radio_cfg["channel"] = ch
+        sw.add(b, r)
+        sw.add(pad)
+    b = emu.Board(name="dut")
+    r = emu.load_robot(b, sn="DUT", seed=args.seed)
+    r.set_group(GROUP)
+    pad = Follower(GROUP, 100, args.seed + 1000)
+    pad.radio_cfg["queue"] = 64  # listens like a relay, so no report is dropped
+    sw.add(b, r)
+    sw.add(pad)
+    return sw, b, r, pad, load
+
+
+def delivery(sw, b, pad, sent, until_ms):
+    """Run to until_ms and measure how many of the controller's packets the robot read."""
+    b.lat.clear()
+    b.n_loss = b.n_coll = b.n_full = 0
+    n0 = sent.get(pad, 0)
+    sw.run(until_ms)
+    got = sum(1 for src, _ in b.lat if src is pad)
+    n = sent.get(pad, 0) - n0
+    return got / max(1, n), b.n_coll / max(1, n)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a channel congestion scan in a crowded classroom")
+    parser.add_argument("--load", default="7:12,17:6,27:3,37:1", help="Classroom pairs per channel, channel:pairs")
+    parser.add_argument("--seconds", type=int, default=10, help="Room time measured before and after the scan")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sw, b, r, pad, load = build(args)
+    sent, per_ch = {}, {}
+    send = sw.medium.send
+
+    def count(src, pkt):
+        sent[src] = sent.get(src, 0) + 1
+        ch = src.radio_cfg["channel"]
+        per_ch[ch] = per_ch.get(ch, 0) + 1
+        send(src, pkt)
+
+    sw.medium.send = count
+    t = max(n.room_us() for n, _ in sw.nodes) // 1000 + 2000
+    sw.run(t)
+    per_ch.clear()
+    ok0, coll0 = delivery(sw, b, pad, sent, t + args.seconds * 1000)
+    real = {ch: n / args.seconds for ch, n in per_ch.items()}
+
+    t += args.seconds * 1000
+    pad.got.clear()
+    pad.cmd.append(("#puscan", 0))
+    t0 = t
+    while r.cs.n_scan == 0 and t < t0 + 20000:
+        t += 100
+        sw.run(t)
+    scan_s = (t - t0) / 1000
+    sw.run(t + 500)
+    est = {int(n[2:]): v for n, v in pad.got if n.startswith("sc")}
+    ok1, coll1 = delivery(sw, b, pad, sent, t + 500 + args.seconds * 1000)
+
+    print(f"=== Channel scan: {sum(load.values())} classroom pairs, robot on channel {CHAN0} group {GROUP} ===")
+    print(f"{'channel':>8}{'pairs':>7}{'real pkt/s':>12}{'scanned':>9}")
+    for ch in r.cs.chans:
+        print(f"{ch:8}{load.get(ch, 0):7}{real.get(ch, 0):12.0f}{est.get(ch, '-'):>9}")
+    print(f"  - scan took {scan_s:.1f}s and picked channel {r.cs.mv[0]} group {r.cs.mv[1]}; robot now on channel "
+          f"{r.chan} group {r.groupID}, controller on channel {pad.radio_cfg['channel']} group {pad.radio_cfg['group']}")
+    print(f"  - commands delivered: {ok0:.1%} before (collided {coll0:.1%}), {ok1:.1%} after (collided {coll1:.1%})")
+    print("  - scanned: packets/s the robot heard on its own and the 12 neighbouring groups")
+
+
+if __name__ == "__main__":
+    main()
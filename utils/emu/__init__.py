@@ -0,0 +1,332 @@
+"""
+Host-side micro:bit stand-in for running the robot firmware on a PC.
+
+install() registers emulated `microbit`, `radio`, `speech`, `neopixel`,
+`machine`, `utime` and `ustruct` modules and adds the MicroPython tick
+functions to `time`. Every hardware call goes to the current Board, which
+owns a virtual clock, a sensor Source, the radio queue and a trace of I2C
+writes. Several robots can share one process: load_robot() gives each its
+own copy of PuBot (and so its own `pr` and `wk`), Board.step() selects
+the board before ticking its robot, and a Medium carries radio packets
+between boards.
+"""
+
+import os
+import sys
+import math
+import random
+import bisect
+import struct
+import tempfile
+import importlib
+import importlib.util
+
+from utils.packets import value_packet, str_packet  # noqa: F401  (re-exported for sources)
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "src")
+TICKS_PERIOD = 1 << 30
+
+_board = None
+
+
+def board():
+    """Return the board hardware calls currently go to."""
+    return _board
+
+
+def use(b):
+    """Make `b` the current board."""
+    global _board
+    _board = b
+
+
+class Source(object):
+    """
+    Sensor inputs of a robot standing still in a quiet room.
+
+    Subclasses override the channels they drive; `t` is the board time in ms.
+    """
+    def accel(self, t):
+        return (0, 0, -1024)
+
+    def sound(self, t):
+        return 20
+
+    def loud(self, t):
+        return False
+
+    def sonar(self, t):
+        return 2910  # about 50 cm
+
+    def gesture(self, t, name):
+        return False
+
+    def button(self, t, name):
+        return False
+
+    def radio(self, t):
+        return None
+
+    def temperature(self, t):
+        return 22
+
+    def pin(self, t, n):
+        return 0
+
+
+class Board(object):
+    """
+    Emulated hardware of one robot.
+
+    Args:
+        source (Source): Sensor and radio inputs
+        name (str): Name used in reports
+    """
+    def __init__(self, source=None, name="pu"):
+        self.name = name
+        self.source = source or Source()
+        self.t_us = 0
+        self.t0_us = 0            # board clock at room time 0, for boards sharing a medium
+        self.recorder = None      # Recorder logging every input read
+        self.trace = []           # (t_ms, register, value) of each I2C write
+        self.i2c_nack = None      # fault injection: f(t_ms, addr) -> True to NACK an I2C write
+        self.rx = []              # radio receive queue of (packet, sender, room send time us)
+        self.air = []             # packets on their way from a medium, by arrival time
+        self.medium = None        # shared radio medium, if any
+        self.lat = []             # (sender, us from send to read) of each packet read from the medium
+        self.n_loss = 0           # packets lost on the way to this board
+        self.n_coll = 0           # packets lost to collisions
+        self.n_full = 0           # packets dropped on a full receive queue
+        self.radio_cfg = {"group": 0, "channel": 7, "queue": 3, "power": 6}
+        self.radio_on = False
+        self.sent = []            # (t_ms, packet) of each radio send
+        self.said = []            # text spoken or sung
+        self.pins = {}            # last value written to each pin
+        self.pixels = None        # last NeoPixel frame shown
+        self.fs_dir = tempfile.mkdtemp(prefix="pu-fs-")
+
+    def ms(self):
+        return (self.t_us // 1000) % TICKS_PERIOD
+
+    def room_us(self):
+        return self.t_us - self.t0_us
+
+    def advance(self, us):
+        """Advance the virtual clock."""
+        self.t_us += int(us)
+
+    def read(self, ch, *args):
+        """Read input channel `ch` from the source, logging it when recording."""
+        v = getattr(self.source, ch)(self.ms(), *args)
+        if self.recorder:
+            self.recorder.write(self.ms(), ch, v)
+        return v
+
+    def i2c_write(self, addr, buf):
+        if self.i2c_nack and self.i2c_nack(self.ms(), addr):
+            self.advance(30)  # address byte, then no acknowledge
+            raise OSError(19)  # ENODEV, as MicroPython reports a NACK
+        self.trace.append((self.ms(), buf[0], buf[1]))
+        self.advance(100)  # 4 bytes at 400 kHz with addressing overhead
+
+    def radio_send(self, b):
+        self.sent.append((self.ms(), b))
+        if self.medium:
+            self.medium.send(self, b)
+
+    def radio_recv(self):
+        if self.medium:
+            self.medium.poll(self)
+        if self.rx:
+            v, src, t = self.rx.pop(0)
+            self.lat.append((src, self.room_us() - t))
+        else:
+            v = self.source.radio(self.ms())
+        if self.recorder:
+            self.recorder.write(self.ms(), "radio", v)
+        return v
+
+    def say(self, text):
+        self.said.append(text)
+        self.advance(len(text) * 60000)  # speech blocks the loop
+
+    def step(self, robot, tick_us=20000):
+        """Run one guarded robot loop iteration on this board."""
+        use(self)
+        if os.getcwd() != self.fs_dir:
+            os.chdir(self.fs_dir)
+        robot.step()
+        self.advance(tick_us)
+
+
+class Medium(object):
+    """
+    Radio shared by several boards and emulated controllers (nodes).
+
+    A packet sent by one node reaches every other node that is on and
+    configured for the same channel and group after lat_ms plus up to
+    jitter_ms of room time, unless it is lost at random (loss) or, with
+    collide set, overlaps in the air with another packet on the channel
+    (at 1 Mbit/s a 32-byte packet takes about 0.3 ms), which loses both.
+    Arrived packets enter a node's receive queue when it reads the radio
+    and are dropped while the queue (the radio `queue` setting) is full,
+    as on the micro:bit, or when the node has retuned since they were sent.
+
+    A node only needs radio_cfg, radio_on, room_us(), rx, air and the
+    n_loss, n_coll and n_full counters. Nodes are stepped in room-time
+    order only to within one loop iteration, so collisions between
+    packets sent that close together are approximate.
+    """
+    def __init__(self, loss=0.0, lat_ms=0.0, jitter_ms=0.0, collide=False, seed=0):
+        self.loss = loss
+        self.lat_us = int(lat_ms * 1000)
+        self.jit_us = int(jitter_ms * 1000)
+        self.collide = collide
+        self.rng = random.Random(seed)
+        self.nodes = []
+        self.on_air = {}          # channel -> recent transmissions [start us, end us, collided, channel]
+        self.busy_us = {}         # channel -> airtime used (us)
+        self.tx_end = {}          # node -> end of its last transmission (us)
+        self.n_tx = 0             # packets sent
+
+    def attach(self, node):
+        node.medium = self
+        self.nodes.append(node)
+
+    def send(self, src, pkt):
+        self.n_tx += 1
+        c = src.radio_cfg
+        ch = c["channel"]
+        t = max(src.room_us(), self.tx_end.get(src, 0))  # a radio sends one packet at a time
+        tx = [t, t + (len(pkt) + 10) * 8, False, ch]  # preamble, address and CRC at 1 Mbit/s
+        self.tx_end[src] = tx[1]
+        self.busy_us[ch] = self.busy_us.get(ch, 0) + tx[1] - t
+        if self.collide:
+            a = self.on_air.setdefault(ch, [])
+            while a and a[0][1] < t - 50000:
+                a.pop(0)
+            for x in a:
+                if x[0] < tx[1] and t < x[1]:
+                    x[2] = tx[2] = True
+            a.append(tx)
+        for b in self.nodes:
+            bc = b.radio_cfg
+            if b is src or not b.radio_on or bc["channel"] != ch or bc["group"] != c["group"]:
+                continue
+            if self.loss and self.rng.random() < self.loss:
+                b.n_loss += 1
+                continue
+            at = t + self.lat_us + (self.rng.randint(0, self.jit_us) if self.jit_us else 0)
+            bisect.insort(b.air, (at, self.n_tx, pkt, src, t, tx))  # n_tx is unique per node
+
+    def poll(self, b):
+        """Move the packets that have arrived at node b into its receive queue."""
+        now = b.room_us()
+        while b.air and b.air[0][0] <= now:
+            at, _, pkt, src, t, tx = b.air.pop(0)
+            if tx[3] != b.radio_cfg["channel"] or pkt[1] != b.radio_cfg["group"] & 0xFF:
+                continue  # the node retuned while the packet was on its way
+            if tx[2]:
+                b.n_coll += 1
+            elif len(b.rx) < b.radio_cfg["queue"]:
+                b.rx.append((pkt, src, t))
+            else:
+                b.n_full += 1
+
+
+def install():
+    """Register the emulated MicroPython modules; safe to call repeatedly."""
+    if "microbit" in sys.modules and getattr(sys.modules["microbit"], "_emu", False):
+        return
+    for name in ("microbit", "radio", "speech", "neopixel", "machine", "utime"):
+        sys.modules[name] = importlib.import_module("utils.emu." + name)
+    sys.modules["ustruct"] = struct
+    import time
+    utime = sys.modules["utime"]
+    for f in ("ticks_ms", "ticks_us", "ticks_diff", "ticks_add", "sleep_ms", "sleep_us"):
+        setattr(time, f, getattr(utime, f))
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
+
+
+def load_robot(b, sn="Peu", seed=0, fast=True):
+    """Construct and calibrate a RobotPu on board `b` with its own PuBot copy.
+
+    Args:
+        b (Board): Board the robot runs on
+        sn (str): Serial number
+        seed (int): Seed for `random`, so runs are reproducible
+        fast (bool): Use the fast-boot calibration
+
+    Returns:
+        RobotPu: The robot
+    """
+    install()
+    use(b)
+    random.seed(seed)
+    os.chdir(b.fs_dir)
+    spec = importlib.util.spec_from_file_location("PuBot_" + b.name, os.path.join(SRC_DIR, "PuBot.py"))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    r = mod.RobotPu(sn)
+    r.calibrate(fast=fast)
+    return r
+
+
+def load_gamepad(b, **kw):
+    """Construct the Python controller firmware (src/Gamepad.py) on board `b`.
+
+    Args:
+        b (Board): Board the controller runs on
+        **kw: Gamepad arguments
+
+    Returns:
+        Gamepad: The controller; Board.step(pad) runs one loop iteration
+    """
+    install()
+    use(b)
+    import Gamepad
+    return Gamepad.Gamepad(**kw)
+
+
+class Scenario(Source):
+    """
+    Scripted inputs for exercising behaviors without hardware.
+
+    Args:
+        name (str): 'idle', 'explore', 'dance' or 'fall'
+        seed (int): Seed for sensor noise
+    """
+    NAMES = ("idle", "explore", "dance", "fall")
+
+    def __init__(self, name="idle", seed=0):
+        self.name = name
+        self.rng = random.Random(seed)
+        self.last_cmd = -1000
+
+    def accel(self, t):
+        n = self.rng.randint
+        if self.name == "fall" and 8000 <= t < 14000:
+            return (1024 + n(-40, 0), n(-40, 40), n(-40, 40))  # knocked over onto its side
+        return (n(-30, 30), n(-30, 30), -1024 + n(-30, 30))
+
+    def sound(self, t):
+        if self.name == "dance":
+            return 200 if t % 500 < 60 else 30 + self.rng.randint(0, 10)  # 120 bpm
+        return 15 + self.rng.randint(0, 10)
+
+    def loud(self, t):
+        return self.name == "dance" and t % 500 < 60
+
+    def sonar(self, t):
+        # a wall approaching and receding between 8 and 80 cm
+        return int((44 + 36 * math.sin(t * 0.0007)) / 0.0171821)
+
+    def radio(self, t):
+        # the gamepad selects the state once, then keeps the link alive
+        cmd = {"explore": 1, "dance": 3}.get(self.name)
+        if cmd is not None and t >= 500 and t - self.last_cmd >= 1000:
+            first = self.last_cmd < 0
+            self.last_cmd = t
+            return value_packet("#puB", cmd, ts=t) if first else value_packet("#puspeed", 0.0, ts=t)
+        return None
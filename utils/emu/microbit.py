@@ -0,0 +1,145 @@
+"""Emulated `microbit` module; all hardware access goes to the current Board."""
+
+from utils import emu as _e
+
+_emu = True
+
+
+class _Pin(object):
+    PULL_UP, PULL_DOWN, NO_PULL = 1, 2, 0
+
+    def __init__(self, n):
+        self.n = n
+
+    def write_digital(self, v):
+        _e.board().pins[self.n] = v * 1023
+
+    def write_analog(self, v):
+        _e.board().pins[self.n] = v
+
+    def set_pull(self, v):
+        pass
+
+    # pin inputs are not recorded: replay logs hold sensor reads only
+    def read_digital(self):
+        b = _e.board()
+        return b.source.pin(b.ms(), self.n)
+
+    def read_analog(self):
+        b = _e.board()
+        return b.source.pin(b.ms(), self.n)
+
+    def is_touched(self):
+        return bool(self.read_digital())
+
+
+pin0, pin1, pin2, pin8, pin12, pin13, pin14, pin15, pin16 = (
+    _Pin(0), _Pin(1), _Pin(2), _Pin(8), _Pin(12), _Pin(13), _Pin(14), _Pin(15), _Pin(16))
+pin_logo = _Pin("logo")
+
+
+class _I2C(object):
+    def init(self, *a, **k):
+        pass
+
+    def write(self, addr, buf, repeat=False):
+        _e.board().i2c_write(addr, bytes(buf))
+
+    def read(self, addr, n, repeat=False):
+        return bytes(n)
+
+
+i2c = _I2C()
+
+
+class SoundEvent(object):
+    LOUD = "loud"
+    QUIET = "quiet"
+
+
+class _Microphone(object):
+    def set_threshold(self, event, value):
+        pass
+
+    def sound_level(self):
+        return _e.board().read("sound")
+
+    def current_event(self):
+        return SoundEvent.LOUD if _e.board().read("loud") else None
+
+    def was_event(self, event):
+        return event == SoundEvent.LOUD and _e.board().read("loud")
+
+
+microphone = _Microphone()
+
+
+class _Accelerometer(object):
+    def get_values(self):
+        return _e.board().read("accel")
+
+    def get_x(self):
+        return self.get_values()[0]
+
+    def get_y(self):
+        return self.get_values()[1]
+
+    def get_z(self):
+        return self.get_values()[2]
+
+    def was_gesture(self, name):
+        return _e.board().read("gesture", name)
+
+
+accelerometer = _Accelerometer()
+
+
+class _Button(object):
+    def __init__(self, name):
+        self.name = name
+
+    def was_pressed(self):
+        return _e.board().read("button", self.name)
+
+    def is_pressed(self):
+        return self.was_pressed()
+
+
+button_a, button_b = _Button("a"), _Button("b")
+
+
+class _Display(object):
+    def show(self, v, *a, **k):
+        pass
+
+    def scroll(self, v, *a, **k):
+        pass
+
+    def clear(self):
+        pass
+
+
+display = _Display()
+
+
+class _Speaker(object):
+    def on(self):
+        pass
+
+    def off(self):
+        pass
+
+
+speaker = _Speaker()
+
+
+def sleep(ms):
+    _e.board().advance(ms * 1000)
+
+
+def running_time():
+    return _e.board().ms()
+
+
+def temperature():
+    return _e.board().read("temperature")
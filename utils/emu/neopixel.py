@@ -0,0 +1,27 @@
+"""Emulated `neopixel` module; show() stores the frame on the current Board."""
+
+from utils import emu as _e
+
+
+class NeoPixel(object):
+    def __init__(self, pin, n):
+        self.px = [(0, 0, 0)] * n
+
+    def __setitem__(self, i, v):
+        self.px[i] = tuple(v)
+
+    def __getitem__(self, i):
+        return self.px[i]
+
+    def __len__(self):
+        return len(self.px)
+
+    def fill(self, v):
+        self.px = [tuple(v)] * len(self.px)
+
+    def show(self):
+        _e.board().pixels = list(self.px)
+
+    def clear(self):
+        self.fill((0, 0, 0))
+        self.show()
@@ -0,0 +1,28 @@
+"""Emulated `radio` module backed by the current Board."""
+
+from utils import emu as _e
+
+RATE_1MBIT = 1
+RATE_2MBIT = 2
+
+
+def config(**kw):
+    _e.board().radio_cfg.update(kw)
+
+
+def on():
+    _e.board().radio_on = True
+
+
+def off():
+    b = _e.board()
+    b.radio_on = False
+    b.rx.clear()  # the receive queue is freed while the radio is off
+
+
+def send_bytes(b):
+    _e.board().radio_send(bytes(b))
+
+
+def receive_bytes():
+    return _e.board().radio_recv()
@@ -0,0 +1,15 @@
+"""Emulated `speech` module; speaking blocks the virtual clock."""
+
+from utils import emu as _e
+
+
+def say(text, **kw):
+    _e.board().say(text)
+
+
+def sing(text, **kw):
+    _e.board().say(text)
+
+
+def pronounce(text, **kw):
+    _e.board().say(text)
@@ -0,0 +1,31 @@
+"""Emulated `utime` module on the current Board's virtual clock."""
+
+from utils import emu as _e
+
+
+def ticks_ms():
+    return _e.board().ms()
+
+
+def ticks_us():
+    return _e.board().t_us % _e.TICKS_PERIOD
+
+
+def ticks_diff(a, b):
+    return (a - b + _e.TICKS_PERIOD // 2) % _e.TICKS_PERIOD - _e.TICKS_PERIOD // 2
+
+
+def ticks_add(a, d):
+    return (a + d) % _e.TICKS_PERIOD
+
+
+def sleep_ms(ms):
+    _e.board().advance(ms * 1000)
+
+
+def sleep_us(us):
+    _e.board().advance(us)
+
+
+def sleep(s):
+    _e.board().advance(s * 1000000)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Offline Gait Optimizer
+
+Searches the pose shape (w_t, j_t, l_s) and the speed vectors (st_spu) of
+a gait for faster, stable walking or skating:
+1. Build the pose and speed tables of every candidate from Parameters
+2. Simulate all candidates at once with NumPy: the spline the robot walks
+   along (WK.move_spline, Trajectory), the walk balance loop of
+   RobotPu.move_balance, the servos' slew limit and a quasi-static body
+   roll model
+3. Refine the population with the cross-entropy method
+4. Write a Parameters.py with the best pose shape, and the gait on its own
+   copies of its poses with the best speed vectors, so the other sequences
+   keep theirs; report speed and stability
+
+The roll and stride models are coarse surrogates of the real robot; use the
+result as a starting point for tuning on hardware, not as a final answer.
+
+Usage:
+    python -m utils.gait_opt [--gait walk|skate] [--pop 2000] [--gens 8] [-o build/Parameters.py]
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from utils import emu
+
+emu.install()
+from Parameters import Parameters  # noqa: E402
+from PosePack import PK_SPU  # noqa: E402
+
+REF_HZ = 50          # control tick rate the speed tables are tuned at
+LEG_CM = 4.0         # effective leg length for the stride model
+FALL_DEG = 35.0      # body roll treated as a fall
+SERVO_DPS = 600.0    # servo slew limit (deg/s), about 0.1 s per 60 degrees
+ROLL_TAU = 0.12      # time constant of the body rolling onto a foot (s)
+BOUNDS = np.array([  # w_t, j_t, l_s, speed gain
+    [8.0, 30.0],
+    [15.0, 40.0],
+    [25.0, 60.0],
+    [0.6, 3.0],
+])
+DEFAULT = np.array([16.0, 27.0, 45.0, 1.0])
+SEQS = {"walk": "walk_fw_sts", "skate": "skate_fw_sts"}  # sequence optimized for each gait
+
+
+class WriteError(Exception):
+    """Raised when the optimized values cannot be placed in Parameters.py."""
+
+
+def build_tables(cands, gait):
+    """Pose targets, speed vectors and stride per candidate.
+
+    Returns:
+        tuple: (poses (C, S, 6), speeds (C, S, 6), stride (C,), rows) where S is
+        the length of the gait sequence and rows the st_spu rows it copies
+    """
+    base = Parameters()
+    seq = getattr(base, SEQS[gait])
+    rows = [base.dict_sp.get(s, 1) for s in seq]
+    poses = np.empty((len(cands), len(seq), base.dof))
+    for c, (w_t, j_t, l_s, _) in enumerate(cands):
+        p = Parameters(int(round(w_t)), int(round(j_t)), int(round(l_s)))
+        poses[c] = [p.st_tg[s] for s in seq]
+    spu = np.array([base.st_spu[r] for r in rows], dtype=float)
+    # scaled as write_parameters stores them, in pose pack units
+    speeds = np.round(spu[None, :, :] * cands[:, 3, None, None] * PK_SPU) / PK_SPU
+    # stride: forward swing between the two leg-crossing poses; simulate
+    # reduces it when the body did not roll far enough to lift a foot
+    swing = np.abs(np.sin(np.radians(poses[:, 1, 1] - 90)) - np.sin(np.radians(poses[:, 3, 1] - 90)))
+    return poses, speeds, LEG_CM * swing, rows
+
+
+def spline(poses, n=8):
+    """Spline targets sampled as Trajectory.build does.
+
+    Args:
+        poses (np.ndarray): Pose targets (C, S, D) of a cyclic sequence
+
+    Returns:
+        np.ndarray: Samples (C, S, n + 1, D); segment s runs from pose s - 1
+        to pose s, and its last sample is its end pose
+    """
+    p0, p1, p2, p3 = (np.roll(poses, -k, axis=1) for k in (-2, -1, 0, 1))
+    u = (np.arange(n + 1) / n)[None, None, :, None]
+    p0, p1, p2, p3 = (x[:, :, None, :] for x in (p0, p1, p2, p3))
+    return 0.5 * (2 * p1 + (p2 - p0) * u + (2 * p0 - 5 * p1 + 4 * p2 - p3) * u ** 2
+                  + (3 * p1 - p0 - 3 * p2 + p3) * u ** 3)
+
+
+def simulate(cands, gait="walk", seconds=10.0, sp=4.0, max_rl_ctl=15.0):
+    """Simulate every candidate gait for `seconds` of robot time.
+
+    Walking follows the spline of the sequence as WK.move_spline does: the
+    phase advances with time and speed, the sync servos 0-3 are set to the
+    interpolated targets plus the balance correction slewed at their step
+    speed, and servos 4 and 5 step toward each pose as in WK.servo_step.
+    The servos themselves follow at most SERVO_DPS, the body rolls toward
+    the tilt of the feet with time constant ROLL_TAU, and a stride only
+    counts as far as the body rolled to lift the other foot (walking only)
+    and the legs kept up with the spline.
+
+    Returns:
+        dict: Per-candidate arrays speed (cm/s), steps_s, roll_rms, roll_max, fell
+    """
+    poses, speeds, stride, _ = build_tables(cands, gait)
+    C, S, D = poses.shape
+    n_s = 8
+    tb = spline(poses, n_s)
+    sy, asy = [0, 1, 2, 3], [4, 5]
+    # segment durations at unit speed, from the slowest sync servo
+    prev = np.roll(poses, 1, axis=1)
+    du = np.maximum(0.02, np.max(np.abs(poses - prev)[:, :, sy] / speeds[:, :, sy], axis=2) / REF_HZ)
+    w_t = np.round(cands[:, 0])
+    dt = 1.0 / REF_HZ
+    lim = SERVO_DPS * dt
+    ar = np.arange(C)
+    s_tg = np.array(poses[:, -1])
+    act = s_tg.copy()
+    ct = np.zeros((C, D))
+    pos = np.zeros(C, dtype=int)
+    ph = np.zeros(C)
+    steps = np.zeros(C)
+    dist = np.zeros(C)
+    rl = np.zeros(C)
+    l_o_t = np.zeros(C)
+    r_o_t = np.zeros(C)
+    sq = np.zeros(C)
+    rmax = np.zeros(C)
+    pk = np.zeros(C)
+    fell = np.zeros(C, dtype=bool)
+    n = int(seconds * REF_HZ)
+    for _ in range(n):
+        # body roll: mean tilt of both feet and lean of servo 4, followed with a lag
+        q = 0.6 * ((act[:, 0] - 90) + (act[:, 2] - 90)) * 0.5 + 0.15 * (act[:, 4] - 90)
+        rl = rl + (q - rl) * dt / (ROLL_TAU + dt)
+        pk = np.maximum(pk, np.abs(rl))
+        # walk balance loop of move_balance (b_wr with kp 0.8)
+        left = (pos < 2)
+        l_o_t = np.where(left, np.clip(rl * 0.8 - w_t, 0.0, max_rl_ctl), l_o_t)
+        r_o_t = np.where(left, r_o_t, np.clip(rl * 0.8 + w_t, -max_rl_ctl, 0.0))
+        o_t = l_o_t + r_o_t
+        sp_c = sp / (1.0 + 0.01 * np.abs(rl) + np.sqrt(np.abs(o_t * 0.5)))
+        s_ct = np.stack([o_t, -o_t, o_t, -o_t, -o_t, np.zeros(C)], axis=1)
+        # phase along the spline, a step at the end of each segment
+        ph = ph + dt * sp_c / du[ar, pos]
+        done = (ph >= 1.0) & ~fell
+        lag = np.max(np.abs(s_tg - act)[:, sy], axis=1)
+        # skating glides, walking has to lift the other foot clear of the floor
+        lift = 1.0 if gait == "skate" else np.clip((pk - 6.0) / 12.0, 0.0, 1.0)
+        cross = done & ((pos == 1) | (pos == 3))
+        dist += np.where(cross, stride * lift * np.clip(1.0 - lag / 20.0, 0.0, 1.0), 0.0)
+        pk = np.where(cross, 0.0, pk)
+        steps += done
+        pos = np.where(done, (pos + 1) % S, pos)
+        ph = np.where(done, np.minimum(0.99, ph - 1.0), np.minimum(ph, 0.99))
+        sps = sp_c[:, None] * speeds[ar, pos]
+        # sync servos: interpolated spline target plus the slewed correction
+        ct[:, sy] += np.clip(s_ct[:, sy] - ct[:, sy], -sps[:, sy], sps[:, sy])
+        x = ph * n_s
+        j = x.astype(int)
+        a, b = tb[ar, pos, j], tb[ar, pos, j + 1]
+        s_tg[:, sy] = np.clip(a + (b - a) * (x - j)[:, None] + ct, 0, 179)[:, sy]
+        # async servos: stepped toward the current pose as in WK.servo_step
+        err = np.clip(poses[ar, pos] + s_ct, 0, 179)[:, asy] - s_tg[:, asy]
+        s_tg[:, asy] += np.clip(err, -sps[:, asy], sps[:, asy])
+        # the servos follow their targets at most at their slew limit
+        act += np.clip(s_tg - act, -lim, lim)
+        sq += rl * rl
+        rmax = np.maximum(rmax, np.abs(rl))
+        fell |= np.abs(rl) > FALL_DEG
+    return {
+        "speed": np.where(fell, 0.0, dist / seconds),
+        "steps_s": steps / seconds,
+        "roll_rms": np.sqrt(sq / n),
+        "roll_max": rmax,
+        "fell": fell,
+    }
+
+
+def fitness(r, roll_w=0.05):
+    """Speed penalised by roll; fallen candidates are rejected."""
+    return np.where(r["fell"], -np.inf, r["speed"] - roll_w * r["roll_rms"] * r["roll_max"])
+
+
+def optimize(gait, pop, gens, seconds, seed=0):
+    """Cross-entropy search over (w_t, j_t, l_s, speed gain).
+
+    Returns:
+        tuple: (best candidate, its metrics, candidates evaluated, elapsed seconds)
+    """
+    rng = np.random.default_rng(seed)
+    mu, sd = DEFAULT.copy(), (BOUNDS[:, 1] - BOUNDS[:, 0]) * 0.25
+    best, best_f, best_r = DEFAULT.copy(), -np.inf, None
+    t0, total = time.time(), 0
+    for g in range(gens):
+        cands = np.clip(rng.normal(mu, sd, size=(pop, len(mu))), BOUNDS[:, 0], BOUNDS[:, 1])
+        cands[0] = best
+        r = simulate(cands, gait, seconds)
+        f = fitness(r)
+        total += pop
+        order = np.argsort(-f)
+        if f[order[0]] > best_f:
+            best, best_f = cands[order[0]].copy(), f[order[0]]
+            best_r = {k: v[order[0]] for k, v in r.items()}
+        elite = cands[order[:max(2, pop // 10)]]
+        mu, sd = elite.mean(axis=0), elite.std(axis=0) + 1e-3
+        print(f"  - Gen {g + 1}/{gens}: best {best_f:.3f}, speed {best_r['speed']:.2f} cm/s")
+    return best, best_r, total, time.time() - t0
+
+
+def write_parameters(best, gait, path):
+    """
+    Write a copy of src/Parameters.py with the optimized defaults and speeds.
+
+    The speed vectors of the gait's poses are shared with other sequences
+    (the backward gaits and dancing), so the gait gets its own copies of its
+    poses, with speed vectors scaled by the gain in steps of 1/PK_SPU (see
+    PosePack), appended after the existing tables; the other sequences keep
+    their speeds.
+
+    Raises:
+        WriteError: If the constructor defaults or the end of the built-in
+            tables are not found
+    """
+    src = os.path.join(os.path.dirname(sys.modules[Parameters.__module__].__file__), "Parameters.py")
+    with open(src) as f:
+        text = f.read()
+    w_t, j_t, l_s, gain = best
+    text, n = re.subn(r"def __init__\(self, w_t=\d+, j_t=\d+, l_s=\d+",
+                      f"def __init__(self, w_t={int(round(w_t))}, j_t={int(round(j_t))}, l_s={int(round(l_s))}", text)
+    if n != 1:
+        raise WriteError(f"{src}: Parameters.__init__ defaults w_t, j_t, l_s not found")
+    seq = SEQS[gait]
+    own = (f"        # {gait} on its own copies of its poses, speed vectors scaled by {gain:.2f} (utils.gait_opt)\n"
+           f"        n, sv = len(self.st_tg), {{}}\n"
+           f"        for k, s in enumerate(self.{seq}):\n"
+           f"            r = self.dict_sp.get(s, 1)\n"
+           f"            if r not in sv:\n"
+           f"                sv[r] = len(self.st_spu)\n"
+           f"                self.st_spu.append([round(v * {gain:.4f} * {PK_SPU}) / {PK_SPU} for v in self.st_spu[r]])\n"
+           f"            self.st_tg.append(list(self.st_tg[s]))\n"
+           f"            self.dict_sp[n + k] = sv[r]\n"
+           f"        self.{seq} = list(range(n, n + len(self.{seq})))\n")
+    text, n = re.subn(r"(\n\s*\]\n)(\n    # take pose tables)", lambda m: m.group(1) + own + m.group(2), text)
+    if n != 1:
+        raise WriteError(f"{src}: end of the built-in st_spu table not found")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimize Parameters gait tables offline")
+    parser.add_argument("--gait", choices=["walk", "skate"], default="walk")
+    parser.add_argument("--pop", type=int, default=2000, help="Candidates per generation")
+    parser.add_argument("--gens", type=int, default=8, help="Generations")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Simulated robot time per candidate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default=os.path.join("build", "Parameters.py"))
+    args = parser.parse_args()
+
+    print(f"=== Gait optimizer: {args.gait} ===")
+    base = simulate(DEFAULT[None, :], args.gait, args.seconds)
+    best, r, total, elapsed = optimize(args.gait, args.pop, args.gens, args.seconds, args.seed)
+    try:
+        write_parameters(best, args.gait, args.output)
+    except WriteError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"Evaluated {total} candidates in {elapsed:.1f}s ({total * 60 / elapsed:.0f}/min)")
+    print(f"{'':10}{'w_t':>6}{'j_t':>6}{'l_s':>6}{'gain':>6}{'cm/s':>8}{'steps/s':>9}{'roll rms':>10}{'roll max':>10}")
+    for name, c, m in (("baseline", DEFAULT, {k: v[0] for k, v in base.items()}), ("best", best, r)):
+        print(f"{name:10}{c[0]:6.0f}{c[1]:6.0f}{c[2]:6.0f}{c[3]:6.2f}{m['speed']:8.2f}{m['steps_s']:9.2f}"
+              f"{m['roll_rms']:10.1f}{m['roll_max']:10.1f}")
+    print(f"Parameters written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Gamepad Transmission Simulation
+
+Runs the Python controller firmware (src/Gamepad.py) on the host hardware
+stand-in (utils.emu), driven by a scripted student, against a RobotPu, and
+compares sending every value every loop, as the MakeCode gamepad does, with
+sending changes only:
+1. The student drives forward and back, turns, stops and tilts the gamepad
+   to move the head, in a 12 s cycle; the stick has ADC noise and the
+   tilt accelerometer noise
+2. One pair is run in each mode from the same seed; the robot's speed,
+   direction and head biases are sampled every 100 ms and compared with
+   what the student asks, next to the controller's packet rate and the
+   robot's drops to idle while the student is driving
+3. A classroom of pairs on one channel and neighbouring groups is run in
+   each mode, and the share of commands each robot reads is reported
+
+Usage:
+    python -m utils.gamepad [--seconds 36] [--pairs 20] [--seed 0]
+"""
+
+import math
+import random
+import argparse
+
+from utils import emu
+from utils.swarm import Swarm, GROUP0
+
+ST_JOY = 5
+
+
+def student(t):
+    """Stick and tilt of the student at time t (ms).
+
+    Returns:
+        tuple: (speed, turn, pitch, roll), speed and turn from -1 to 1,
+        pitch and roll in degrees
+    """
+    c = t % 12000 / 1000
+    sp = tu = pt = rl = 0.0
+    if 1 <= c < 4:
+        sp, tu = 0.8, 0.4 * math.sin(c * 2)
+    elif 5 <= c < 7:
+        sp = -0.6
+    elif 7.5 <= c < 9:
+        pt, rl = 25 * math.sin((c - 7.5) * 3), 15 * math.sin((c - 7.5) * 2)
+    elif 9 <= c < 12:
+        sp, tu = 0.7, (-0.8 if c < 10 else 0.5)
+    return sp, tu, pt, rl
+
+
+class Student(emu.Source):
+    """
+    Gamepad inputs of a scripted student.
+
+    Args:
+        seed (int): Seed for the sensor noise
+        off_ms (int): Shift of the script, so pairs do not move in step
+    """
+    def __init__(self, seed, off_ms=0):
+        self.rng = random.Random(seed)
+        self.off = off_ms
+
+    def now(self, t):
+        return student(t + self.off)
+
+    def pin(self, t, n):
+        if n in (1, 2):
+            v = self.now(t)[n - 1]
+            return min(1023, max(0, int(512 - v * 512) + self.rng.randint(-3, 3)))
+        return 1 if n in (8, 13, 14, 15, 16) else 0  # buttons pulled up, logo not touched
+
+    def accel(self, t):
+        _, _, p, r = self.now(t)
+        p, r = math.radians(p), math.radians(r)
+        n = self.rng.randint
+        return (int(1024 * math.sin(r) * math.cos(p)) + n(-15, 15), int(1024 * math.sin(p)) + n(-15, 15),
+                int(-1024 * math.cos(r) * math.cos(p)) + n(-15, 15))
+
+
+class PadBoard(emu.Board):
+    """Controller board whose loop takes 20 ms give or take the sensor reads, so pads drift apart."""
+    def __init__(self, source, name, seed):
+        super().__init__(source, name)
+        self.rng = random.Random(seed)
+
+    def step(self, robot, tick_us=20000):
+        super().step(robot, tick_us + self.rng.randint(-300, 300))
+
+
+def pair(sw, i, delta, seed, off_ms=0):
+    """Add a robot and its controller on group GROUP0 + i to the swarm.
+
+    Returns:
+        tuple: (robot Board, RobotPu, controller Board, Gamepad)
+    """
+    g = GROUP0 + i
+    b = emu.Board(name=f"pu{i}")
+    b.t_us = b.t0_us = i * 23000
+    r = emu.load_robot(b, sn=f"P{i}", seed=seed + i)
+    r.set_group(g)
+    pb = PadBoard(Student(seed + i, off_ms), f"gp{i}", seed + i)
+    pb.t_us = pb.t0_us = i * 17000
+    pb.t_us += pb.rng.randint(0, 19999)  # powered on part way through a robot tick
+    pad = emu.load_gamepad(pb, g=g)
+    if not delta:
+        pad.db = (-1, -1, -1, -1)  # every value moved: all four are sent every loop
+    sw.add(b, r)
+    sw.add(pb, pad)
+    return b, r, pb, pad
+
+
+def target(r, t):
+    """Speed, turn, roll bias and pitch bias the robot should hold for the student at time t (ms)."""
+    sp, tu, pt, rl = student(t)
+    sp = sp * r.fw_sp if sp > 0.2 else -sp * r.bw_sp if sp < -0.2 else 0
+    return sp, tu, rl, -pt
+
+
+def single(delta, args):
+    """Run one pair; the robot's distance from what the student asks is sampled every 100 ms."""
+    sw = Swarm(emu.Medium(0.0, 1.0, 0.5, True, args.seed))
+    b, r, pb, pad = pair(sw, 0, delta, args.seed)
+    err, drops = [], [0]
+    last = [r.gst]
+
+    def sample(t):
+        err.append([abs(x - y) for x, y in zip((r.sp, r.di, r.h_l_bias, r.h_u_bias), target(r, t))])
+        if last[0] == ST_JOY and r.gst != ST_JOY and student(t)[0] != 0:
+            drops[0] += 1
+        last[0] = r.gst
+
+    sw.run(2000)
+    n0 = pad.n_tx
+    sw.run(2000 + args.seconds * 1000, 100, sample)
+    return {"pps": (pad.n_tx - n0) / args.seconds, "ka": pad.n_ka, "err": err, "drops": drops[0]}
+
+
+def classroom(delta, args):
+    """Run args.pairs pairs on one channel; share of controller packets each robot read."""
+    sw = Swarm(emu.Medium(0.01, 1.0, 0.5, True, args.seed))
+    rng = random.Random(args.seed)
+    pairs = [pair(sw, i, delta, args.seed, rng.randint(0, 12000)) for i in range(args.pairs)]
+    sw.run(2000)
+    for b, _, pb, _ in pairs:
+        b.lat.clear()
+        pb.n0 = len(pb.sent)
+    busy0 = sw.medium.busy_us.get(7, 0)
+    sw.run(2000 + args.seconds * 1000)
+    got = [sum(1 for s, _ in b.lat if s is pb) / max(1, len(pb.sent) - pb.n0) for b, _, pb, _ in pairs]
+    return sum(got) / len(got), min(got), (sw.medium.busy_us.get(7, 0) - busy0) / (args.seconds * 1e6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sending every joystick value with sending changes only")
+    parser.add_argument("--seconds", type=int, default=36, help="Room time simulated per run")
+    parser.add_argument("--pairs", type=int, default=20, help="Robot and controller pairs in the classroom run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    runs = (("every", single(False, args)), ("changes", single(True, args)))
+    print(f"=== Gamepad: one pair, {args.seconds}s of a scripted student ===")
+    print(f"{'mode':8}{'pkt/s':>8}{'keepalive':>11}{'idle drops':>12}{'speed':>8}{'turn':>7}{'roll':>7}{'pitch':>7}")
+    for name, m in runs:
+        e = [sum(x[k] for x in m["err"]) / len(m["err"]) for k in range(4)]
+        print(f"{name:8}{m['pps']:8.1f}{m['ka']:11}{m['drops']:12}{e[0]:8.2f}{e[1]:7.2f}{e[2]:7.1f}{e[3]:7.1f}")
+    print("  - speed, turn, roll, pitch: mean distance of the robot's setting from the student's stick and tilt")
+
+    print(f"=== Gamepad: classroom of {args.pairs} pairs on one channel ===")
+    print(f"{'mode':8}{'read':>8}{'worst':>8}{'air':>6}")
+    for name, d in (("every", False), ("changes", True)):
+        ok, worst, air = classroom(d, args)
+        print(f"{name:8}{ok:8.1%}{worst:8.1%}{air:6.0%}")
+    print("  - every: all four values every 20 ms loop, as the MakeCode gamepad; changes: src/Gamepad.py")
+    print("  - read: share of a controller's packets its robot read (1% random loss, collisions, full queue)")
+    print("  - air: airtime offered on the channel, overlapping packets counted in full")
+
+
+if __name__ == "__main__":
+    main()
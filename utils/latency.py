@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Command Latency Harness
+
+Drives one RobotPu on the host hardware stand-in (utils.emu) from an emulated
+gamepad and measures how long a joystick command takes to reach the servos:
+1. The gamepad sends speed, turn, roll and pitch in turn over the virtual
+   radio medium, with the sticks moving (walk) or at rest (idle, where the
+   robot stays in its slower idle loop)
+2. The host stamps every joystick packet when sent, when the robot reads it
+   and every servo I2C write, all in room time, and pairs each read with the
+   first servo write after it
+3. At the end the gamepad sends "#pulat" and decodes the robot's own
+   histograms (see Latency) from the telemetry it gets back, checking them
+   against the robot's state
+4. Robot and host histograms are printed side by side, in the robot's
+   log2 buckets; the run fails if the robot's queue wait p95 disagrees with
+   the host's or the telemetry differs from the robot's histograms
+
+The emulator charges time only for I2C writes, sleeps and speech, so the
+read to servo write time here is mostly I2C; on hardware the robot's own
+histograms also hold the loop's compute time.
+
+Usage:
+    python -m utils.latency [--mode both|walk|idle] [--seconds 30] [--period 100] [--lat 1] [--jitter 0.5]
+"""
+
+import sys
+import bisect
+import argparse
+
+from utils import emu
+from utils.packets import value_packet, parse_packet
+from utils.swarm import Gamepad, Swarm, JOY, GROUP0
+
+NB = 9               # histogram buckets, as in Latency
+SERVO_REGS = set(range(3, 10)) | {0x10}
+
+
+def bucket(us):
+    """Latency bucket of a time, as Latency.add counts it."""
+    ms, k = int(us) // 1000, 0
+    while ms and k < NB - 1:
+        ms >>= 1
+        k += 1
+    return k
+
+
+def hist(xs):
+    h = [0] * NB
+    for x in xs:
+        h[bucket(x)] += 1
+    return h
+
+
+def pct(h, q):
+    """Upper bound (ms) of the bucket holding percentile q, as Latency.pct."""
+    n, c = sum(h), 0
+    for k in range(NB):
+        c += h[k]
+        if c and c * 100 >= n * q:
+            return 1 << k
+    return 0
+
+
+class Pad(Gamepad):
+    """
+    Gamepad that can also send one-off commands and keeps what it receives.
+
+    Args:
+        group (int): Radio group of the robot it drives
+        period_ms (int): Time to send all joystick values
+        seed (int): Seed for the stick movements
+        rest (bool): Keep the sticks at rest (all values 0)
+    """
+    def __init__(self, group, period_ms=100, seed=0, rest=False):
+        super().__init__(group, period_ms, 0, seed)
+        self.rest = rest
+        self.hold = False         # stop sending joystick values
+        self.cmd = []             # (name, value) to send before the next joystick value
+        self.got = []             # (name, value) of each value packet received
+
+    def step(self, robot=None):
+        if not self.cmd and not self.rest and not self.hold:
+            self.medium.poll(self)
+            self.keep()
+            return super().step(robot)
+        ms = self.t_us // 1000
+        g = self.radio_cfg["group"]
+        if self.cmd:
+            self.medium.send(self, value_packet(*self.cmd.pop(0), group=g, ts=ms))
+        elif not self.hold:
+            self.medium.send(self, value_packet(JOY[self.k], 0.0, g, ts=ms))
+            self.k = (self.k + 1) % len(JOY)
+        self.medium.poll(self)
+        self.keep()
+        self.t_us += self.step_us + self.rng.randint(-self.step_us // 5, self.step_us // 5)
+
+    def keep(self):
+        for pkt, _, _ in self.rx:
+            p = parse_packet(pkt)
+            if p and isinstance(p[3], tuple):
+                self.got.append(p[3])
+        self.rx.clear()
+
+
+def measure(rest, args):
+    """Run one robot for args.seconds and collect robot and host latencies.
+
+    Returns:
+        dict: Robot histograms, read back over telemetry and from its state,
+        host histograms and counters
+    """
+    med = emu.Medium(0.0, args.lat, args.jitter, True, args.seed)
+    sw = Swarm(med)
+    b = emu.Board(name="pu0")
+    r = emu.load_robot(b, sn="L0", seed=args.seed)
+    r.set_group(GROUP0)
+    r.tl = 0
+    pad = Pad(GROUP0, args.period, args.seed, rest)
+    pad.radio_cfg["queue"] = 64  # listens like a relay, so no reply is dropped
+    sw.add(b, r)
+    sw.add(pad)
+    lt = r.step.__func__.__globals__["wk"].lt
+
+    reads, writes = [], []    # (send, read) room us of each joystick command; room us of each servo write
+    recv, wr = b.radio_recv, b.i2c_write
+
+    def radio_recv():
+        n = len(b.lat)
+        v = recv()
+        if len(b.lat) > n and b.lat[-1][0] is pad:
+            p = parse_packet(v)
+            if p and isinstance(p[3], tuple) and p[3][0] in JOY:
+                reads.append((b.room_us() - b.lat[-1][1], b.room_us()))
+        return v
+
+    def i2c_write(addr, buf):
+        if buf[0] in SERVO_REGS:
+            writes.append(b.room_us())
+        wr(addr, buf)
+
+    b.radio_recv, b.i2c_write = radio_recv, i2c_write
+    warm = 3000
+    sw.run(warm)
+    lt.clear()
+    reads.clear()
+    writes.clear()
+    sw.run(warm + args.seconds * 1000)
+    # stop the sticks, then ask for the histograms once the last commands are handled
+    st = r.gst
+    pad.hold = True
+    sw.run(warm + args.seconds * 1000 + 500)
+    pad.got.clear()
+    pad.cmd.append(("#pulat", 0))
+    sw.run(warm + args.seconds * 1000 + 1500)
+    h = [list(x) for x in lt.h]
+
+    tl = [[0] * NB for _ in range(4)]
+    for name, v in pad.got:
+        if len(name) == 3 and name[0] == "l" and name[1] in lt.STG:
+            tl[lt.STG.index(name[1])][int(name[2])] = v
+    sq, rw, sw_ = [], [], []
+    for s, t in reads:
+        i = bisect.bisect_left(writes, t)
+        sq.append(t - s)
+        if i < len(writes) and writes[i] - t <= lt.to_us:
+            rw.append(writes[i] - t)
+            sw_.append(writes[i] - s)
+    return {
+        "robot": h, "tl": tl, "st": st, "miss": lt.n_miss, "n": len(reads),
+        "host": [hist(sq), hist(rw), hist(sw_)], "unmatched": len(reads) - len(rw),
+    }
+
+
+def report(mode, m, args):
+    print(f"=== Command latency: {mode}, gamepad period {args.period} ms, radio {args.lat}+{args.jitter} ms, "
+          f"{args.seconds}s, robot state {m['st']} ===")
+    print(f"{'bucket ms':>10} | {'robot: queue':>12}{'read>disp':>10}{'disp>i2c':>10}{'read>i2c':>10} | "
+          f"{'host: queue':>11}{'read>i2c':>10}{'send>i2c':>10}")
+    for k in range(NB):
+        lo = "<1" if k == 0 else (f">={1 << (k - 1)}" if k == NB - 1 else f"{1 << (k - 1)}-{1 << k}")
+        rh, hh = [x[k] for x in m["robot"]], [x[k] for x in m["host"]]
+        print(f"{lo:>10} | {rh[0]:12}{rh[1]:10}{rh[2]:10}{rh[3]:10} | {hh[0]:11}{hh[1]:10}{hh[2]:10}")
+    for q in (50, 95):
+        rp, hp = [pct(x, q) for x in m["robot"]], [pct(x, q) for x in m["host"]]
+        print(f"{'p' + str(q):>10} | {rp[0]:12}{rp[1]:10}{rp[2]:10}{rp[3]:10} | {hp[0]:11}{hp[1]:10}{hp[2]:10}")
+    print(f"  - {m['n']} joystick commands read, {sum(m['robot'][3])} timed by the robot, {m['miss']} without a "
+          f"servo write in time; host: {m['unmatched']} commands without a servo write")
+    print(f"  - telemetry (#pulat) histograms {'match' if m['tl'] == m['robot'] else 'DIFFER from'} the robot's")
+    rq, hq = pct(m["robot"][0], 95), pct(m["host"][0], 95)
+    print(f"  - queue wait p95: robot {rq} ms, host {hq} ms, {'agree' if rq == hq else 'DISAGREE'}")
+    return m["tl"] == m["robot"] and rq == hq
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure gamepad to servo command latency on the emulated robot")
+    parser.add_argument("--mode", choices=["both", "walk", "idle"], default="both", help="Sticks moving or at rest")
+    parser.add_argument("--seconds", type=int, default=30, help="Room time measured")
+    parser.add_argument("--period", type=int, default=100, help="Gamepad time to send all joystick values (ms)")
+    parser.add_argument("--lat", type=float, default=1.0, help="Radio latency (ms)")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Radio latency jitter (ms)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ok = True
+    for mode in {"both": ("walk", "idle"), "walk": ("walk",), "idle": ("idle",)}[args.mode]:
+        ok = report(mode, measure(mode == "idle", args), args) and ok
+    print("  - robot queue: read time minus sender stamp, less the clock offset calibrated on empty queue polls; "
+          "host queue: send to read")
+    print("  - the robot times one command at a time, up to its next servo write; the host times every command")
+    if not ok:
+        print("Error: the robot's histograms do not agree with the host's")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
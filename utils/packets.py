@@ -0,0 +1,83 @@
+"""
+Host-side encoding of the MakeRadio packets the robots and controllers exchange.
+
+Packet layout: b"\\x01" + group + b"\\x01", type, timestamp (uint32), serial
+number (uint32), then by type: 1 = int32 value + name, 2 = string,
+5 = double value + name; names and strings are length-prefixed.
+"""
+
+import math
+import random
+import struct
+
+B36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+CHUNK_PREFIX = "#puk"
+CHUNK_DATA = 11   # data characters per chunk, so a chunk fits a 32-byte radio packet
+MAX_CHUNKS = len(B36) - 1  # the total is one base-36 digit, so at most 35
+
+
+def header(group, ptype, ts=0, sn=0):
+    return b"\x01" + bytes([group & 0xFF]) + b"\x01" + bytes([ptype]) + struct.pack("<II", ts & 0xFFFFFFFF, sn)
+
+
+def value_packet(name, v, group=166, ts=0, sn=0):
+    """Encode a name/value packet (int32 or double)."""
+    n = name[:8].encode()
+    if isinstance(v, int):
+        return header(group, 1, ts, sn) + struct.pack("<i", v) + bytes([len(n)]) + n
+    return header(group, 5, ts, sn) + struct.pack("<d", v) + bytes([len(n)]) + n
+
+
+def str_packet(s, group=166, ts=0, sn=0):
+    """Encode a string packet."""
+    b = s.encode()
+    return header(group, 2, ts, sn) + bytes([len(b)]) + b
+
+
+def parse_packet(d):
+    """Decode a packet as MakeRadio does.
+
+    Returns:
+        tuple: (group, ts, sn, payload) where payload is a str, a (name, value)
+        tuple or a number, or None for a packet that cannot be decoded
+    """
+    if d is None or len(d) < 12:
+        return None
+    g, t = d[1], d[3]
+    ts, sn = struct.unpack_from("<II", d, 4)
+    try:
+        if t == 1:
+            return g, ts, sn, (d[17:17 + d[16]].decode(), struct.unpack_from("<i", d, 12)[0])
+        if t == 5:
+            return g, ts, sn, (d[21:21 + d[20]].decode(), struct.unpack_from("<d", d, 12)[0])
+        if t == 2:
+            return g, ts, sn, d[13:13 + d[12]].decode()
+    except (struct.error, IndexError, UnicodeDecodeError):
+        pass
+    return None
+
+
+def chunk(text, kind="s", mid=None):
+    """Split a long song ('s') or speech text ('t') into "#puk" chunk strings.
+
+    Args:
+        text (str): ASCII payload, e.g. from Content.compose_song()
+        kind (str): 's' to sing, 't' to speak
+        mid (int): Message ID (0-35); random if not given
+
+    Returns:
+        list[str]: Chunks in order
+
+    Raises:
+        ValueError: If the payload is not ASCII or needs more than MAX_CHUNKS
+        chunks (MAX_CHUNKS * CHUNK_DATA characters)
+    """
+    if not text.isascii():
+        raise ValueError("chunked payloads must be ASCII")
+    n = max(1, math.ceil(len(text) / CHUNK_DATA))
+    if n > MAX_CHUNKS:
+        raise ValueError(f"payload of {len(text)} characters needs {n} chunks, at most {MAX_CHUNKS} "
+                         f"({MAX_CHUNKS * CHUNK_DATA} characters) allowed")
+    mid = random.randrange(len(B36)) if mid is None else mid
+    return [CHUNK_PREFIX + kind + B36[mid] + B36[i] + B36[n] + text[i * CHUNK_DATA:(i + 1) * CHUNK_DATA]
+            for i in range(n)]
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Pose Pack Compiler
+
+Builds the pose pack the robot loads from its file system (src/PosePack.py),
+so poses, speed vectors and sequences can change without reflashing:
+1. The tables are taken from Parameters, optionally with another pose
+   shape (walking tilt, jumping tilt and leg swing, as utils.gait_opt
+   reports them)
+2. Poses are stored as one byte per servo angle and speed vectors in
+   1/20 units; values that do not fit are rejected
+3. The pack is read back with the robot's own reader, as the robot reads
+   it (rows fetched lazily from the file), and every table and sequence
+   is compared with the original; the pack is only written if they match
+4. With --run, a robot exploring and one dancing are run on the host
+   stand-in (utils.emu) from the pack, and the pose rows they kept resident
+   and the rows they read from the file are reported
+
+flash_microbit.py builds and checks the pack on every build and copies it
+to the micro:bit with the other files.
+
+Usage:
+    python -m utils.posepack build [-o build/poses.pk] [--shape 16,27,45] [--run]
+    python -m utils.posepack show build/poses.pk
+"""
+
+import os
+import sys
+import struct
+import shutil
+import argparse
+import tempfile
+
+from utils import emu
+
+emu.install()
+from Parameters import Parameters  # noqa: E402
+from PosePack import (PosePack, PK_MAGIC, PK_VER, PK_HDR, PK_HSZ, PK_SPU, PK_NONE,  # noqa: E402
+                      PK_SEQS, PK_FILE)
+
+
+class PackError(Exception):
+    """Raised when the tables do not fit the pack format or do not survive the round trip."""
+
+
+def sequences(p):
+    """Named sequences of Parameters p, in the order they are stored."""
+    s = [(n, getattr(p, n)) for n in PK_SEQS]
+    return s + [(f"dance_rt.{k}", r) for k, r in p.dance_rt.items()]
+
+
+def compile_pack(p):
+    """
+    Encode the pose tables and sequences of Parameters p.
+
+    Returns:
+        bytes: The pack
+
+    Raises:
+        PackError: On a value the format cannot hold exactly
+    """
+    n_pose, n_spu = len(p.st_tg), len(p.st_spu)
+    if max(n_pose, n_spu) > 254:
+        raise PackError("at most 254 poses and speed vectors")
+    body = bytearray()
+    for k, row in enumerate(p.st_tg):
+        if len(row) != p.dof or any(v != int(v) or not 0 <= v <= 255 for v in row):
+            raise PackError(f"pose {k} {row}: needs {p.dof} whole angles 0-255")
+        body += bytes(int(v) for v in row)
+    for k, row in enumerate(p.st_spu):
+        q = [round(v * PK_SPU) for v in row]
+        if len(row) != p.dof or any(not 0 <= x <= 255 or x / PK_SPU != v for x, v in zip(q, row)):
+            raise PackError(f"speed vector {k} {row}: needs {p.dof} multiples of 1/{PK_SPU} up to {255 / PK_SPU}")
+        body += bytes(q)
+    for k in range(n_pose):
+        s = p.dict_sp.get(k, PK_NONE)
+        if not 0 <= s < n_spu and s != PK_NONE:
+            raise PackError(f"dict_sp maps pose {k} to missing speed vector {s}")
+        body.append(s)
+    if any(k >= n_pose for k in p.dict_sp):
+        raise PackError("dict_sp maps a pose that does not exist")
+    seqs = sequences(p)
+    for n, r in seqs:
+        if len(n) > 32 or len(r) > 255 or any(not 0 <= s < n_pose for s in r):
+            raise PackError(f"sequence {n} {r}: up to 255 existing poses, name up to 32 characters")
+        body += bytes([len(n)]) + n.encode("ascii") + bytes([len(r)]) + bytes(r)
+    hdr = struct.pack(PK_HDR, PK_MAGIC, PK_VER, p.dof, n_pose, n_spu, len(seqs), sum(body) & 0xFFFF)
+    assert len(hdr) == PK_HSZ
+    return hdr + bytes(body)
+
+
+def round_trip(p, fn):
+    """
+    Read pack fn with the robot's reader and compare it with Parameters p.
+
+    Returns:
+        list[str]: Differences; empty if the pack reproduces p
+    """
+    q = Parameters(p.w_t, p.j_t, p.l_s, pk=PosePack(fn))
+    diff = []
+    for k in range(max(len(p.st_tg), len(q.st_tg))):
+        a = p.st_tg[k] if k < len(p.st_tg) else None
+        b = q.st_tg[k] if k < len(q.st_tg) else None
+        if a != b:
+            diff.append(f"st_tg[{k}]: {a} != {b}")
+    for k in range(max(len(p.st_spu), len(q.st_spu))):
+        a = p.st_spu[k] if k < len(p.st_spu) else None
+        b = q.st_spu[k] if k < len(q.st_spu) else None
+        if a != b:
+            diff.append(f"st_spu[{k}]: {a} != {b}")
+    for k in range(len(p.st_tg) + 1):
+        if p.dict_sp.get(k, -1) != q.dict_sp.get(k, -1):
+            diff.append(f"dict_sp[{k}]: {p.dict_sp.get(k)} != {q.dict_sp.get(k)}")
+    for n in PK_SEQS:
+        if getattr(p, n) != getattr(q, n):
+            diff.append(f"{n}: {getattr(p, n)} != {getattr(q, n)}")
+    if list(p.dance_rt.items()) != list(q.dance_rt.items()):
+        diff.append(f"dance_rt: {p.dance_rt} != {q.dance_rt}")
+    return diff
+
+
+def build(fn, p=None):
+    """
+    Compile Parameters p (default tables if None) into fn, checking the round trip first.
+
+    Returns:
+        int: Pack size in bytes
+
+    Raises:
+        PackError: If the tables cannot be packed or do not survive the round trip
+    """
+    p = p or Parameters()
+    b = compile_pack(p)
+    with tempfile.TemporaryDirectory() as d:
+        tmp = os.path.join(d, PK_FILE)
+        with open(tmp, "wb") as f:
+            f.write(b)
+        diff = round_trip(p, tmp)
+        if diff:
+            raise PackError("round trip differs: " + "; ".join(diff[:5]))
+        os.makedirs(os.path.dirname(os.path.abspath(fn)), exist_ok=True)
+        shutil.copyfile(tmp, fn)
+    return len(b)
+
+
+def run(fn, seconds=20):
+    """
+    Run a robot exploring (walking) and one dancing on the host stand-in with pack fn.
+
+    Returns:
+        dict: Scenario -> (pose rows resident at most, pose rows read from
+        the file while booting, file opens for rows while booting, pose rows
+        read while running, speed rows read while running, pinned pose rows)
+    """
+    fn = os.path.abspath(fn)  # each robot runs in its own board's directory
+    cwd, res = os.getcwd(), {}
+    try:
+        for name in ("explore", "dance"):
+            b = emu.Board(emu.Scenario(name), name="pk_" + name)
+            shutil.copyfile(fn, os.path.join(b.fs_dir, PK_FILE))
+            r = emu.load_robot(b, sn="PK")
+            pr = r.step.__func__.__globals__["pr"]
+            m, n0, o0, s0 = 0, pr.st_tg.n_rd, pr.st_tg.pk.n_op, pr.st_spu.n_rd
+            while b.ms() < seconds * 1000:
+                b.step(r)
+                m = max(m, len(pr.st_tg.rows))
+            res[name] = (m, n0, o0, pr.st_tg.n_rd - n0, pr.st_spu.n_rd - s0, sorted(pr.st_tg.keep))
+    finally:
+        os.chdir(cwd)
+    return res
+
+
+def show(fn):
+    pk = PosePack(fn)
+    print(f"=== Pose pack {fn}: {os.path.getsize(fn)} bytes ===")
+    print(f"  - {pk.n_pose} poses, {pk.n_spu} speed vectors, {pk.dof} servos")
+    for n, r in pk.seqs.items():
+        print(f"  - {n}: {r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile Parameters into a pose pack and check the round trip")
+    parser.add_argument("cmd", choices=["build", "show"])
+    parser.add_argument("file", nargs="?", default=os.path.join("build", PK_FILE), help="Pack file")
+    parser.add_argument("-o", "--output", help="Pack file to write (build)")
+    parser.add_argument("--shape", help="Pose shape w_t,j_t,l_s (degrees), e.g. from utils.gait_opt")
+    parser.add_argument("--run", action="store_true", help="Run a robot with the pack and report resident rows")
+    args = parser.parse_args()
+    fn = args.output or args.file
+
+    if args.cmd == "show":
+        show(fn)
+        return
+    p = Parameters(*(int(x) for x in args.shape.split(","))) if args.shape else Parameters()
+    try:
+        n = build(fn, p)
+    except PackError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    full = len(p.st_tg) * p.dof + len(p.st_spu) * p.dof
+    print(f"=== Pose pack {fn}: {n} bytes, round trip matches ===")
+    print(f"  - {len(p.st_tg)} poses, {len(p.st_spu)} speed vectors, {len(sequences(p))} sequences "
+          f"(shape w_t={p.w_t} j_t={p.j_t} l_s={p.l_s})")
+    if args.run:
+        for name, (m, n0, o0, n_rd, n_sp, keep) in run(fn).items():
+            print(f"  - {name}: at most {m} of {len(p.st_tg)} poses resident (pinned {keep}); "
+                  f"{n0} pose rows read in {o0} file opens while booting (dance tables), {n_rd} pose and {n_sp} speed rows "
+                  f"while running")
+        print(f"  - The built-in tables keep all {full} values resident")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""
+Raw REPL File Transfer
+
+Copies files to a micro:bit over a single serial session:
+1. Interrupt the running program and enter the raw REPL once
+2. Stream every file in chunks of `w(b'...')` calls, sent in raw-paste mode
+   so the board's flow control paces the UART, or in short paced writes on
+   firmware without it (the board's UART receive buffer overruns otherwise)
+3. Verify each file on the device by size and Fletcher-16 checksum
+4. Retry only the files that failed verification
+
+SimBoard emulates the raw REPL protocol and file system in memory, so the
+engine can be exercised without hardware.
+
+After copying, --probe re-imports a module from a clean heap and reports
+its import time and the free heap before and after, as seen at boot.
+
+Usage:
+    python -m utils.raw_repl [--port PORT] [--sim] [--rm NAME] [--probe MODULE] FILE [FILE ...]
+"""
+
+import os
+import sys
+import time
+import random
+import struct
+import argparse
+
+MICROBIT_VID = 0x0D28
+MICROBIT_PID = 0x0204
+BAUDRATE = 115200
+RAW_BANNER = b"raw REPL; CTRL-B to exit\r\n>"
+CHUNK_SIZE = 64        # bytes per w() call
+CHUNKS_PER_EXEC = 8    # w() calls per raw REPL execution
+PACE_SIZE = 32         # bytes per serial write without raw-paste flow control
+PACE_S = 0.01          # pause after each paced write (s)
+PASTE_REQ = b"\x05A\x01"  # asks the raw REPL to switch to raw-paste mode
+
+# Helper installed once per session; returns (size, fletcher16) of a file
+DEVICE_HELPER = """import os
+def _ck(n):
+ a=b=0
+ with open(n,'rb') as f:
+  while 1:
+   d=f.read(64)
+   if not d:break
+   for c in d:
+    a=(a+c)%255;b=(b+a)%255
+ print(os.size(n),b<<8|a)
+"""
+
+# Unloads project modules and user globals, then times a fresh import
+PROBE = """import gc,sys,time
+for k in list(globals()):
+ if k[0]!='_' and k not in('gc','sys','time','os'):del globals()[k]
+for k in list(sys.modules):
+ if k not in('gc','sys','time','os'):del sys.modules[k]
+gc.collect();m0=gc.mem_free();t0=time.ticks_ms()
+import {0}
+t1=time.ticks_ms();gc.collect()
+print(time.ticks_diff(t1,t0),m0,gc.mem_free())
+"""
+
+
+class ReplError(Exception):
+    """Raised when the board reports an error or stops responding."""
+
+
+def fletcher16(data):
+    """Compute the Fletcher-16 checksum used by the on-device helper.
+
+    Args:
+        data (bytes): File contents
+
+    Returns:
+        int: 16-bit checksum
+    """
+    a = b = 0
+    for c in data:
+        a = (a + c) % 255
+        b = (b + a) % 255
+    return b << 8 | a
+
+
+def find_port():
+    """Return the serial port of the first connected micro:bit, or None."""
+    from serial.tools import list_ports
+    for p in list_ports.comports():
+        if p.vid == MICROBIT_VID and p.pid == MICROBIT_PID:
+            return p.device
+    return None
+
+
+def open_serial(port=None, wait=10.0):
+    """Open the micro:bit serial port, waiting for it to enumerate.
+
+    Args:
+        port (str, optional): Serial port; auto-detected if None
+        wait (float): Seconds to wait for the board after a flash/reset
+
+    Returns:
+        serial.Serial: Open serial port
+    """
+    import serial
+    deadline = time.time() + wait
+    while True:
+        dev = port or find_port()
+        try:
+            if dev:
+                return serial.Serial(dev, BAUDRATE, timeout=1, parity="N")
+        except serial.SerialException:
+            pass
+        if time.time() > deadline:
+            raise ReplError(f"micro:bit not found on port {port or 'auto'}")
+        time.sleep(0.2)
+
+
+class RawRepl(object):
+    """
+    A raw REPL session over a serial-like object.
+
+    The object only needs `read(n)` returning b'' on timeout and `write(b)`;
+    `in_waiting` is used when present. Code is sent in raw-paste mode, where
+    the board grants a window of bytes and sends b'\\x01' for each further
+    window it has room for; if the firmware refuses it, code is written
+    PACE_SIZE bytes at a time with a pause after each.
+    """
+    def __init__(self, ser, timeout=5.0):
+        self.ser = ser
+        self.timeout = timeout
+        self.paste = None           # raw-paste supported, None until asked
+
+    def read_until(self, end):
+        """Read until `end` is received or the session times out."""
+        buf = bytearray()
+        deadline = time.time() + self.timeout
+        while not buf.endswith(end):
+            c = self.ser.read(1)
+            if c:
+                buf.extend(c)
+            elif time.time() > deadline:
+                raise ReplError(f"timeout waiting for {end!r}, got {bytes(buf[-40:])!r}")
+        return bytes(buf[:-len(end)])
+
+    def read_n(self, n):
+        """Read exactly n bytes or time out."""
+        buf = bytearray()
+        deadline = time.time() + self.timeout
+        while len(buf) < n:
+            c = self.ser.read(n - len(buf))
+            if c:
+                buf.extend(c)
+            elif time.time() > deadline:
+                raise ReplError(f"timeout reading {n} bytes, got {bytes(buf)!r}")
+        return bytes(buf)
+
+    def paced(self, data):
+        """Write data in PACE_SIZE pieces, pausing after each."""
+        for i in range(0, len(data), PACE_SIZE):
+            self.ser.write(data[i:i + PACE_SIZE])
+            time.sleep(PACE_S)
+
+    def paste_mode(self):
+        """Ask for raw-paste mode.
+
+        Returns:
+            int: Flow control window in bytes, or 0 if the board does not support it
+        """
+        if self.paste is False:
+            return 0
+        self.ser.write(PASTE_REQ)
+        r = self.read_n(2)
+        if r == b"R\x01":
+            self.paste = True
+            return struct.unpack("<H", self.read_n(2))[0]
+        if r != b"R\x00":
+            # firmware that does not know the request restarts the raw REPL;
+            # its banner began with the two bytes just read
+            self.read_until(RAW_BANNER[2:])
+        self.paste = False
+        return 0
+
+    def paste_write(self, data, win):
+        """Send data in raw-paste mode, never more than the board has room for."""
+        room, i = win, 0
+        while i < len(data):
+            while room == 0 or getattr(self.ser, "in_waiting", 0):
+                c = self.read_n(1)
+                if c == b"\x01":
+                    room += win
+                elif c == b"\x04":
+                    # the board aborted, e.g. on a syntax error; acknowledge it
+                    self.ser.write(b"\x04")
+                    return
+                else:
+                    raise ReplError(f"unexpected {c!r} during raw-paste")
+            b = data[i:i + room]
+            self.ser.write(b)
+            room -= len(b)
+            i += len(b)
+        self.ser.write(b"\x04")
+        # window grants may still arrive ahead of the acknowledgement
+        if self.read_until(b"\x04").strip(b"\x01") != b"":
+            raise ReplError("raw-paste transfer was not acknowledged")
+
+    def enter(self):
+        """Stop the running program and switch the board to the raw REPL."""
+        self.ser.write(b"\r\x03\x03")
+        time.sleep(0.05)
+        self.ser.write(b"\r\x01")
+        self.read_until(RAW_BANNER)
+        self.exec(DEVICE_HELPER)
+
+    def exit(self, reset=True):
+        """Leave the raw REPL, optionally soft-resetting so main.py restarts."""
+        self.ser.write(b"\x02")
+        if reset:
+            self.ser.write(b"\x04")
+
+    def exec(self, code):
+        """Execute code on the board and return its printed output.
+
+        Raises:
+            ReplError: If the code raised on the device
+        """
+        win = self.paste_mode()
+        if win:
+            self.paste_write(code.encode("utf8"), win)
+        else:
+            self.paced(code.encode("utf8") + b"\x04")
+            if self.read_until(b"OK") != b"":
+                raise ReplError("raw REPL rejected the command")
+        out = self.read_until(b"\x04")
+        err = self.read_until(b"\x04")
+        self.read_until(b">")
+        if err:
+            raise ReplError(err.decode("utf8", "replace").strip())
+        return out.decode("utf8", "replace")
+
+    def put(self, name, data):
+        """Write `data` to file `name` on the board in chunks."""
+        self.exec(f"f=open({name!r},'wb');w=f.write")
+        chunks = [data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+        for i in range(0, len(chunks), CHUNKS_PER_EXEC):
+            self.exec("\n".join(f"w({c!r})" for c in chunks[i:i + CHUNKS_PER_EXEC]))
+        self.exec("f.close()")
+
+    def remove(self, name):
+        """Delete `name` from the board if it exists."""
+        self.exec(f"try:\n os.remove({name!r})\nexcept OSError:\n pass")
+
+    def probe(self, module):
+        """Import `module` from a clean heap on the board.
+
+        Returns:
+            tuple[int, int, int]: (import ms, free heap before, free heap after)
+        """
+        return tuple(int(v) for v in self.exec(PROBE.format(module)).split())
+
+    def verify(self, name, data):
+        """Check size and checksum of `name` on the board against `data`."""
+        size, ck = self.exec(f"_ck({name!r})").split()
+        return int(size) == len(data) and int(ck) == fletcher16(data)
+
+
+def transfer(ser, files, max_retries=3, reset=True, remove=(), probe=None):
+    """Copy files to the board, verifying each and retrying only failures.
+
+    Args:
+        ser: Serial-like object connected to the board
+        files (list[tuple[str, str]]): (source path, destination name) pairs
+        max_retries (int): Maximum attempts per file
+        reset (bool): Soft-reset the board when done
+        remove (list[str]): Stale files to delete first, e.g. X.py shadowing X.mpy
+        probe (str, optional): Module whose boot import time and heap to report
+
+    Returns:
+        list[str]: Destination names that could not be copied
+    """
+    repl = RawRepl(ser)
+    pending = []
+    for src, dest in files:
+        with open(src, "rb") as f:
+            pending.append((src, dest, f.read()))
+    for attempt in range(max_retries):
+        if not pending:
+            break
+        print(f"  - Pass {attempt + 1}/{max_retries}: {len(pending)} file(s)")
+        failed = []
+        try:
+            repl.enter()
+            for name in remove:
+                repl.remove(name)
+        except ReplError as e:
+            print(f"  - Error entering raw REPL: {e}")
+            continue
+        for src, dest, data in pending:
+            t0 = time.time()
+            try:
+                repl.put(dest, data)
+                if repl.verify(dest, data):
+                    print(f"  - {dest}: {len(data)} bytes verified in {time.time() - t0:.2f}s")
+                    continue
+                print(f"  - {dest}: checksum mismatch")
+            except ReplError as e:
+                print(f"  - {dest}: {e}")
+                # Resynchronise the session before the next file
+                try:
+                    repl.enter()
+                except ReplError:
+                    pass
+            failed.append((src, dest, data))
+        pending = failed
+    if probe and not pending:
+        try:
+            ms, m0, m1 = repl.probe(probe)
+            print(f"  - Boot: import {probe} took {ms} ms, free heap {m0} -> {m1} bytes")
+        except (ReplError, ValueError) as e:
+            print(f"  - Boot probe failed: {e}")
+    try:
+        repl.exit(reset)
+    except Exception:
+        pass
+    return [dest for _, dest, _ in pending]
+
+
+class _SimFile(object):
+    def __init__(self, fs, name, mode):
+        self.fs, self.name, self.mode = fs, name, mode
+        self.buf = bytearray() if "w" in mode else bytearray(fs[name])
+        self.rpos = 0
+
+    def write(self, b):
+        self.buf.extend(b)
+        return len(b)
+
+    def read(self, n=-1):
+        n = len(self.buf) - self.rpos if n < 0 else n
+        d = bytes(self.buf[self.rpos:self.rpos + n])
+        self.rpos += len(d)
+        return d
+
+    def close(self):
+        if "w" in self.mode:
+            self.fs[self.name] = bytes(self.buf)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        self.close()
+
+
+class SimBoard(object):
+    """
+    Simulated micro:bit serial endpoint with a raw REPL and file system.
+
+    Args:
+        corrupt (float): Probability that a written file is corrupted in transit
+        seed (int): Random seed for reproducible corruption
+        paste (bool): Support raw-paste mode, with a flow control window of win bytes
+        win (int): Raw-paste window (bytes)
+    """
+    def __init__(self, corrupt=0.0, seed=0, paste=True, win=128):
+        self.fs = {}
+        self.corrupt = corrupt
+        self.rng = random.Random(seed)
+        self.paste = paste
+        self.win = win
+        self.raw = False
+        self.esc = None           # bytes after ctrl-E, None outside a raw-paste request
+        self.pasting = False      # receiving code in raw-paste mode
+        self.n_in = 0             # raw-paste bytes received in the current window
+        self.room = 0             # raw-paste bytes the host may still send
+        self.cmd = bytearray()
+        self.out = bytearray()
+        self.resets = self.execs = 0
+        import builtins
+        bi = dict(vars(builtins), open=self._open, __import__=self._import)
+        self.env = {"__builtins__": bi, "__name__": "__main__"}
+
+    def _open(self, name, mode="r"):
+        if "r" in mode and name not in self.fs:
+            raise OSError(2)
+        return _SimFile(self.fs, name, mode)
+
+    def _import(self, name, *a, **k):
+        if name != "os":
+            raise ImportError(f"no module named '{name}'")
+        return self
+
+    # os module stand-in
+    def size(self, name):
+        return len(self.fs[name])
+
+    def listdir(self):
+        return list(self.fs)
+
+    def remove(self, name):
+        if self.fs.pop(name, None) is None:
+            raise OSError(2)
+
+    def _run(self, code):
+        import io
+        import contextlib
+        import traceback
+        self.execs += 1
+        if self.corrupt and code == "f.close()" and self.rng.random() < self.corrupt:
+            code = "f.buf[-1]^=1;" + code
+        out, err = io.StringIO(), ""
+        try:
+            with contextlib.redirect_stdout(out):
+                exec(code, self.env)
+        except Exception:
+            err = traceback.format_exc(limit=0)
+        return out.getvalue().encode() + b"\x04" + err.encode() + b"\x04>"
+
+    def write(self, data):
+        for c in data:
+            if self.pasting:
+                if c == 0x04:
+                    self.pasting = False
+                    self.out.extend(b"\x04" + self._run(self.cmd.decode("utf8")))
+                    self.cmd = bytearray()
+                    continue
+                self.room -= 1
+                if self.room < 0:
+                    raise ReplError("raw-paste window overrun")
+                self.cmd.append(c)
+                self.n_in += 1
+                if self.n_in == self.win:
+                    self.n_in, self.room = 0, self.room + self.win
+                    self.out.append(0x01)  # room for another window
+            elif self.esc is not None:
+                self.esc.append(c)
+                if len(self.esc) == 2:
+                    if self.esc == b"A\x01" and self.paste:
+                        self.pasting, self.n_in, self.room, self.cmd = True, 0, self.win, bytearray()
+                        self.out.extend(b"R\x01" + struct.pack("<H", self.win))
+                    else:
+                        self.out.extend(b"R\x00")
+                    self.esc = None
+            elif not self.raw:
+                if c == 0x01:
+                    self.raw, self.cmd = True, bytearray()
+                    self.out.extend(RAW_BANNER)
+                elif c == 0x04:
+                    self.resets += 1
+            elif c == 0x02:
+                self.raw = False
+            elif c == 0x01:
+                self.cmd = bytearray()
+                self.out.extend(RAW_BANNER)
+            elif c == 0x03:
+                self.cmd = bytearray()
+            elif c == 0x04:
+                self.out.extend(b"OK" + self._run(self.cmd.decode("utf8")))
+                self.cmd = bytearray()
+            elif c == 0x05 and not self.cmd:
+                self.esc = bytearray()
+            else:
+                self.cmd.append(c)
+        return len(data)
+
+    def read(self, n=1):
+        d = bytes(self.out[:n])
+        del self.out[:n]
+        return d
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy files to a micro:bit over one raw REPL session")
+    parser.add_argument("files", nargs="+", help="Files to copy (stored under their base name)")
+    parser.add_argument("--port", help="Serial port for micro:bit (auto-detected if omitted)")
+    parser.add_argument("--retries", type=int, default=3, help="Maximum attempts per file")
+    parser.add_argument("--wait", type=float, default=10.0, help="Seconds to wait for the board to appear")
+    parser.add_argument("--rm", action="append", default=[], help="File to delete from the board first")
+    parser.add_argument("--probe", help="Module to import after copying to measure boot time and heap")
+    parser.add_argument("--sim", action="store_true", help="Use a simulated board instead of hardware")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="File corruption rate for --sim")
+    args = parser.parse_args()
+
+    files = [(os.path.abspath(f), os.path.basename(f)) for f in args.files]
+    ser = SimBoard(args.corrupt) if args.sim else open_serial(args.port, args.wait)
+    t0 = time.time()
+    failed = transfer(ser, files, args.retries, remove=args.rm, probe=args.probe)
+    print(f"Copied {len(files) - len(failed)}/{len(files)} files in {time.time() - t0:.2f}s")
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Sensor and Radio Record/Replay
+
+Runs RobotPu on the host hardware stand-in (utils.emu) and:
+1. record: drives a scenario, logs every accelerometer, microphone, sonar,
+   gesture, button, temperature and radio input with its timestamp to a
+   compact binary log, and writes the servo command trace as the golden trace
+2. replay: feeds a log back into a fresh robot with `random` seeded the same
+   way, as fast as the host allows, and compares the servo command trace
+   against the golden one, reporting the first divergence
+
+Log format: header b"PULG" + version, seed, tick (us), then records of
+(t_ms uint32, channel uint8) followed by the channel payload.
+Trace format: header b"PUTR" + version, then (t_ms uint32, register, value).
+
+Usage:
+    python -m utils.replay record [--scenario dance] [--seconds 30] [--log build/pu.log] [--golden build/pu.trace]
+    python -m utils.replay replay [--log build/pu.log] [--golden build/pu.trace]
+"""
+
+import os
+import sys
+import time
+import struct
+import argparse
+from collections import deque
+
+from utils import emu
+
+LOG_MAGIC = b"PULG"
+TRACE_MAGIC = b"PUTR"
+VERSION = 1
+REC = struct.Struct("<IB")
+TRACE_REC = struct.Struct("<IBB")
+# channel -> (code, payload format); radio payloads are length-prefixed bytes
+CHANNELS = {
+    "accel": (1, struct.Struct("<hhh")),
+    "sound": (2, struct.Struct("<B")),
+    "loud": (3, struct.Struct("<B")),
+    "sonar": (4, struct.Struct("<i")),
+    "gesture": (5, struct.Struct("<B")),
+    "button": (6, struct.Struct("<B")),
+    "temperature": (7, struct.Struct("<b")),
+    "radio": (8, None),
+}
+CODES = {c: (name, fmt) for name, (c, fmt) in CHANNELS.items()}
+
+
+class ReplayEnd(BaseException):
+    """
+    The log has no more records for a channel the robot read.
+
+    Derived from BaseException so the robot's guarded loop does not swallow it.
+    """
+
+
+class Recorder(object):
+    """Append input records to a binary log file."""
+    def __init__(self, fn, seed, tick_us):
+        self.f = open(fn, "wb")
+        self.f.write(LOG_MAGIC + struct.pack("<BII", VERSION, seed, tick_us))
+        self.n = 0  # records written
+
+    def write(self, t, ch, v):
+        code, fmt = CHANNELS[ch]
+        if fmt is None:
+            b = v or b""
+            self.f.write(REC.pack(t, code) + struct.pack("<B", len(b)) + b)
+        elif ch == "accel":
+            self.f.write(REC.pack(t, code) + fmt.pack(*v))
+        else:
+            self.f.write(REC.pack(t, code) + fmt.pack(int(v)))
+        self.n += 1
+
+    def close(self):
+        self.f.close()
+
+
+class Replayer(emu.Source):
+    """
+    Source returning the logged inputs in order, per channel.
+
+    Reads are matched by channel and order, not by time; `skew` counts reads
+    whose board time differs from the logged time, a sign the replayed robot
+    no longer follows the recorded run.
+    """
+    def __init__(self, fn):
+        with open(fn, "rb") as f:
+            b = f.read()
+        if b[:4] != LOG_MAGIC or b[4] != VERSION:
+            raise ValueError(f"{fn} is not a version {VERSION} Pu log")
+        self.seed, self.tick_us = struct.unpack_from("<II", b, 5)
+        self.q = {name: deque() for name in CHANNELS}
+        self.n = 0
+        self.skew = 0
+        o = 13
+        while o < len(b):
+            t, code = REC.unpack_from(b, o)
+            o += REC.size
+            name, fmt = CODES[code]
+            if fmt is None:
+                n = b[o]
+                v = bytes(b[o + 1:o + 1 + n]) or None
+                o += 1 + n
+            else:
+                v = fmt.unpack_from(b, o)
+                v = v if name == "accel" else (bool(v[0]) if name in ("loud", "gesture", "button") else v[0])
+                o += fmt.size
+            self.q[name].append((t, v))
+            self.n += 1
+
+    def _pop(self, ch, t):
+        if not self.q[ch]:
+            raise ReplayEnd(ch)
+        lt, v = self.q[ch].popleft()
+        if lt != t:
+            self.skew += 1
+        return v
+
+    def accel(self, t):
+        return self._pop("accel", t)
+
+    def sound(self, t):
+        return self._pop("sound", t)
+
+    def loud(self, t):
+        return self._pop("loud", t)
+
+    def sonar(self, t):
+        return self._pop("sonar", t)
+
+    def gesture(self, t, name):
+        return self._pop("gesture", t)
+
+    def button(self, t, name):
+        return self._pop("button", t)
+
+    def temperature(self, t):
+        return self._pop("temperature", t)
+
+    def radio(self, t):
+        return self._pop("radio", t)
+
+
+def write_trace(fn, trace):
+    with open(fn, "wb") as f:
+        f.write(TRACE_MAGIC + bytes([VERSION]))
+        for r in trace:
+            f.write(TRACE_REC.pack(*r))
+
+
+def read_trace(fn):
+    with open(fn, "rb") as f:
+        b = f.read()
+    if b[:4] != TRACE_MAGIC or b[4] != VERSION:
+        raise ValueError(f"{fn} is not a version {VERSION} Pu servo trace")
+    return [TRACE_REC.unpack_from(b, o) for o in range(5, len(b), TRACE_REC.size)]
+
+
+def compare(golden, trace):
+    """Index of the first differing servo command, or -1 if the traces match."""
+    for i in range(min(len(golden), len(trace))):
+        if golden[i] != trace[i]:
+            return i
+    return -1 if len(golden) == len(trace) else min(len(golden), len(trace))
+
+
+def run(b, seed, seconds=None):
+    """Run a robot on board b until `seconds` of robot time or the end of the log.
+
+    Returns:
+        tuple: (loop iterations, host seconds)
+    """
+    r = emu.load_robot(b, seed=seed)
+    tick_us = getattr(b.source, "tick_us", 20000)
+    n, t0 = 0, time.perf_counter()
+    try:
+        while seconds is None or b.t_us < seconds * 1e6:
+            b.step(r, tick_us)
+            n += 1
+    except ReplayEnd:
+        # the final iteration read past the log; drop its partial output
+        pass
+    return n, time.perf_counter() - t0
+
+
+def record(args):
+    b = emu.Board(emu.Scenario(args.scenario, args.seed))
+    os.makedirs(os.path.dirname(args.log) or ".", exist_ok=True)
+    b.recorder = Recorder(args.log, args.seed, args.tick_us)
+    b.source.tick_us = args.tick_us
+    n, el = run(b, args.seed, args.seconds)
+    b.recorder.close()
+    write_trace(args.golden, b.trace)
+    print(f"  - Recorded {b.recorder.n} inputs, {len(b.trace)} servo commands in {n} loops")
+    print(f"  - Log {os.path.getsize(args.log)} bytes -> {args.log}, golden trace -> {args.golden}")
+    return 0
+
+
+def replay(args):
+    src = Replayer(args.log)
+    b = emu.Board(src)
+    n, el = run(b, src.seed)
+    golden = read_trace(args.golden)
+    # a replay stops at the first read past the log, inside the last loop
+    trace = b.trace[:len(golden)]
+    i = compare(golden, trace)
+    print(f"  - Replayed {src.n} inputs, {n} loops, {b.t_us / 1e6:.1f}s robot time in {el:.2f}s "
+          f"({b.t_us / 1e6 / max(el, 1e-9):.0f}x real time)")
+    if src.skew:
+        print(f"  - {src.skew} inputs read at a different time than recorded")
+    if i < 0:
+        print(f"  - Servo trace matches golden ({len(golden)} commands)")
+        return 0
+    g = golden[i] if i < len(golden) else None
+    t = trace[i] if i < len(trace) else None
+    print(f"  - Servo trace diverges at command {i}: golden {g}, replay {t}")
+    return 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and replay RobotPu sensor and radio inputs")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    rec = sub.add_parser("record", help="Record a scenario and its golden servo trace")
+    rec.add_argument("--scenario", choices=emu.Scenario.NAMES, default="dance")
+    rec.add_argument("--seconds", type=float, default=30.0, help="Robot time to record")
+    rec.add_argument("--seed", type=int, default=0, help="Seed for random and sensor noise")
+    rec.add_argument("--tick-us", type=int, default=20000, help="Loop time charged per iteration")
+    rep = sub.add_parser("replay", help="Replay a log and compare against the golden trace")
+    for p in (rec, rep):
+        p.add_argument("--log", default=os.path.join("build", "pu.log"))
+        p.add_argument("--golden", default=os.path.join("build", "pu.trace"))
+    args = parser.parse_args()
+    for a in ("log", "golden"):
+        setattr(args, a, os.path.abspath(getattr(args, a)))
+    print(f"=== {args.mode.capitalize()} ===")
+    sys.exit(record(args) if args.mode == "record" else replay(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Chunked Song and Speech Sender
+
+Splits a long song or speech text into "#puk" chunks (message ID, index and
+total in every chunk) and broadcasts them through a micro:bit connected over
+USB, which acts as a radio relay driven over the raw REPL. Robots reassemble
+the chunks in any order and sing or speak the message once it is complete.
+
+Usage:
+    python -m utils.send_chunks --song [--seed 1]            # compose with Content.compose_song()
+    python -m utils.send_chunks --text "Hello, I am Pu"       # speak text
+    python -m utils.send_chunks --song --dry                  # print chunks and packets only
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+from utils import packets
+from utils.raw_repl import RawRepl, ReplError, open_serial
+
+RELAY_SETUP = "from microbit import sleep\nimport radio\nradio.config(group={0}, channel={1}, queue=3, data_rate=radio.RATE_1MBIT, power=6)\nradio.on()\n"
+SEND = "radio.send_bytes({0!r})\nsleep({1})\n"
+
+
+def compose_song(seed=None):
+    """A song from the robot's own composer, Content.compose_song()."""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+    from Content import Content
+    if seed is not None:
+        random.seed(seed)
+    return Content().compose_song()
+
+
+def send(repl, pkts, gap_ms=200, per_exec=8):
+    """Broadcast packets through the relay, a few per raw REPL command."""
+    for i in range(0, len(pkts), per_exec):
+        repl.exec("".join(SEND.format(p, gap_ms) for p in pkts[i:i + per_exec]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a long song or speech text to robots in chunks")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--song", action="store_true", help="Compose a song with Content.compose_song()")
+    src.add_argument("--text", help="Text to speak")
+    src.add_argument("--sing", help="Song string to sing")
+    parser.add_argument("--seed", type=int, help="Seed for the composed song")
+    parser.add_argument("--mid", type=int, help="Message ID 0-35 (random if omitted)")
+    parser.add_argument("--group", type=int, default=166, help="Radio group of the robots")
+    parser.add_argument("--channel", type=int, default=7, help="Radio channel")
+    parser.add_argument("--repeat", type=int, default=2, help="Times each chunk is sent, against packet loss")
+    parser.add_argument("--gap", type=int, default=200,
+                        help="Gap between packets (ms); a sleeping robot reads its 3-packet queue every 500 ms")
+    parser.add_argument("--port", help="Serial port of the relay micro:bit (auto-detected if omitted)")
+    parser.add_argument("--dry", action="store_true", help="Print the chunks instead of sending")
+    args = parser.parse_args()
+
+    kind, text = ("t", args.text) if args.text else ("s", args.sing or compose_song(args.seed))
+    try:
+        chunks = packets.chunk(text, kind, args.mid)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    # repeat the whole message rather than each chunk, so a burst of loss
+    # does not take out every copy of the same chunk
+    pkts = [packets.str_packet(c, args.group) for _ in range(args.repeat) for c in chunks]
+    print(f"=== {'Song' if kind == 's' else 'Speech'}: {len(text)} characters in {len(chunks)} chunks ===")
+    if args.dry:
+        for c, p in zip(chunks, pkts):
+            print(f"  - {c:<20} {len(p)} bytes")
+        return
+    ser = open_serial(args.port)
+    repl = RawRepl(ser)
+    try:
+        repl.enter()
+        repl.exec(RELAY_SETUP.format(args.group, args.channel))
+        t0 = time.time()
+        send(repl, pkts, args.gap)
+        print(f"  - Sent {len(pkts)} packets in {time.time() - t0:.2f}s")
+    except ReplError as e:
+        print(f"  - Relay error: {e}")
+        sys.exit(1)
+    finally:
+        repl.exit(reset=False)
+        ser.close()
+
+
+if __name__ == "__main__":
+    main()
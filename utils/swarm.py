@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Multi-Robot Swarm Simulator
+
+Runs many RobotPu instances in one process on the host hardware stand-in
+(utils.emu), each driven by its own emulated gamepad, all sharing one
+virtual radio medium:
+1. Robot i and its gamepad use group 166 + i on channel 7, as in a
+   classroom; all groups share the channel, so packets of every pair
+   collide in the air
+2. Gamepads send speed, turn, roll and pitch in turn, like the MakeCode
+   gamepad; the medium adds loss, latency and collisions, and each robot
+   keeps at most `queue` (3, as in MakeRadio) packets until it reads them
+3. Nodes are stepped cooperatively in room-time order; robot boots are
+   staggered so the robots do not tick in lockstep
+4. For each swarm size, report per-robot command latency (gamepad send to
+   robot read), dropped packets and the channel airtime
+
+The emulator charges no time for the robot's own computation (each loop
+iteration stands in for a fixed tick), so the loop rate is not reported:
+it would not change with the swarm size here.
+
+Usage:
+    python -m utils.swarm [--robots 10,50,100,200] [--seconds 10] [--loss 0.01] [--lat 1] [--tl 0]
+    python -m utils.swarm --robots 8 --detail            # one line per robot
+"""
+
+import math
+import time
+import heapq
+import random
+import argparse
+
+from utils import emu
+from utils.packets import value_packet
+
+GROUP0 = 166
+CHANNEL = 7
+JOY = ("#puspeed", "#puturn", "#puroll", "#pupitch")
+
+
+class Gamepad(object):
+    """
+    Emulated MakeCode gamepad on the shared medium.
+
+    Sends one joystick value per step, cycling through speed, turn, roll and
+    pitch, so all four are sent about every period_ms. The time between
+    packets varies by up to 20%, like a MakeCode loop, so gamepads do not
+    stay locked onto each other's slots. Packets it receives (acks, status
+    codes, telemetry) are read and discarded.
+
+    Args:
+        group (int): Radio group of the robot it drives
+        period_ms (int): Time to send all joystick values
+        t0_us (int): Room time of the first packet (us)
+        seed (int): Seed for the stick movements
+    """
+    def __init__(self, group, period_ms=100, t0_us=0, seed=0):
+        self.name = f"gp{group}"
+        self.radio_cfg = {"group": group, "channel": CHANNEL, "queue": 3}
+        self.radio_on = True
+        self.t_us = t0_us
+        self.step_us = period_ms * 1000 // len(JOY)
+        self.rng = random.Random(seed)
+        self.ph = self.rng.random() * 6.28  # stick movement phase
+        self.k = 0                # index of the next value to send
+        self.rx, self.air = [], []
+        self.medium = None
+        self.n_loss = self.n_coll = self.n_full = 0
+
+    def room_us(self):
+        return self.t_us
+
+    def step(self, robot=None):
+        ms = self.t_us // 1000
+        a = ms * 0.001 + self.ph
+        v = (0.6 + 0.3 * math.sin(a * 0.3), math.sin(a), 0.3 * math.sin(a * 0.7), 0.3 * math.cos(a * 0.5))
+        self.medium.send(self, value_packet(JOY[self.k], v[self.k], self.radio_cfg["group"], ts=ms))
+        self.k = (self.k + 1) % len(JOY)
+        self.medium.poll(self)
+        self.rx.clear()
+        self.t_us += self.step_us + self.rng.randint(-self.step_us // 5, self.step_us // 5)
+
+
+class Swarm(object):
+    """
+    Nodes sharing a Medium, stepped cooperatively in room-time order.
+
+    Args:
+        medium (emu.Medium): Radio medium of the swarm
+    """
+    def __init__(self, medium):
+        self.medium = medium
+        self.nodes = []           # (node, robot or None)
+
+    def add(self, node, robot=None):
+        self.medium.attach(node)
+        self.nodes.append((node, robot))
+
+    def run(self, until_ms, sample_ms=0, sample=None):
+        """
+        Step the node that is furthest behind until all reach room time until_ms.
+
+        Args:
+            until_ms (int): Room time to run to (ms)
+            sample_ms (int): Period of sample() calls in room time (ms)
+            sample (callable): Called with the room time (ms) once every
+                node has reached it
+        """
+        h = [(n.room_us(), i) for i, (n, _) in enumerate(self.nodes)]
+        heapq.heapify(h)
+        end = until_ms * 1000
+        nxt = (h[0][0] // 1000 // sample_ms + 1) * sample_ms if sample else None
+        while h[0][0] < end:
+            t, i = h[0]
+            if sample and t >= nxt * 1000:
+                sample(nxt)
+                nxt += sample_ms
+                continue
+            n, r = self.nodes[i]
+            n.step(r)
+            heapq.heapreplace(h, (n.room_us(), i))
+
+
+def build(n, args):
+    """Boot n robots and their gamepads on one medium.
+
+    Returns:
+        tuple: (Swarm, list of (Board, RobotPu))
+    """
+    rng = random.Random(args.seed)
+    med = emu.Medium(args.loss, args.lat, args.jitter, not args.no_collide, args.seed)
+    sw = Swarm(med)
+    bots = []
+    for i in range(n):
+        g = (GROUP0 + i) % 256
+        b = emu.Board(name=f"pu{i}")
+        b.t_us = b.t0_us = rng.randint(0, 2000000)  # staggered power-on
+        r = emu.load_robot(b, sn=f"P{i}", seed=args.seed + i)
+        r.set_group(g)
+        r.tl = args.tl
+        sw.add(b, r)
+        sw.add(Gamepad(g, args.period, rng.randint(0, 100000), args.seed + i))
+        bots.append((b, r))
+    return sw, bots
+
+
+def measure(n, args):
+    """Run a swarm of n robots and collect per-robot statistics."""
+    t0 = time.perf_counter()
+    sw, bots = build(n, args)
+    boot = time.perf_counter() - t0
+    warm = max(b.room_us() for b, _ in bots) // 1000 + 1000
+    sw.run(warm)
+    for b, r in bots:
+        b.lat.clear()
+        b.n_loss = b.n_coll = b.n_full = 0
+    busy0 = sw.medium.busy_us.get(CHANNEL, 0)
+    t0 = time.perf_counter()
+    sw.run(warm + args.seconds * 1000)
+    el = time.perf_counter() - t0
+    rows = []
+    for b, r in bots:
+        lat = sorted(us / 1000 for src, us in b.lat if isinstance(src, Gamepad))
+        got = len(b.lat)
+        lost = b.n_loss + b.n_coll + b.n_full
+        rows.append({
+            "name": b.name, "n": len(lat),
+            "lat": sum(lat) / max(1, len(lat)), "p95": lat[int(len(lat) * 0.95)] if lat else 0,
+            "loss": b.n_loss, "coll": b.n_coll, "full": b.n_full,
+            "drop": lost / max(1, got + lost), "st": r.gst,
+        })
+    air = (sw.medium.busy_us.get(CHANNEL, 0) - busy0) / (args.seconds * 1e6)
+    return rows, air, boot, el
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate many robots and gamepads on a shared radio channel")
+    parser.add_argument("--robots", default="10,50,100,200", help="Comma-separated swarm sizes")
+    parser.add_argument("--seconds", type=int, default=10, help="Room time measured per swarm size")
+    parser.add_argument("--period", type=int, default=100, help="Gamepad time to send all joystick values (ms)")
+    parser.add_argument("--loss", type=float, default=0.01, help="Random packet loss probability")
+    parser.add_argument("--lat", type=float, default=1.0, help="Radio latency (ms)")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Radio latency jitter (ms)")
+    parser.add_argument("--no-collide", action="store_true", help="Do not lose overlapping packets")
+    parser.add_argument("--tl", type=int, default=0, help="Robot telemetry period in ticks (0 = off)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--detail", action="store_true", help="Print one line per robot")
+    args = parser.parse_args()
+
+    print(f"=== Swarm: {args.seconds}s per size, loss {args.loss:.0%}, latency {args.lat}+{args.jitter} ms, "
+          f"{'no ' if args.no_collide else ''}collisions ===")
+    print(f"{'robots':>6}{'lat ms':>8}{'p95':>6}{'worst':>7}{'drop':>7}{'worst':>7}"
+          f"{'coll':>7}{'full':>7}{'air':>6}{'host s':>8}{'x real':>8}")
+    for n in [int(x) for x in args.robots.split(",")]:
+        rows, air, boot, el = measure(n, args)
+        lat = [r["lat"] for r in rows]
+        dr = [r["drop"] for r in rows]
+        print(f"{n:6}{sum(lat) / n:8.1f}{sum(r['p95'] for r in rows) / n:6.0f}"
+              f"{max(lat):7.1f}{sum(dr) / n:7.1%}{max(dr):7.1%}{sum(r['coll'] for r in rows):7}"
+              f"{sum(r['full'] for r in rows):7}{air:6.0%}{boot + el:8.1f}{n * args.seconds / el:8.1f}")
+        if args.detail:
+            for r in rows:
+                print(f"  - {r['name']:6} st {r['st']:2}, {r['n']:4} commands, "
+                      f"latency {r['lat']:5.1f} ms (p95 {r['p95']:4.0f}), lost {r['loss']} + collided {r['coll']} "
+                      f"+ queue full {r['full']} ({r['drop']:.1%})")
+    print("  - lat: gamepad send to robot read, per robot; drop: packets for a robot lost, collided or dropped")
+    print("  - air: channel airtime in use; x real: robot-seconds simulated per host second")
+
+
+if __name__ == "__main__":
+    main()
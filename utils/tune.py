@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Live Parameter Tuning
+
+Sets robot parameters over the radio through the bridge service
+(utils.bridge), without editing the source and flashing again:
+1. Parameters are named as the firmware numbers them (src/Tune.py):
+   scalars by name (fw_sp, d_sp), Parameters table entries by table, row
+   and column (st_tg.2.0, s_tr.4); names and values are checked against
+   the same IDs, types and ranges the robots check
+2. push sends ("#pps<id>", value) to every group at once, listening on
+   all of them; each robot replies with the value it applied or an error
+   code, and values not confirmed are sent again to one group at a time
+   while listening on it only; --save then asks each robot to store its
+   tuned parameters in its config store ("#ppw")
+3. get asks each robot for every parameter ("#ppg"), sent a few per
+   tick, and asks again for any that were not heard, or for the named
+   ones only
+4. list prints every parameter with its ID, type and range
+
+--loopback N runs a bridge with N emulated robots in this process instead
+of connecting to a running one; selftest uses it to push, save and read
+back a parameter set and checks the robots' state and config stores.
+
+Usage:
+    python -m utils.tune list
+    python -m utils.tune push --groups 166,167 --set fw_sp=4.5,d_sp=1.8,st_tg.2.0=70 [--save]
+    python -m utils.tune get --groups 166 [--names fw_sp,st_tg.2.0]
+    python -m utils.tune selftest [--loopback 4]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+from utils import bridge
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+from Parameters import Parameters  # noqa: E402
+from Tune import Tune, TUNE_VARS, TUNE_TABS, TN_CFG, TN_TYPE  # noqa: E402
+
+ERRORS = {1: "unknown ID", 2: "wrong type", 3: "out of range"}
+
+
+def table():
+    """Name -> (ID, type, low, high) of every parameter, numbered as the firmware does."""
+    t = {}
+    for i, (n, _, _, ty, lo, hi) in enumerate(TUNE_VARS):
+        t[n] = (i, ty, lo, hi)
+    p = Parameters()
+    for n, a, f, ty, lo, hi in TUNE_TABS:
+        tb = getattr(p, a)
+        if isinstance(tb[0], list):
+            for r in range(len(tb)):
+                for k in range(len(tb[0])):
+                    t[f"{n}.{r}.{k}"] = (f + r * len(tb[0]) + k, ty, lo, hi)
+        else:
+            for k in range(len(tb)):
+                t[f"{n}.{k}"] = (f + k, ty, lo, hi)
+    # the robot walks the same IDs for "get all"
+    ids, i, tn = [], 0, Tune(None, p)
+    while i >= 0:
+        ids.append(i)
+        i = tn.nxt(i)
+    assert sorted(v[0] for v in t.values()) == ids, "parameter table out of step with src/Tune.py"
+    return t
+
+
+def parse_set(s, tbl):
+    """Parse "name=value,..." into [(name, ID, value)], checking types and ranges.
+
+    Raises:
+        ValueError: On an unknown name, a value of the wrong type or out of range
+    """
+    out = []
+    for item in s.split(","):
+        name, _, v = item.partition("=")
+        name = name.strip()
+        if name not in tbl:
+            raise ValueError(f"unknown parameter {name!r} (see: python -m utils.tune list)")
+        i, ty, lo, hi = tbl[name]
+        try:
+            v = int(v) if ty is int else float(v)
+        except ValueError:
+            raise ValueError(f"{name} takes {'an integer' if ty is int else 'a number'}, not {v!r}")
+        if not lo <= v <= hi:
+            raise ValueError(f"{name}={v} is outside {lo}..{hi}")
+        out.append((name, i, v))
+    return out
+
+
+class Client(object):
+    """
+    Connection to a bridge: requests go over short connections, replies of
+    the robots arrive on a subscription.
+
+    Args:
+        addr (str): Bridge API address, host:port or a Unix socket path
+    """
+    def __init__(self, addr):
+        self.addr = addr
+        self.reader = self.writer = None
+        self.vals = {}            # group -> {ID: value} replied
+        self.errs = {}            # group -> {ID: error code} replied
+        self.n = {}               # group -> count from ("pn", count)
+        self.saved = {}           # group -> 1 or 0 from ("pw", ok)
+
+    async def open(self):
+        self.reader, self.writer = await bridge.open_api(self.addr)
+        self.writer.write(b'{"op": "subscribe"}\n')
+        await self.writer.drain()
+        await self.reader.readline()
+
+    def close(self):
+        self.writer.close()
+
+    async def req(self, msg):
+        r = await bridge.request(self.addr, msg)
+        if not r.get("ok"):
+            raise RuntimeError(f"bridge refused {msg}: {r.get('error')}")
+        return r
+
+    async def send(self, groups, name, value=0):
+        await self.req({"op": "send", "groups": groups, "name": name, "value": value})
+
+    async def listen(self, groups, dwell=100):
+        await self.req({"op": "listen", "groups": groups, "dwell": dwell})
+
+    async def collect(self, s, done=None):
+        """Take robot replies for up to s seconds, or until done() is true."""
+        t0 = time.monotonic()
+        while time.monotonic() - t0 < s and not (done and done()):
+            try:
+                e = json.loads(await asyncio.wait_for(self.reader.readline(), 0.05))
+            except asyncio.TimeoutError:
+                continue
+            if e.get("ev") != "value":
+                continue
+            g, name, v = e["group"], e["name"], e["value"]
+            if name == "pn":
+                self.n[g] = v
+            elif name == "pw":
+                self.saved[g] = v
+            elif name[:2] == "pe" and name[2:].isdigit():
+                self.errs.setdefault(g, {})[int(name[2:])] = v
+            elif name[:1] == "p" and name[1:].isdigit():
+                self.vals.setdefault(g, {})[int(name[1:])] = v
+
+    async def push(self, groups, sets, save=False, tries=3):
+        """
+        Set parameters on every group, then save them if asked.
+
+        Returns:
+            dict: group -> list of (name, problem) for values not confirmed
+        """
+        def missing(g):
+            return [(n, i, v) for n, i, v in sets
+                    if i not in self.errs.get(g, {}) and self.vals.get(g, {}).get(i) != v]
+        await self.listen(groups)
+        for _, i, v in sets:
+            await self.send(groups, f"#pps{i}", v)
+        await self.collect(1.0 + 0.1 * len(sets), lambda: not any(missing(g) for g in groups))
+        for _ in range(tries):
+            for g in groups:
+                m = missing(g)
+                if not m:
+                    continue
+                await self.listen([g])
+                for _, i, v in m:
+                    await self.send([g], f"#pps{i}", v)
+                await self.collect(0.6 + 0.05 * len(m), lambda: not missing(g))
+        if save:
+            for g in groups:
+                if missing(g):
+                    continue  # do not store a partial set
+                await self.listen([g])
+                for _ in range(tries):
+                    await self.send([g], "#ppw", 1)
+                    await self.collect(1.0, lambda: g in self.saved)
+                    if g in self.saved:
+                        break
+        res = {}
+        for g in groups:
+            res[g] = [(n, "no reply") for n, _, _ in missing(g)]
+            res[g] += [(n, ERRORS.get(self.errs[g][i], self.errs[g][i]))
+                       for n, i, _ in sets if i in self.errs.get(g, {})]
+            if save and not res[g] and self.saved.get(g) != 1:
+                res[g].append(("#ppw", "not saved" if g in self.saved else "no reply"))
+        return res
+
+    async def get(self, groups, ids, tries=3):
+        """
+        Read parameters from each group, one group at a time.
+
+        Args:
+            ids (list[int]): IDs to read; "get all" is used when these are every ID
+
+        Returns:
+            dict: group -> {ID: value}
+        """
+        everything = len(ids) == len(table())
+        for g in groups:
+            self.n.pop(g, None)
+            self.vals[g] = {}
+            await self.listen([g])
+            if everything:
+                await self.send([g], "#ppg", 0)
+                await self.collect(2.0 + 0.015 * len(ids), lambda: g in self.n)
+            for _ in range(tries):
+                m = [i for i in ids if i not in self.vals[g]]
+                if not m:
+                    break
+                for i in m:
+                    await self.send([g], f"#ppg{i}", 0)
+                await self.collect(0.6 + 0.05 * len(m), lambda: all(i in self.vals[g] for i in ids))
+        return {g: self.vals.get(g, {}) for g in groups}
+
+
+async def with_bridge(args, fn):
+    """Run fn(client) against a running bridge, or an in-process one with --loopback."""
+    addr = args.unix or args.tcp
+    link = srv = None
+    tasks = []
+    if args.loopback:
+        link = bridge.make_link(args)
+        _, srv, tasks = await bridge.serve(link, addr, args)
+    cl = Client(addr)
+    await cl.open()
+    try:
+        return await fn(cl, link)
+    finally:
+        cl.close()
+        for t in tasks:
+            t.cancel()
+        if srv:
+            srv.close()
+        if link:
+            link.close()
+
+
+def show(tbl, vals):
+    names = {v[0]: n for n, v in tbl.items()}
+    for g, vs in vals.items():
+        print(f"  - group {g}: {len(vs)} of {len(tbl)} parameters")
+        for i in sorted(vs):
+            v = vs[i]
+            print(f"    {i:4} {names.get(i, '?'):14} {round(v, 4) if isinstance(v, float) else v}")
+
+
+async def selftest(cl, link):
+    """Push, save and read back a parameter set on loopback robots and check them."""
+    tbl = table()
+    groups = [bridge.GROUP0 + i for i in range(len(link.bots))]
+    print(f"=== Tuning self-test: {len(groups)} loopback robots on groups {groups[0]}-{groups[-1]} ===")
+    await cl.listen(groups)
+    await cl.collect(1.0)  # let the robots boot
+    sets = parse_set("fw_sp=4.5,d_sp=1.8,ep_thr=9,g_thr=2500,s_tr.4=-7.5,st_spu.2.0=1.5,st_tg.2.0=70", tbl)
+    t0 = time.monotonic()
+    res = await cl.push(groups, sets, save=True)
+    dt = time.monotonic() - t0
+    print(f"  - Pushed {len(sets)} parameters to {len(groups)} robots and saved them in {dt:.1f}s: "
+          f"{ {g: p or 'ok' for g, p in res.items()} }")
+    await cl.listen([groups[0]])
+    await cl.send([groups[0]], "#pps256", 70.5)  # a float for an integer pose angle
+    await cl.send([groups[0]], "#pps900", 1)     # no such parameter
+    await cl.collect(1.0, lambda: len(cl.errs.get(groups[0], {})) >= 2)
+    refused = cl.errs.get(groups[0], {})
+    print(f"  - Refused by the robot: {refused}")
+    t0 = time.monotonic()
+    got = await cl.get([groups[-1]], sorted(v[0] for v in tbl.values()))
+    dt = time.monotonic() - t0
+    vs = got[groups[-1]]
+    print(f"  - Read {len(vs)} of {len(tbl)} parameters from group {groups[-1]} in {dt:.1f}s")
+    ok = all(not p for p in res.values()) and refused.get(256) == TN_TYPE and 900 in refused
+    ok = ok and len(vs) == len(tbl) and all(vs.get(i) == v for _, i, v in sets)
+    for b, r in link.bots:
+        st = r.cfg._read(os.path.join(b.fs_dir, "pu%d.cfg" % r.cfg.slot))
+        kept = dict(st[-1]) if st else {}
+        if st:
+            kept.update(zip(TN_CFG, st[5:15]))  # trims and gains in the record's own fields
+        good = r.fw_sp == 4.5 and r.d_sp0 == 1.8 and r.step.__func__.__globals__["pr"].st_tg[2][0] == 70
+        good = good and all(abs(kept.get(i, 1e9) - v) < 1e-4 for _, i, v in sets)
+        print(f"  - {b.name}: parameters {'applied' if good else 'NOT applied'}, "
+              f"{len(kept)} stored in {'pu%d.cfg' % r.cfg.slot}")
+        ok = ok and good
+    print("Self-test", "passed" if ok else "FAILED")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune robot parameters over the radio bridge")
+    parser.add_argument("cmd", choices=["list", "push", "get", "selftest"])
+    parser.add_argument("--groups", default=str(bridge.GROUP0), help="Comma-separated groups, e.g. 166,167")
+    parser.add_argument("--set", help="Parameters to push, name=value,...")
+    parser.add_argument("--save", action="store_true", help="Store the pushed set in each robot's config store")
+    parser.add_argument("--names", help="Parameters to get (default: all)")
+    parser.add_argument("--tcp", default=bridge.ADDR, help="Bridge API address host:port")
+    parser.add_argument("--unix", help="Bridge API Unix socket path (instead of TCP)")
+    parser.add_argument("--loopback", type=int, default=0, help="Run a bridge with N emulated robots in process")
+    parser.add_argument("--loss", type=float, default=0.0, help="Packet loss of the loopback medium")
+    parser.add_argument("--dwell", type=int, default=100, help="Time on each listen group (ms)")
+    parser.add_argument("--rate", type=int, default=100, help="Packets per second of the in-process bridge")
+    parser.add_argument("--per-group", type=float, default=4, help="Packets per second to one group")
+    parser.add_argument("--window", type=int, default=4, help="Unconfirmed packets in flight to the relay")
+    args = parser.parse_args()
+    tbl = table()
+    groups = [int(g) for g in args.groups.split(",")]
+
+    if args.cmd == "list":
+        print(f"=== {len(tbl)} tunable parameters ===")
+        for n, (i, ty, lo, hi) in sorted(tbl.items(), key=lambda x: x[1][0]):
+            print(f"  {i:4} {n:14} {ty.__name__:6} {lo}..{hi}")
+    elif args.cmd == "push":
+        if not args.set:
+            parser.error("push needs --set name=value,...")
+        try:
+            sets = parse_set(args.set, tbl)
+        except ValueError as e:
+            parser.error(str(e))
+        res = asyncio.run(with_bridge(args, lambda cl, _: cl.push(groups, sets, args.save)))
+        print(f"=== Pushed {len(sets)} parameters to {len(groups)} robots ===")
+        for g, p in res.items():
+            print(f"  - group {g}: {', '.join(f'{n} {e}' for n, e in p) if p else 'ok'}")
+        sys.exit(1 if any(res.values()) else 0)
+    elif args.cmd == "get":
+        names = args.names.split(",") if args.names else list(tbl)
+        bad = [n for n in names if n not in tbl]
+        if bad:
+            parser.error(f"unknown parameters: {', '.join(bad)}")
+        vals = asyncio.run(with_bridge(args, lambda cl, _: cl.get(groups, sorted(tbl[n][0] for n in names))))
+        print("=== Parameters ===")
+        show(tbl, vals)
+    else:
+        args.loopback = args.loopback or 4
+        sys.exit(0 if asyncio.run(with_bridge(args, selftest)) else 1)
+
+
+if __name__ == "__main__":
+    main()